@@ -6,7 +6,12 @@ from app.config import settings
 
 
 def main() -> None:
-    uvicorn.run("app.main:app", host="0.0.0.0", port=settings.port, reload=settings.env == "development")
+    reload = settings.env == "development"
+    workers = 1 if reload else max(1, settings.workers)
+    if workers > 1 and settings.session_backend == "memory":
+        # 每个 worker 各有一份内存 session，同一用户的事件会落到不同进程。
+        raise SystemExit("WEB_CONCURRENCY > 1 requires SESSION_BACKEND=sqlite or redis")
+    uvicorn.run("app.main:app", host="0.0.0.0", port=settings.port, reload=reload, workers=workers)
 
 
 if __name__ == "__main__":
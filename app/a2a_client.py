@@ -0,0 +1,230 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import time
+import uuid
+from typing import AsyncIterator
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# 远程 agent（A2A：JSON-RPC 2.0 over HTTP，message/stream 用 SSE 回传）。
+# agent 在回复的 DataPart 里放 A2UI 消息（A2UI 的 A2A extension：mimeType application/json+a2ui），
+# 这里把它们按收到的顺序拆出来，交给 main.reply_streamed 边收边 apply。
+
+A2UI_MIME_TYPE = "application/json+a2ui"
+A2UI_KEYS = ("surfaceUpdate", "dataModelUpdate", "beginRendering", "deleteSurface")
+
+
+class A2AError(RuntimeError):
+    def __init__(self, message: str, code: int | None = None) -> None:
+        super().__init__(message)
+        self.code = code
+
+
+class A2AClient:
+    # 所有 turn 共用一个连接池，不用每个 turn 重新建连接。
+    # 同一个 context（LINE user/group/room）同时只有一个请求在途：后来的 turn 等前一个的流读完才发出去
+    # （这是按对话串行，不是 HTTP pipelining）；并发只发生在不同 context 之间，各占池里的一个连接。
+    # 每次调用有一个截止时间（A2A_TIMEOUT，和 reply token 的有效期取较早的）：
+    # 到点就停止读取、关掉这次 HTTP 流，流当作结束；agent 那边的 task 用 tasks/cancel 取消。
+    def __init__(
+        self,
+        *,
+        url: str,
+        timeout: float = 20.0,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30.0,
+        headers: dict[str, str] | None = None,
+        transport: httpx.AsyncBaseTransport | None = None,
+    ) -> None:
+        self.url = url
+        self.timeout = timeout
+        limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self._http = httpx.AsyncClient(timeout=timeout, limits=limits, headers=headers, transport=transport)
+        # context id -> [串行用的锁, 在途 + 排队的调用数]，没人用时删掉
+        self._context_turns: dict[str, list] = {}
+        self._background: set[asyncio.Task] = set()
+        self.counters = {"calls": 0, "timeouts": 0, "cancelled": 0, "errors": 0}
+
+    async def aclose(self) -> None:
+        if self._background:
+            await asyncio.gather(*self._background, return_exceptions=True)
+        await self._http.aclose()
+
+    def stats(self) -> dict:
+        # queued_turns：在等同一个 context 前一个请求结束、还没发出去的调用数
+        queued = sum(entry[1] - 1 for entry in self._context_turns.values())
+        return {**self.counters, "active_contexts": len(self._context_turns), "queued_turns": queued}
+
+    async def stream(self, *, context_id: str, text: str, deadline: float | None = None) -> AsyncIterator[dict]:
+        # 逐条产出 agent 回复里的 A2UI 消息。deadline 是绝对时间（time.time()），None 时只用 timeout。
+        end = time.time() + self.timeout
+        if deadline is not None:
+            end = min(end, deadline)
+        self.counters["calls"] += 1
+        entry = self._context_turns.setdefault(context_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        task_id = None
+        done = False
+        try:
+            await asyncio.wait_for(entry[0].acquire(), _remaining(end))
+            try:
+                request = self._http.build_request(
+                    "POST",
+                    self.url,
+                    content=encode_rpc("message/stream", {"message": user_message(context_id, text)}),
+                    headers={"Content-Type": "application/json", "Accept": "text/event-stream"},
+                )
+                response = await asyncio.wait_for(self._http.send(request, stream=True), _remaining(end))
+                try:
+                    if response.status_code != 200:
+                        await response.aread()
+                        raise A2AError(f"A2A agent returned {response.status_code}: {response.text[:200]}")
+                    events = iter_envelopes(response)
+                    while not done:
+                        try:
+                            envelope = await asyncio.wait_for(events.__anext__(), _remaining(end))
+                        except StopAsyncIteration:
+                            done = True
+                            break
+                        result = rpc_result(envelope)
+                        task_id = result_task_id(result) or task_id
+                        done = is_final(result)
+                        for msg in a2ui_messages_from_result(result):
+                            yield msg
+                finally:
+                    await response.aclose()
+            finally:
+                entry[0].release()
+        except asyncio.TimeoutError:
+            self.counters["timeouts"] += 1
+            logger.warning("A2A call for %s timed out; ending the stream", context_id)
+        except (httpx.HTTPError, ValueError) as e:
+            # ValueError：agent 回的不是合法 JSON
+            self.counters["errors"] += 1
+            raise A2AError(f"A2A request failed: {e!r}") from e
+        except A2AError:
+            self.counters["errors"] += 1
+            raise
+        except (asyncio.CancelledError, GeneratorExit):
+            self.counters["cancelled"] += 1
+            raise
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                self._context_turns.pop(context_id, None)
+            if not done and task_id is not None:
+                self._cancel_later(task_id)
+
+    async def cancel_task(self, task_id: str) -> None:
+        try:
+            response = await self._http.post(
+                self.url,
+                content=encode_rpc("tasks/cancel", {"id": task_id}),
+                headers={"Content-Type": "application/json"},
+                timeout=5.0,
+            )
+            rpc_result(response.json())
+        except Exception:
+            logger.warning("A2A tasks/cancel for %s failed", task_id, exc_info=True)
+
+    def _cancel_later(self, task_id: str) -> None:
+        # 在 generator 的 finally 里（可能正在被取消）不能 await，放到后台去发
+        try:
+            task = asyncio.get_running_loop().create_task(self.cancel_task(task_id))
+        except RuntimeError:
+            return
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+
+def _remaining(end: float) -> float:
+    return max(0.0, end - time.time())
+
+
+def encode_rpc(method: str, params: dict) -> bytes:
+    payload = {"jsonrpc": "2.0", "id": uuid.uuid4().hex, "method": method, "params": params}
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def user_message(context_id: str, text: str) -> dict:
+    return {
+        "kind": "message",
+        "role": "user",
+        "messageId": uuid.uuid4().hex,
+        "contextId": context_id,
+        "parts": [{"kind": "text", "text": text}],
+    }
+
+
+async def iter_envelopes(response: httpx.Response) -> AsyncIterator[dict]:
+    # 正常是 SSE；agent 直接出错时（方法不支持等）可能只回一个普通 JSON-RPC 响应
+    if "text/event-stream" in response.headers.get("content-type", ""):
+        async for envelope in iter_sse(response):
+            yield envelope
+    else:
+        yield json.loads(await response.aread())
+
+
+async def iter_sse(response: httpx.Response) -> AsyncIterator[dict]:
+    # 一个 SSE 事件的多行 data: 用换行拼起来，空行结束一个事件
+    data: list[str] = []
+    async for line in response.aiter_lines():
+        if not line:
+            if data:
+                yield json.loads("\n".join(data))
+                data = []
+        elif line.startswith("data:"):
+            data.append(line[5:].lstrip())
+    if data:
+        yield json.loads("\n".join(data))
+
+
+def rpc_result(envelope: dict) -> dict:
+    error = envelope.get("error")
+    if error is not None:
+        raise A2AError(f"A2A agent error: {error.get('message')}", error.get("code"))
+    result = envelope.get("result")
+    return result if isinstance(result, dict) else {}
+
+
+def result_task_id(result: dict) -> str | None:
+    if result.get("kind") == "task":
+        return result.get("id")
+    return result.get("taskId")
+
+
+def is_final(result: dict) -> bool:
+    # 直接回 message（没有 task）或者 status-update 带 final 时结束
+    return result.get("kind") == "message" or bool(result.get("final"))
+
+
+def a2ui_messages_from_result(result: dict) -> list[dict]:
+    kind = result.get("kind")
+    if kind == "message":
+        parts = result.get("parts")
+    elif kind == "artifact-update":
+        parts = (result.get("artifact") or {}).get("parts")
+    elif kind in ("status-update", "task"):
+        parts = ((result.get("status") or {}).get("message") or {}).get("parts")
+    else:
+        parts = None
+
+    out = []
+    for part in parts or ():
+        if part.get("kind") != "data":
+            continue
+        data = part.get("data")
+        mime = (part.get("metadata") or {}).get("mimeType")
+        if isinstance(data, dict) and (mime == A2UI_MIME_TYPE or any(k in data for k in A2UI_KEYS)):
+            out.append(data)
+    return out
@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import uuid
+from typing import Awaitable, Callable
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from app.a2a_client import A2UI_MIME_TYPE
+from app.a2ui_stream import A2UISource, iter_a2ui_messages
+from app.agent import decide_a2ui_response
+
+# 本地 stand-in A2A agent：把 app/agent.py 的 demo agent 包成 A2A JSON-RPC（message/stream + tasks/cancel），
+# 用来测试 / 压测 AGENT_BACKEND=a2a，不用接真的远程 agent：
+#   uvicorn app.a2a_server:app --port 3001
+# 每条 A2UI 消息单独放在一个 status-update 事件里（DataPart），delay 秒数用来模拟慢的 agent。
+
+Decide = Callable[..., Awaitable[A2UISource]]
+
+
+def create_app(*, decide: Decide = decide_a2ui_response, delay: float = 0.0) -> FastAPI:
+    app = FastAPI()
+    app.state.cancelled = set()
+
+    @app.post("/")
+    async def rpc(request: Request):
+        req = await request.json()
+        rpc_id = req.get("id")
+        params = req.get("params") or {}
+        method = req.get("method")
+
+        if method == "message/stream":
+            message = params.get("message") or {}
+            text = "".join(p.get("text", "") for p in message.get("parts") or () if p.get("kind") == "text")
+            return StreamingResponse(
+                _stream(app, rpc_id, message.get("contextId"), text, decide, delay),
+                media_type="text/event-stream",
+            )
+        if method == "tasks/cancel":
+            app.state.cancelled.add(params.get("id"))
+            return {"jsonrpc": "2.0", "id": rpc_id, "result": {"kind": "task", "id": params.get("id"), "status": {"state": "canceled"}}}
+        return JSONResponse({"jsonrpc": "2.0", "id": rpc_id, "error": {"code": -32601, "message": "Method not found"}})
+
+    return app
+
+
+async def _stream(app: FastAPI, rpc_id, context_id, text: str, decide: Decide, delay: float):
+    task_id = uuid.uuid4().hex
+
+    def event(result: dict) -> bytes:
+        envelope = {"jsonrpc": "2.0", "id": rpc_id, "result": result}
+        return b"data: " + json.dumps(envelope, ensure_ascii=False).encode("utf-8") + b"\n\n"
+
+    def status(state: str, *, parts: list | None = None, final: bool = False) -> dict:
+        out = {"kind": "status-update", "taskId": task_id, "contextId": context_id, "status": {"state": state}, "final": final}
+        if parts is not None:
+            out["status"]["message"] = {"kind": "message", "role": "agent", "messageId": uuid.uuid4().hex, "parts": parts}
+        return out
+
+    yield event({"kind": "task", "id": task_id, "contextId": context_id, "status": {"state": "submitted"}})
+    async for msg in iter_a2ui_messages(await decide(user_text=text)):
+        if delay:
+            await asyncio.sleep(delay)
+        if task_id in app.state.cancelled:
+            return
+        yield event(status("working", parts=[{"kind": "data", "data": msg, "metadata": {"mimeType": A2UI_MIME_TYPE}}]))
+    yield event(status("completed", final=True))
+
+
+app = create_app()
@@ -1,18 +1,392 @@
 from __future__ import annotations
 
+import copy
+import functools
+import json
+import sys
 from dataclasses import dataclass, field
 
+from app.card_templates import FrozenDict, FrozenList, freeze
+from app.record_table import RecordTable, json_default
+
+
+# trie 节点里存放 component ids 的键：不是字符串，不会和路径 segment（可以是任意字符串，包括 ""）冲突，
+# 子节点可以直接用 segment 做键
+_IDS = None
+
+
+def _add_ids(out: set[str], ids: str | set[str] | None) -> None:
+    if isinstance(ids, str):
+        out.add(ids)
+    elif ids:
+        out |= ids
+
+
+class BindingIndex:
+    # 每个 component 的绑定：prop key -> 预先编译好的 JsonPointer，渲染时直接按 segment 取值；
+    # 反向：一棵按 segment 组织的 trie，节点上挂着绑定到该路径的 component ids
+    # （大多数路径只有一个 component 绑定，只有一个时直接存 id，多个时才用 set），
+    # 某个路径的数据变了，只需要沿 trie 走一遍就能找到受影响的 component（O(受影响数量)）。
+    def __init__(self) -> None:
+        self.pointers: dict[str, dict[str, JsonPointer]] = {}
+        self._root: dict = {}  # segment -> child node；_IDS 键存放 component ids
+
+    def add(self, component_id: str, pointers: dict[str, JsonPointer]) -> None:
+        if not pointers:
+            return
+        self.pointers[component_id] = pointers
+        for ptr in pointers.values():
+            node = self._root
+            for part in ptr.parts:
+                node = node.setdefault(part, {})
+            ids = node.get(_IDS)
+            if ids is None or ids == component_id:
+                node[_IDS] = component_id
+            elif isinstance(ids, str):
+                node[_IDS] = {ids, component_id}
+            else:
+                ids.add(component_id)
+
+    def remove(self, component_id: str) -> None:
+        pointers = self.pointers.pop(component_id, None)
+        if not pointers:
+            return
+        for ptr in pointers.values():
+            parts = ptr.parts
+            trail = [self._root]
+            for part in parts:
+                node = trail[-1].get(part)
+                if node is None:
+                    break
+                trail.append(node)
+            else:
+                ids = trail[-1].get(_IDS)
+                if ids == component_id:
+                    del trail[-1][_IDS]
+                elif isinstance(ids, set):
+                    ids.discard(component_id)
+                    if len(ids) == 1:
+                        trail[-1][_IDS] = next(iter(ids))
+                # 删掉空节点
+                for i in range(len(parts), 0, -1):
+                    if trail[i]:
+                        break
+                    del trail[i - 1][parts[i - 1]]
+
+    def pointer(self, component_id: str, prop: str) -> JsonPointer | None:
+        pointers = self.pointers.get(component_id)
+        return pointers.get(prop) if pointers else None
+
+    def affected(self, changed: tuple[str, ...]) -> set[str]:
+        # 改了上层对象（祖先路径上的绑定）或下层字段（子树里的绑定）都会影响绑定值
+        out: set[str] = set()
+        node = self._root
+        _add_ids(out, node.get(_IDS))
+        for part in changed:
+            node = node.get(part)
+            if node is None:
+                return out
+            _add_ids(out, node.get(_IDS))
+        stack = [v for k, v in node.items() if k is not _IDS]
+        while stack:
+            n = stack.pop()
+            for k, v in n.items():
+                if k is _IDS:
+                    _add_ids(out, v)
+                else:
+                    stack.append(v)
+        return out
+
+    def __len__(self) -> int:
+        return len(self.pointers)
+
+
+class ComponentNode:
+    # ingest 时把 {"<Type>": {props}} 转成的只读结构，Surface.components 里存的就是它：
+    # type 是 intern 过的字符串；children.explicitList / children.template / child 预先解析出来，
+    # 不再留在 props 里；绑定路径预先编译（pointers，同时登记到 BindingIndex）。
+    # 转换器直接读字段，不用每次渲染再拆包。to_json() 还原成 A2UI 原来的写法（session 序列化 / digest 用）。
+    __slots__ = ("id", "type", "props", "children", "child", "template", "pointers", "_content_digest")
+
+    def __init__(
+        self,
+        id: str,
+        type: str,
+        props: dict,
+        children: tuple[str, ...] | None = None,
+        child: str | None = None,
+        template: tuple[str, str | None] | None = None,
+        pointers: dict[str, JsonPointer] | None = None,
+    ) -> None:
+        self.id = id
+        self.type = type
+        self.props = props
+        self.children = children
+        self.child = child
+        self.template = template
+        self.pointers = pointers or _NO_POINTERS
+        self._content_digest = None
+
+    def json_bytes(self) -> int:
+        # to_json() 编码后的长度（session 内存估算用）；不缓存在 node 上，每个 node 省一个槽位，
+        # 只在 Surface 已经算过总大小、又替换了 component 时才需要再算
+        return json_bytes(self.to_json())
+
+    def child_ids(self) -> tuple[str, ...]:
+        # 会被渲染成子节点的 component ids（模板 component 也算）
+        out = self.children or ()
+        if self.child is not None:
+            out = (self.child,) + out
+        if self.template is not None:
+            out = out + (self.template[0],)
+        return out
+
+    def to_json(self) -> dict:
+        props = dict(self.props)
+        if self.child is not None:
+            props["child"] = self.child
+        if "children" in props:
+            return {self.type: props}  # 非标准写法，原样保留在 props 里
+        if self.template is not None:
+            cid, binding = self.template
+            template = {"componentId": cid} if binding is None else {"componentId": cid, "dataBinding": binding}
+            props["children"] = {"template": template}
+        elif self.children is not None:
+            props["children"] = {"explicitList": list(self.children)}
+        return {self.type: props}
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, ComponentNode):
+            return NotImplemented
+        return (
+            self.id == other.id
+            and self.type == other.type
+            and self.props == other.props
+            and self.children == other.children
+            and self.child == other.child
+            and self.template == other.template
+        )
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def __repr__(self) -> str:
+        return f"ComponentNode(id={self.id!r}, type={self.type!r})"
+
+
+_NO_PROPS: dict = FrozenDict()
+_NO_POINTERS: dict = FrozenDict()
+
+
+def component_node(component_id: str, component) -> ComponentNode:
+    # 只读模板（agent 的 static_card）里的 component 所有 session 共享，建好的 node 也挂在模板上共享
+    if isinstance(component, ComponentNode):
+        return component
+    if isinstance(component, FrozenDict):
+        node = component.__dict__.get("_node")
+        if node is None or node.id != component_id:
+            node = component.__dict__["_node"] = build_component_node(component_id, component)
+        return node
+    return build_component_node(component_id, component)
+
+
+def build_component_node(component_id: str, component) -> ComponentNode:
+    # 格式不对的 component 不报错，type 记成 Unknown，渲染成 Unsupported 占位
+    ctype = next(iter(component), None) if isinstance(component, dict) else None
+    raw = component.get(ctype) if ctype is not None else None
+    if not isinstance(ctype, str) or not isinstance(raw, dict):
+        return ComponentNode(component_id, sys.intern(ctype) if isinstance(ctype, str) else "Unknown", _NO_PROPS)
+
+    pointers: dict[str, JsonPointer] = {}
+    props = {}
+    children = child = template = None
+    for k, v in raw.items():
+        if k == "child" and isinstance(v, str):
+            child = v
+            continue
+        if k == "children" and isinstance(v, dict):
+            # template 优先；写法不标准（多余的 key 等）时原样留一份在 props 里，to_json 照原样输出
+            tpl = v.get("template")
+            explicit = v.get("explicitList")
+            if isinstance(tpl, dict) and isinstance(tpl.get("componentId"), str):
+                binding = tpl.get("dataBinding")
+                template = (tpl["componentId"], binding if isinstance(binding, str) else None)
+                # 列表路径算作绑定，列表变了整个容器重新展开
+                ptr = compile_json_pointer(binding) if isinstance(binding, str) else None
+                if ptr is not None:
+                    pointers["children/template/dataBinding"] = ptr
+                if len(v) == 1 and tpl.keys() <= {"componentId", "dataBinding"}:
+                    continue
+            elif "template" not in v and isinstance(explicit, list):
+                children = tuple(str(x) for x in explicit)
+                if len(v) == 1:
+                    continue
+        props[k] = v
+        _collect_pointers(v, k, pointers)
+    return ComponentNode(
+        component_id,
+        sys.intern(ctype),
+        props or _NO_PROPS,
+        children=children,
+        child=child,
+        template=template,
+        pointers=pointers,
+    )
+
 
 @dataclass
 class Surface:
-    components: dict[str, dict] = field(default_factory=dict)
+    components: dict[str, ComponentNode] = field(default_factory=dict)
     data_model: dict = field(default_factory=dict)
     root: str | None = None
 
+    # 增量渲染：记录自上次渲染以来改动过的 component / dataModel 路径，
+    # 渲染前只让受影响的 component 及其祖先的 Flex 缓存失效。
+    dirty_components: set[str] = field(default_factory=set, repr=False, compare=False)
+    dirty_paths: set[tuple[str, ...]] = field(default_factory=set, repr=False, compare=False)
+    # child id -> parent id（绝大多数 component 只有一个父节点，直接存 id；多个父节点时存 tuple）
+    parents: dict[str, str | tuple[str, ...]] = field(default_factory=dict, repr=False, compare=False)
+    bindings: BindingIndex = field(default_factory=BindingIndex, repr=False, compare=False)
+    # (component id, 渲染方式) -> 已转换好的 Flex 子树（只读，供下次渲染复用）
+    flex_cache: dict[tuple[str, str], dict] = field(default_factory=dict, repr=False, compare=False)
+    # 和 flex_cache 同 key：缓存子树估算的 (JSON 字节数, 节点数)，复用子树时用来计入预算
+    flex_stats: dict[tuple[str, str], tuple[int, int]] = field(default_factory=dict, repr=False, compare=False)
+    # session 内存估算（SessionStore 按它限制总大小）：components / dataModel 编码后的长度。
+    # 第一次用到时完整算一次，之后 ingest 时只按改动的部分增减；None 表示还没算过。
+    component_bytes: int | None = field(default=None, init=False, repr=False, compare=False)
+    data_bytes: int | None = field(default=None, init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        # 也接受 A2UI 原来的 {"<Type>": {props}} 写法（session 反序列化等）
+        self.components = {cid: component_node(cid, c) for cid, c in self.components.items()}
+        for node in self.components.values():
+            self._index(node)
+
+    def set_component(self, component_id: str, component: dict | ComponentNode) -> None:
+        node = component_node(component_id, component)
+        old = self.components.get(component_id)
+        if old is node:
+            return  # 同一个只读模板对象，内容不变
+        if old is not None:
+            self._unindex(old)
+        self.components[component_id] = node
+        self._index(node)
+        if old is not None:
+            self.dirty_components.add(component_id)
+        else:
+            # 新 component 自己不会有缓存（没有的 component 渲染成占位或跳过，不进缓存），
+            # 只需要让已经登记的父节点失效；之后才到的父节点本身就是新改动的。
+            # 首次 ingest 整棵树时 dirty 集合只有容器那么大，不是每个 component 一项
+            ps = self.parents.get(component_id)
+            if isinstance(ps, str):
+                self.dirty_components.add(ps)
+            elif ps:
+                self.dirty_components.update(ps)
+        if self.component_bytes is not None:
+            self.component_bytes += _component_entry_bytes(component_id, node)
+            if old is not None:
+                self.component_bytes -= _component_entry_bytes(component_id, old)
+
+    def update_data_model(self, path: str | None, contents: list[dict]) -> None:
+        base = pointer_segments(path)
+        keys = [entry["key"] for entry in contents]
+        tracked = self.data_bytes is not None and bool(path)
+        if tracked:
+            parts, touched = _touched_entries(self.data_model, base, keys)
+            before = _entries_bytes(self.data_model, parts, touched)
+        self.data_model = apply_data_model_update(self.data_model, path, contents)
+        if tracked:
+            self.data_bytes += _entries_bytes(self.data_model, parts, touched) - before
+        else:
+            self.data_bytes = None  # 整个替换：下次用到时重算（只有新内容那么大）
+        if not base:
+            self.mark_data_dirty(())
+        for key in keys:
+            self.mark_data_dirty(base + (key,))
+
+    def approx_bytes(self) -> int:
+        if self.component_bytes is None:
+            self.component_bytes = sum(_component_entry_bytes(cid, n) for cid, n in self.components.items())
+        if self.data_bytes is None:
+            self.data_bytes = json_bytes(self.data_model)
+        return self.component_bytes + self.data_bytes
+
+    def snapshot_data_model(self) -> dict:
+        # 第一次调用时把 dataModel 冻结成只读的持久化结构（O(n)，只做一次），
+        # 之后的 dataModelUpdate 都按路径复制生成新版本、共享没改动的子树，
+        # 所以快照就是当前版本的引用（O(1)），拿着快照的渲染线程不会读到改了一半的数据。
+        if not isinstance(self.data_model, FrozenDict):
+            self.data_model = freeze(self.data_model)
+        return self.data_model
+
+    def render_view(self) -> Surface:
+        # 交给渲染线程的一致版本（在事件循环里调用）：先做完缓存失效，dataModel 用快照，
+        # components / 绑定表复制一层（只复制引用）。之后的 ingest 改的是原 surface，
+        # 渲染线程读不到改了一半的数据；Flex 缓存仍和原 surface 共用。
+        self.flush_dirty()
+        view = copy.copy(self)
+        view.components = dict(self.components)
+        view.data_model = self.snapshot_data_model()
+        view.bindings = copy.copy(self.bindings)
+        view.bindings.pointers = dict(self.bindings.pointers)
+        view.dirty_components = set()
+        view.dirty_paths = set()
+        return view
+
+    def mark_data_dirty(self, path: tuple[str, ...]) -> None:
+        self.dirty_paths.add(path)
+
+    def _index(self, node: ComponentNode) -> None:
+        parents = self.parents
+        for child_id in node.child_ids():
+            ps = parents.get(child_id)
+            if ps is None:
+                parents[child_id] = node.id
+            elif isinstance(ps, str):
+                if ps != node.id:
+                    parents[child_id] = (ps, node.id)
+            elif node.id not in ps:
+                parents[child_id] = ps + (node.id,)
+        self.bindings.add(node.id, node.pointers)
+
+    def _unindex(self, node: ComponentNode) -> None:
+        parents = self.parents
+        for child_id in node.child_ids():
+            ps = parents.get(child_id)
+            if ps == node.id:
+                del parents[child_id]
+            elif isinstance(ps, tuple) and node.id in ps:
+                ps = tuple(p for p in ps if p != node.id)
+                parents[child_id] = ps[0] if len(ps) == 1 else ps
+        self.bindings.remove(node.id)
+
+    def flush_dirty(self) -> None:
+        if not (self.dirty_components or self.dirty_paths):
+            return
+        affected = set(self.dirty_components)
+        for changed in self.dirty_paths:
+            affected |= self.bindings.affected(changed)
+        stack = list(affected)
+        while stack:
+            ps = self.parents.get(stack.pop(), ())
+            for parent in (ps,) if isinstance(ps, str) else ps:
+                if parent not in affected:
+                    affected.add(parent)
+                    stack.append(parent)
+        cache, stats = self.flex_cache, self.flex_stats
+        for cid in affected:
+            for key in ((cid, "box"), (cid, "element")):
+                cache.pop(key, None)
+                stats.pop(key, None)
+        self.dirty_components.clear()
+        self.dirty_paths.clear()
+
 
 @dataclass
 class A2UIState:
     surfaces: dict[str, Surface] = field(default_factory=dict)
+    # 从共享的 session backend（sqlite / redis）读出来时的版本，0 表示还没存过；
+    # 保存时按它做 compare-and-set（见 app/session_backend.py）
+    version: int = field(default=0, repr=False, compare=False)
 
 
 def ensure_surface(state: A2UIState, surface_id: str) -> Surface:
@@ -21,41 +395,211 @@ def ensure_surface(state: A2UIState, surface_id: str) -> Surface:
     return state.surfaces[surface_id]
 
 
-def apply_a2ui_messages(state: A2UIState, messages: list[dict]) -> None:
+def apply_a2ui_messages(state: A2UIState, messages: list[dict]) -> list[str]:
+    # 返回这一批里收到 beginRendering 的 surfaceId（按第一次出现的顺序，已删除的不算）
+    rendered: dict[str, None] = {}
     for msg in messages:
         if "surfaceUpdate" in msg:
             su = msg["surfaceUpdate"]
             surface = ensure_surface(state, su["surfaceId"])
             for c in su.get("components", []) or []:
-                surface.components[c["id"]] = c["component"]
+                surface.set_component(c["id"], c["component"])
 
         elif "dataModelUpdate" in msg:
             dmu = msg["dataModelUpdate"]
             surface = ensure_surface(state, dmu["surfaceId"])
-            apply_data_model_update(surface.data_model, dmu.get("path"), dmu.get("contents") or [])
+            surface.update_data_model(dmu.get("path"), dmu.get("contents") or [])
 
         elif "beginRendering" in msg:
             br = msg["beginRendering"]
             surface = ensure_surface(state, br["surfaceId"])
             surface.root = br["root"]
+            rendered[br["surfaceId"]] = None
 
         elif "deleteSurface" in msg:
             ds = msg["deleteSurface"]
             state.surfaces.pop(ds["surfaceId"], None)
+            rendered.pop(ds["surfaceId"], None)
+    return list(rendered)
+
 
+def apply_data_model_update(data_model: dict, path: str | None, contents: list[dict]) -> dict:
+    # 返回更新后的 dataModel：普通 dict 原地修改并返回自身；
+    # 只读的持久化版本（FrozenDict）不修改，返回共享子树的新版本。
+    if isinstance(data_model, FrozenDict):
+        if not path:
+            return freeze(build_data_model_from_contents(contents))
+        updates = {entry["key"]: freeze(decode_value(entry)) for entry in contents}
+        new = assoc_in(data_model, pointer_segments(path), updates)
+        return data_model if new is None else new
 
-def apply_data_model_update(data_model: dict, path: str | None, contents: list[dict]) -> None:
     if not path:
         data_model.clear()
         data_model.update(build_data_model_from_contents(contents))
-        return
+        return data_model
 
-    target = ensure_object_at_pointer(data_model, path)
-    if not isinstance(target, dict):
-        return
+    updates = {entry["key"]: decode_value(entry) for entry in contents}
+    update_in(data_model, pointer_segments(path), updates)
+    return data_model
 
-    for entry in contents:
-        target[entry["key"]] = decode_value(entry)
+
+# dataModelUpdate 的 path 可以穿过列表（/items/2）：list 和 RecordTable 按下标进入，
+# RecordTable 取出那一行、改完再写回（新表）。路径上缺失或者不是容器的位置补成新 object。
+# path 指向列表本身时 contents 的 key 当作下标，替换对应的元素。
+# 下标不是数字或者越界时整个更新不生效（返回 None），不会把列表换成 object、丢掉其余的元素。
+
+
+def update_in(node, parts: tuple[str, ...], updates: dict):
+    # 普通（可变）dataModel：dict / list 原地修改，RecordTable 换成新表；返回更新后的 node
+    if not parts:
+        if isinstance(node, (list, RecordTable)):
+            return _set_items(node, updates, frozen=False)
+        target = node if isinstance(node, dict) else {}
+        target.update(updates)
+        return target
+    head, rest = parts[0], parts[1:]
+    if isinstance(node, dict):
+        new = update_in(node.get(head), rest, updates)
+        if new is None:
+            return None
+        node[head] = new
+        return node
+    if isinstance(node, (list, RecordTable)):
+        i = _list_index(node, head)
+        if i is None:
+            return None
+        if isinstance(node, RecordTable):
+            new = update_in(node.row(i), rest, updates)
+            return None if new is None else node.with_row(i, new)
+        new = update_in(node[i], rest, updates)
+        if new is None:
+            return None
+        node[i] = new
+        return node
+    return update_in({}, parts, updates)
+
+
+def assoc_in(node, parts: tuple[str, ...], updates: dict):
+    # 只读的持久化 dataModel：path copying，只复制从根到目标对象路径上的 dict / list，其余子树原样共享
+    if not parts:
+        if isinstance(node, (list, RecordTable)):
+            return _set_items(node, updates, frozen=True)
+        new = dict(node) if isinstance(node, dict) else {}
+        new.update(updates)
+        return FrozenDict(new)
+    head, rest = parts[0], parts[1:]
+    if isinstance(node, dict):
+        child = assoc_in(node.get(head), rest, updates)
+        if child is None:
+            return None
+        new = dict(node)
+        new[head] = child
+        return FrozenDict(new)
+    if isinstance(node, (list, RecordTable)):
+        i = _list_index(node, head)
+        if i is None:
+            return None
+        if isinstance(node, RecordTable):
+            row = assoc_in(node.row(i), rest, updates)
+            if row is None:
+                return None
+            new = node.with_row(i, row)
+            return new if isinstance(new, RecordTable) else freeze(new)
+        child = assoc_in(node[i], rest, updates)
+        if child is None:
+            return None
+        items = list(node)
+        items[i] = child
+        return FrozenList(items)
+    return assoc_in(FrozenDict(), parts, updates)
+
+
+def _set_items(items, updates: dict, *, frozen: bool):
+    indexed = [(_list_index(items, k), v) for k, v in updates.items()]
+    if any(i is None for i, _ in indexed):
+        return None
+    if isinstance(items, RecordTable) and all(isinstance(v, dict) and tuple(v) == items.keys for _, v in indexed):
+        for i, v in indexed:
+            items = items.with_row(i, v)
+        return items
+    # 普通 list（或者新元素和表的 key 不一致，RecordTable 退回 list）
+    new = items.tolist() if isinstance(items, RecordTable) else list(items) if frozen else items
+    for i, v in indexed:
+        new[i] = v
+    if not frozen:
+        return new
+    return freeze(new) if isinstance(items, RecordTable) else FrozenList(new)
+
+
+def _list_index(items, part: str) -> int | None:
+    i = _as_index(part)
+    if i is None or not 0 <= i < len(items):
+        return None
+    return i
+
+
+def _compact(obj):
+    # RecordTable 按列计算大小（key 只算一次），和它实际占用的内存更接近
+    if isinstance(obj, RecordTable):
+        return obj.compact()
+    return json_default(obj)
+
+
+_bytes_encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), default=_compact)
+
+
+def json_bytes(value) -> int:
+    return len(_bytes_encoder.encode(value))
+
+
+def _component_entry_bytes(component_id: str, node: ComponentNode) -> int:
+    # "id":{...}, 这一项在 components 对象里的长度
+    return len(component_id) + 4 + node.json_bytes()
+
+
+def _touched_entries(data_model, parts: tuple[str, ...], keys: list[str]) -> tuple[tuple[str, ...], list[str]]:
+    # 一次 dataModelUpdate 会改动的范围：(容器的路径, 容器里会变的 key / 下标)。
+    # 路径上第一个缺失、不是 dict / list（标量、RecordTable）的位置整个会被换掉或者新建，
+    # 就按那一项算；否则是目标容器里的这些 key。
+    node = data_model
+    for i, part in enumerate(parts):
+        child = _child(node, part)
+        if not isinstance(child, (dict, list)):
+            return parts[:i], [part]
+        node = child
+    return parts, keys
+
+
+def _entries_bytes(data_model, parts: tuple[str, ...], keys: list[str]) -> int:
+    # 容器（dict / list，路径上都存在）里这些 key 对应的部分在编码结果里的长度：
+    # dict 是 "key":value，list 是元素本身，再加上容器里分隔各项的逗号。
+    # 更新前后各算一次，差值就是整个 dataModel 编码长度的变化。
+    target = data_model
+    for part in parts:
+        target = _child(target, part)
+    if isinstance(target, dict):
+        total = max(0, len(target) - 1)
+        for key in dict.fromkeys(keys):
+            if key in target:
+                total += json_bytes(key) + 1 + json_bytes(target[key])
+        return total
+    total = 0
+    for key in dict.fromkeys(keys):
+        i = _list_index(target, key)
+        if i is not None:
+            total += json_bytes(target[i])
+    return total
+
+
+def _child(node, part: str):
+    if isinstance(node, dict):
+        return node.get(part)
+    if isinstance(node, (list, RecordTable)):
+        i = _list_index(node, part)
+        if i is None:
+            return None
+        return node.row(i) if isinstance(node, RecordTable) else node[i]
+    return None
 
 
 def build_data_model_from_contents(contents: list[dict]) -> dict:
@@ -77,46 +621,109 @@ def decode_value(entry: dict):
         for kv in entry.get("valueMap") or []:
             obj[kv["key"]] = decode_value(kv)
         return obj
+    if "valueArray" in entry:
+        # 元素和 contents 里的 entry 一样带 value*，只是没有 key
+        items = [decode_value(v) for v in entry.get("valueArray") or []]
+        table = RecordTable.from_rows(items)
+        return table if table is not None else items
     return None
 
 
-def resolve_json_pointer(obj, pointer: str | None):
+class JsonPointer:
+    # 编译好的 JSON pointer：已经反转义的 segments，以及每个 segment 作为 list 下标时的 int（不是数字则为 None）
+    __slots__ = ("parts", "indices")
+
+    def __init__(self, parts: tuple[str, ...]) -> None:
+        self.parts = parts
+        self.indices = tuple(_as_index(p) for p in parts)
+
+    def __repr__(self) -> str:
+        return f"JsonPointer({self.parts!r})"
+
+
+def _as_index(part: str) -> int | None:
+    try:
+        return int(part)
+    except ValueError:
+        return None
+
+
+# 同一个 pointer 字符串只解析一次（有上限的 LRU，相同字符串得到同一个对象）
+POINTER_CACHE_SIZE = 4096
+
+
+@functools.lru_cache(maxsize=POINTER_CACHE_SIZE)
+def compile_json_pointer(pointer: str | None) -> JsonPointer | None:
     if pointer is None or pointer == "" or pointer == "/":
-        return obj
+        return JsonPointer(())
     if not pointer.startswith("/"):
         return None
+    return JsonPointer(tuple(unescape_json_pointer(p) for p in pointer.split("/")[1:]))
+
+
+def resolve_json_pointer(obj, pointer: str | None):
+    ptr = compile_json_pointer(pointer)
+    if ptr is None:
+        return None
+    return walk_json_pointer(obj, ptr)
 
-    parts = [unescape_json_pointer(p) for p in pointer.split("/")[1:]]
+
+def parse_json_pointer(pointer: str | None) -> tuple[str, ...] | None:
+    ptr = compile_json_pointer(pointer)
+    return ptr.parts if ptr is not None else None
+
+
+def walk_json_pointer(obj, ptr: JsonPointer):
     cur = obj
-    for part in parts:
+    parts, indices = ptr.parts, ptr.indices
+    i, n = 0, len(parts)
+    while i < n:
         if cur is None:
             return None
-        if isinstance(cur, list):
-            try:
-                idx = int(part)
-            except ValueError:
-                return None
-            if idx < 0 or idx >= len(cur):
+        if isinstance(cur, dict):
+            cur = cur.get(parts[i])
+        elif isinstance(cur, list):
+            idx = indices[i]
+            if idx is None or idx < 0 or idx >= len(cur):
                 return None
             cur = cur[idx]
-        elif isinstance(cur, dict):
-            cur = cur.get(part)
+        elif isinstance(cur, RecordTable):
+            idx = indices[i]
+            if idx is None or idx < 0 or idx >= len(cur):
+                return None
+            if i + 1 == n:
+                return cur.row(idx)
+            # /<行>/<列>：直接取列里的值，不生成行 dict
+            i += 1
+            column = cur.column(parts[i])
+            cur = column[idx] if column is not None else None
         else:
             return None
+        i += 1
     return cur
 
 
-def unescape_json_pointer(s: str) -> str:
-    return s.replace("~1", "/").replace("~0", "~")
+@functools.lru_cache(maxsize=POINTER_CACHE_SIZE)
+def pointer_segments(pointer: str | None) -> tuple[str, ...]:
+    # dataModelUpdate.path 的写法比较宽松（可以不以 / 开头，空 segment 忽略）
+    if not pointer:
+        return ()
+    return tuple(unescape_json_pointer(p) for p in pointer.split("/") if p)
 
 
-def ensure_object_at_pointer(root: dict, pointer: str) -> dict:
-    parts = [unescape_json_pointer(p) for p in pointer.split("/") if p]
-    cur = root
-    for p in parts:
-        nxt = cur.get(p)
-        if not isinstance(nxt, dict):
-            nxt = {}
-            cur[p] = nxt
-        cur = nxt
-    return cur
+def _collect_pointers(v, key: str, out: dict[str, JsonPointer]) -> None:
+    if isinstance(v, dict):
+        path = v.get("path")
+        if isinstance(path, str):
+            ptr = compile_json_pointer(path)
+            if ptr is not None:
+                out[key] = ptr
+        for k, x in v.items():
+            _collect_pointers(x, f"{key}/{k}", out)
+    elif isinstance(v, list):
+        for i, x in enumerate(v):
+            _collect_pointers(x, f"{key}/{i}", out)
+
+
+def unescape_json_pointer(s: str) -> str:
+    return s.replace("~1", "/").replace("~0", "~")
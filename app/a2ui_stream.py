@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import json
+import logging
+from typing import AsyncIterable, AsyncIterator, Union
+
+from app.a2ui_state import A2UIState, apply_a2ui_messages
+
+logger = logging.getLogger(__name__)
+
+# agent 的回复：一次给完的 list[dict]，或者边生成边给的异步流。
+# 流里的元素可以是已经解析好的 dict，也可以是 JSONL / SSE（A2UI agent 走 SSE 时的格式）的文本块，
+# 文本块可以在任意位置切开（比如直接是 HTTP 响应的 aiter_bytes()）。
+A2UISource = Union[list[dict], AsyncIterable[dict], AsyncIterable[bytes], AsyncIterable[str]]
+
+# SSE 里不带数据的字段
+_SSE_FIELDS = (b"event:", b"id:", b"retry:")
+
+
+async def iter_a2ui_messages(source: A2UISource) -> AsyncIterator[dict]:
+    if isinstance(source, list):
+        for msg in source:
+            yield msg
+        return
+
+    buf = b""
+    async for chunk in source:
+        if isinstance(chunk, dict):
+            yield chunk
+            continue
+        buf += chunk.encode("utf-8") if isinstance(chunk, str) else chunk
+        if b"\n" not in buf:
+            continue
+        *lines, buf = buf.split(b"\n")
+        for line in lines:
+            msg = parse_stream_line(line)
+            if msg is not None:
+                yield msg
+    msg = parse_stream_line(buf)
+    if msg is not None:
+        yield msg
+
+
+def parse_stream_line(line: bytes) -> dict | None:
+    # 一行一条 A2UI 消息：JSONL 的一行，或 SSE 的 `data: {...}`（每个 SSE 事件只有一行 data）。
+    # 空行、SSE 注释（`:` 开头）和 event/id/retry 字段跳过；坏掉的行记一条日志跳过，不中断整个流。
+    line = line.strip()
+    if not line or line.startswith(b":") or line.startswith(_SSE_FIELDS):
+        return None
+    if line.startswith(b"data:"):
+        line = line[5:].strip()
+    try:
+        msg = json.loads(line)
+    except ValueError:
+        logger.warning("skipping malformed A2UI stream line: %.80r", line)
+        return None
+    return msg if isinstance(msg, dict) else None
+
+
+class StreamIngest:
+    # 把流里的消息逐条 apply 到 state，记住这一轮 beginRendering 过的 surface（按第一次出现的顺序）。
+    # surface 要 beginRendering 到了、root component 也到了才算可以渲染；
+    # 按 A2UI 的约定 root 的 surfaceUpdate 在 beginRendering 之前，但也容忍反过来的顺序。
+    def __init__(self, state: A2UIState) -> None:
+        self.state = state
+        self.begun: dict[str, None] = {}
+
+    def apply(self, msg: dict) -> None:
+        for surface_id in apply_a2ui_messages(self.state, [msg]):
+            self.begun[surface_id] = None
+        if "deleteSurface" in msg:
+            self.begun.pop(msg["deleteSurface"]["surfaceId"], None)
+
+    def ready(self) -> list[str]:
+        out = []
+        for surface_id in self.begun:
+            surface = self.state.surfaces.get(surface_id)
+            if surface is not None and surface.root in surface.components:
+                out.append(surface_id)
+        return out
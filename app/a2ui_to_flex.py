@@ -1,118 +1,119 @@
 from __future__ import annotations
 
-from app.a2ui_state import Surface, resolve_json_pointer
+import inspect
+import itertools
+import json
+from dataclasses import dataclass
+from json.encoder import c_make_encoder, encode_basestring
+from typing import Callable, Generator, Iterator, Union
+
+from app.a2ui_state import ComponentNode, Surface, resolve_json_pointer, walk_json_pointer
+from app.record_table import RecordTable, json_default
+
+# LINE Flex Message 限制
+MAX_CAROUSEL_BUBBLES = 12
+MAX_BUBBLE_BYTES = 30_000
+MAX_CAROUSEL_BYTES = 50_000
+MAX_MESSAGES_PER_REPLY = 5
+MAX_TEXT_CHARS = 5000
+
+# component 树的最大嵌套深度（超过的部分渲染成占位文字，防止恶意/过深的树）
+MAX_DEPTH = 32
+
+# bubble / carousel 外层结构和 altText 预留的字节数
+_ENVELOPE_BYTES = 1024
+
+OVERFLOW_POLICIES = ("truncate", "paginate", "degrade")
+
+# Carousel 的 bubble 超过一次 reply 能放下的数量时：
+#   more  最后一个 bubble 换成「更多」按钮（postback 带上下一页的 offset）
+#   push  全部拆成 carousel，reply 之后剩下的用 push 补发（最多 max_pages 条）
+CAROUSEL_OVERFLOW_POLICIES = ("more", "push")
+
+# postback data 前缀：a2ui:more:<surfaceId>:<offset>
+MORE_POSTBACK_PREFIX = "a2ui:more:"
+
+
+@dataclass(frozen=True)
+class FlexBudget:
+    # 转换时边生成边记账（估算的 JSON 字节数、节点数、深度、bubble 数），
+    # 超出时按 overflow 处理：
+    #   truncate  丢掉放不下的子节点 / bubble
+    #   paginate  按顺序拆成多条消息（最多 max_messages 条），再放不下的丢掉
+    #   degrade   整个回复退化成一条纯文字消息
+    # 字节 / bubble 数默认是 LINE 的限制；节点数 LINE 没有公开上限，用来挡住过于复杂的布局。
+    max_bubble_bytes: int = MAX_BUBBLE_BYTES
+    max_carousel_bytes: int = MAX_CAROUSEL_BYTES
+    max_bubbles: int = MAX_CAROUSEL_BUBBLES
+    max_nodes: int = 1000
+    max_depth: int = MAX_DEPTH
+    max_messages: int = MAX_MESSAGES_PER_REPLY
+    overflow: str = "truncate"
+    carousel_overflow: str = "more"
+    max_pages: int = 20
+
+    def __post_init__(self) -> None:
+        if self.overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown Flex overflow policy: {self.overflow!r} (expected one of {OVERFLOW_POLICIES})")
+        if self.carousel_overflow not in CAROUSEL_OVERFLOW_POLICIES:
+            raise ValueError(
+                f"Unknown carousel overflow policy: {self.carousel_overflow!r} (expected one of {CAROUSEL_OVERFLOW_POLICIES})"
+            )
+
+
+DEFAULT_BUDGET = FlexBudget()
+
+
+def a2ui_surface_to_line_messages(
+    *,
+    surface: Surface,
+    alt_text: str = "A2UI",
+    budget: FlexBudget | None = None,
+    surface_id: str = "main",
+    offset: int = 0,
+) -> list[dict]:
+    # 可能返回多条消息（分页的 bubble / carousel）；push 模式下可能超过一次 reply 的上限，
+    # 调用方负责把超出的部分用 push 补发。offset 是「更多」按钮翻页时跳过的 carousel 项数。
+    surface.flush_dirty()
 
-
-def a2ui_surface_to_line_flex(*, surface: Surface, alt_text: str = "A2UI") -> dict:
     if not surface.root:
-        return line_text("Missing beginRendering/root")
-
-    root_comp = surface.components.get(surface.root)
-    if not root_comp:
-        return line_text("Root component not found")
-
-    ctype, props = unwrap_component(root_comp)
-    if ctype == "Carousel":
-        child_ids = resolve_children_ids(props.get("children"))
-        bubbles = []
-        for cid in child_ids:
-            cc = surface.components.get(cid)
-            if not cc:
-                continue
-            # Convert each child to a Box, then wrap in a Bubble
-            box = component_to_flex_box(component_id=cid, component=cc, surface=surface)
-            bubbles.append({"type": "bubble", "body": box})
-        
-        return {
-            "type": "flex",
-            "altText": alt_text,
-            "contents": {
-                "type": "carousel",
-                "contents": bubbles
-            }
-        }
+        return [line_text("Missing beginRendering/root")]
 
-    if ctype == "Confirm":
-        # Return a native LINE Confirm Template Message
-        msg_text = resolve_a2ui_value(props.get("text"), surface.data_model) or "Are you sure?"
-        
-        def make_action(btn_prop_name: str, default_label: str):
-            btn_props = props.get(btn_prop_name) or {}
-            label = btn_props.get("label") or default_label
-            action_name = (btn_props.get("action") or {}).get("name") or "action"
-            return {
-                "type": "message",
-                "label": str(label),
-                "text": f"@action {action_name}"
-            }
+    root = surface.components.get(surface.root)
+    if root is None:
+        return [line_text("Root component not found")]
 
-        left_action = make_action("leftButton", "No")
-        right_action = make_action("rightButton", "Yes")
+    conv = FlexConverter(surface, budget)
+    conv.surface_id = surface_id
+    conv.offset = offset
+    return ROOT_HANDLERS.get(root.type, _root_bubble)(conv, root, alt_text)
 
-        return {
-            "type": "template",
-            "altText": alt_text,
-            "template": {
-                "type": "confirm",
-                "text": str(msg_text)[:240],  # LINE limit: 240 chars
-                "actions": [left_action, right_action]
-            }
-        }
 
-    if ctype == "Location":
-        # Return a native LINE Location Message
-        # Props: title, address, latitude, longitude
-        title = resolve_a2ui_value(props.get("title"), surface.data_model) or "Location"
-        address = resolve_a2ui_value(props.get("address"), surface.data_model) or ""
-        latitude = props.get("latitude") or 0.0
-        longitude = props.get("longitude") or 0.0
-        
-        return {
-            "type": "location",
-            "title": str(title),
-            "address": str(address),
-            "latitude": float(latitude),
-            "longitude": float(longitude)
-        }
+def a2ui_surface_to_line_flex(*, surface: Surface, alt_text: str = "A2UI", budget: FlexBudget | None = None) -> dict:
+    return a2ui_surface_to_line_messages(surface=surface, alt_text=alt_text, budget=budget)[0]
 
-    if ctype == "Audio":
-        # Return a native LINE Audio Message
-        # Props: url, duration (ms)
-        url = resolve_a2ui_value(props.get("url"), surface.data_model) or ""
-        duration = props.get("duration") or 1000  # Default 1s
-        
-        return {
-            "type": "audio",
-            "originalContentUrl": str(url),
-            "duration": int(duration)
-        }
 
-    if ctype == "Video":
-        # Return a native LINE Video Message
-        # Props: url, previewUrl
-        url = resolve_a2ui_value(props.get("url"), surface.data_model) or ""
-        preview_url = resolve_a2ui_value(props.get("previewUrl"), surface.data_model) or ""
-        
-        return {
-            "type": "video",
-            "originalContentUrl": str(url),
-            "previewImageUrl": str(preview_url)
-        }
+def line_text(text: str) -> dict:
+    return {"type": "text", "text": str(text)}
 
-    if ctype == "Image":
-        # Return a native LINE Image Message
-        # Props: url, previewUrl
-        url = resolve_a2ui_value(props.get("url"), surface.data_model) or ""
-        preview_url = resolve_a2ui_value(props.get("previewUrl"), surface.data_model) or ""
-        
-        return {
-            "type": "image",
-            "originalContentUrl": str(url),
-            "previewImageUrl": str(preview_url)
-        }
 
-    body = component_to_flex_box(component_id=surface.root, component=root_comp, surface=surface)
+# ---- 根节点：直接对应一种 LINE message 的 component ----
+
 
+def _root_bubble(conv: FlexConverter, root: ComponentNode, alt_text: str) -> list[dict]:
+    budget = conv.budget
+    pages = budget.max_messages if budget.overflow == "paginate" else 1
+    conv.start(max_bytes=(budget.max_bubble_bytes - _ENVELOPE_BYTES) * pages, max_nodes=budget.max_nodes * pages)
+    body = conv.convert(conv.surface.root, "box")
+
+    if budget.overflow == "degrade" and conv.truncated:
+        return [degraded_text(alt_text, [body])]
+    if pages > 1 and (conv.used_bytes > budget.max_bubble_bytes - _ENVELOPE_BYTES or conv.used_nodes > budget.max_nodes):
+        return [_flex_bubble(alt_text, page) for page in conv.paginate(body, pages)]
+    return [_flex_bubble(alt_text, body)]
+
+
+def _flex_bubble(alt_text: str, body: dict) -> dict:
     return {
         "type": "flex",
         "altText": alt_text,
@@ -123,129 +124,631 @@ def a2ui_surface_to_line_flex(*, surface: Surface, alt_text: str = "A2UI") -> di
     }
 
 
-def line_text(text: str) -> dict:
-    return {"type": "text", "text": str(text)}
+def _root_carousel(conv: FlexConverter, root: ComponentNode, alt_text: str) -> list[dict]:
+    surface = conv.surface
+    budget = conv.budget
+    if root.template is not None:
+        items = iter_template_items(surface, root.template, None)
+    else:
+        items = ((cid, None) for cid in root.children or () if cid in surface.components)
+    items = itertools.islice(items, conv.offset, None)
+
+    # 每个 bubble 单独记账；bubble 数或总字节数超出时换下一个 carousel（下一条消息）
+    more = budget.carousel_overflow == "more"
+    max_pages = budget.max_messages if more else budget.max_pages
+    pages: list[list[dict]] = []
+    page: list[dict] = []
+    total = _ENVELOPE_BYTES
+    emitted = 0
+    overflow = False
+    for cid, item in items:
+        conv.start(max_bytes=budget.max_bubble_bytes - _ENVELOPE_BYTES, max_nodes=budget.max_nodes)
+        # Convert each child to a Box, then wrap in a Bubble
+        body = conv.convert(cid, "box", item)
+        nbytes = conv.used_bytes + 32
+        if page and (len(page) >= budget.max_bubbles or total + nbytes > budget.max_carousel_bytes):
+            pages.append(page)
+            page, total = [], _ENVELOPE_BYTES
+        if len(pages) >= max_pages:
+            overflow = True
+            break
+        page.append({"type": "bubble", "body": body})
+        total += nbytes
+        emitted += 1
+    if page:
+        pages.append(page)
+
+    if overflow:
+        if more:
+            # 最后一个 bubble 让位给「更多」按钮，从它开始是下一页
+            pages[-1].pop()
+            emitted -= 1
+            pages[-1].append(_more_bubble(conv.surface_id, conv.offset + emitted))
+        else:
+            conv.truncated = True
+
+    if budget.overflow == "degrade" and conv.truncated:
+        return [degraded_text(alt_text, [b["body"] for p in pages for b in p])]
+
+    return [
+        {
+            "type": "flex",
+            "altText": alt_text,
+            "contents": {
+                "type": "carousel",
+                "contents": bubbles
+            }
+        }
+        for bubbles in pages or [[]]
+    ]
 
 
-def component_to_flex_box(*, component_id: str, component: dict, surface: Surface) -> dict:
-    ctype, props = unwrap_component(component)
+def _more_bubble(surface_id: str, offset: int) -> dict:
+    return {
+        "type": "bubble",
+        "body": {
+            "type": "box",
+            "layout": "vertical",
+            "justifyContent": "center",
+            "contents": [
+                {
+                    "type": "button",
+                    "style": "link",
+                    "action": {
+                        "type": "postback",
+                        "label": "More",
+                        "data": f"{MORE_POSTBACK_PREFIX}{surface_id}:{offset}",
+                        "displayText": "More",
+                    },
+                }
+            ],
+        },
+    }
+
+
+def parse_more_postback(data: str | None) -> tuple[str, int] | None:
+    # a2ui:more:<surfaceId>:<offset> -> (surfaceId, offset)
+    if not data or not data.startswith(MORE_POSTBACK_PREFIX):
+        return None
+    surface_id, _, offset = data[len(MORE_POSTBACK_PREFIX):].rpartition(":")
+    if not surface_id or not offset.isdigit():
+        return None
+    return surface_id, int(offset)
+
+
+def _root_confirm(conv: FlexConverter, root: ComponentNode, alt_text: str) -> list[dict]:
+    # Return a native LINE Confirm Template Message
+    props = root.props
+    msg_text = resolve_prop(conv.surface, root.id, props, "text") or "Are you sure?"
+
+    def make_action(btn_prop_name: str, default_label: str):
+        btn_props = props.get(btn_prop_name) or {}
+        label = btn_props.get("label") or default_label
+        action_name = (btn_props.get("action") or {}).get("name") or "action"
+        return {
+            "type": "message",
+            "label": str(label),
+            "text": f"@action {action_name}"
+        }
 
-    if ctype in {"Column", "Row"}:
-        layout = "horizontal" if ctype == "Row" else "vertical"
-        child_ids = resolve_children_ids(props.get("children"))
-        contents = []
-        for cid in child_ids:
-            cc = surface.components.get(cid)
-            if not cc:
+    left_action = make_action("leftButton", "No")
+    right_action = make_action("rightButton", "Yes")
+
+    return [{
+        "type": "template",
+        "altText": alt_text,
+        "template": {
+            "type": "confirm",
+            "text": str(msg_text)[:240],  # LINE limit: 240 chars
+            "actions": [left_action, right_action]
+        }
+    }]
+
+
+def _root_location(conv: FlexConverter, root: ComponentNode, alt_text: str) -> list[dict]:
+    # Return a native LINE Location Message
+    # Props: title, address, latitude, longitude
+    surface, props = conv.surface, root.props
+    title = resolve_prop(surface, root.id, props, "title") or "Location"
+    address = resolve_prop(surface, root.id, props, "address") or ""
+    latitude = props.get("latitude") or 0.0
+    longitude = props.get("longitude") or 0.0
+
+    return [{
+        "type": "location",
+        "title": str(title),
+        "address": str(address),
+        "latitude": float(latitude),
+        "longitude": float(longitude)
+    }]
+
+
+def _root_audio(conv: FlexConverter, root: ComponentNode, alt_text: str) -> list[dict]:
+    # Return a native LINE Audio Message
+    # Props: url, duration (ms)
+    props = root.props
+    url = resolve_prop(conv.surface, root.id, props, "url") or ""
+    duration = props.get("duration") or 1000  # Default 1s
+
+    return [{
+        "type": "audio",
+        "originalContentUrl": str(url),
+        "duration": int(duration)
+    }]
+
+
+def _root_media(message_type: str) -> RootHandler:
+    # Return a native LINE Video / Image Message
+    # Props: url, previewUrl
+    def handler(conv: FlexConverter, root: ComponentNode, alt_text: str) -> list[dict]:
+        surface, props = conv.surface, root.props
+        url = resolve_prop(surface, root.id, props, "url") or ""
+        preview_url = resolve_prop(surface, root.id, props, "previewUrl") or ""
+
+        return [{
+            "type": message_type,
+            "originalContentUrl": str(url),
+            "previewImageUrl": str(preview_url)
+        }]
+
+    return handler
+
+
+RootHandler = Callable[["FlexConverter", ComponentNode, str], list[dict]]
+
+ROOT_HANDLERS: dict[str, RootHandler] = {
+    "Carousel": _root_carousel,
+    "Confirm": _root_confirm,
+    "Location": _root_location,
+    "Audio": _root_audio,
+    "Video": _root_media("video"),
+    "Image": _root_media("image"),
+}
+
+
+# ---- component 树 -> Flex box / element ----
+#
+# 不用递归：叶子 handler 直接返回节点；容器 handler 是 generator，
+# yield (子 component id, "box" | "element", scope) 请求转换子节点，send 回转换结果，
+# 最后 return 自己的节点。FlexConverter.convert 用一个显式的栈驱动这些 generator，
+# 所以树再深也不会碰到 Python 的递归上限；叶子子节点由容器直接调用 quick() 转换，不进栈。
+#
+# 预算：每个新生成的节点只计自己那一层的字节数（子节点生成时已经计过），复用的缓存子树整体计入。
+# 容器每加一个子节点就检查一次，超出就把这个子节点退回并停止展开剩余的子节点。
+
+Request = tuple[str, str, object]
+Handler = Callable[["FlexConverter", ComponentNode, object], Union[dict, Generator[Request, dict, dict]]]
+
+
+class _OverBudget(Exception):
+    pass
+
+
+class FlexConverter:
+    # Surface.components 里是 ingest 时建好的 ComponentNode，按 node.type 查 handler 表分派
+    def __init__(self, surface: Surface, budget: FlexBudget | None = None) -> None:
+        self.surface = surface
+        self.budget = budget or DEFAULT_BUDGET
+        self.components = surface.components
+        self.cache = surface.flex_cache
+        self.stats = surface.flex_stats
+        # 本次渲染里每个节点整棵子树的 (字节数, 节点数)，按 id(node) 查。
+        # 节点对象本身也存着：既让它活到渲染结束，也在查表时核对是不是同一个对象——
+        # 被退回/丢掉的节点释放后 id 会被新节点复用，只比 id 会读到别人的大小。
+        self._sizes: dict[int, tuple[dict, tuple[int, int]]] = {}
+        # 和 convert 的栈平行：每个正在展开的容器已经预先计入的自身字节（外壳 + 子节点间的逗号）
+        self._prepaid: list[int] = []
+        # truncated：本次渲染里有内容因为预算被丢掉；exhausted：当前这条消息的预算已经用完
+        self.truncated = False
+        self.exhausted = False
+        # accounting=False：先不记账的那一遍（见 convert），只数转换了多少个 component，
+        # 写进缓存的 key 记在 _written 里，放不下时撤销
+        self.accounting = True
+        self._converted = 0
+        self._written: list[tuple[str, str]] = []
+        self.surface_id = "main"
+        self.offset = 0
+        self.start(max_bytes=self.budget.max_bubble_bytes - _ENVELOPE_BYTES, max_nodes=self.budget.max_nodes)
+
+    def start(self, *, max_bytes: int, max_nodes: int) -> None:
+        # 开始一条新消息 / 一个新 bubble 的记账
+        self.max_bytes = max_bytes
+        self.max_nodes = max_nodes
+        self.used_bytes = 0
+        self.used_nodes = 0
+        self.exhausted = False
+
+    def over_budget(self) -> bool:
+        return self.used_bytes > self.max_bytes or self.used_nodes > self.max_nodes
+
+    def known_size(self, node: dict) -> tuple[int, int] | None:
+        entry = self._sizes.get(id(node))
+        if entry is None or entry[0] is not node:
+            return None
+        return entry[1]
+
+    def remember_size(self, node: dict, st: tuple[int, int]) -> None:
+        self._sizes[id(node)] = (node, st)
+
+    def size_of(self, node: dict) -> tuple[int, int]:
+        st = self.known_size(node)
+        if st is None:
+            st = (json_size(node), count_nodes(node))
+            self.remember_size(node, st)
+        return st
+
+    def reserve(self, nbytes: int) -> None:
+        # 容器在展开子节点之前 / 过程中先计入自己的字节，子节点超预算的判断里就已经包含了外壳，
+        # 容器结束时（_charge_container）不会再把总数推过上限
+        self.used_bytes += nbytes
+        if self._prepaid:
+            self._prepaid[-1] += nbytes
+
+    def refund(self, node: dict) -> None:
+        nbytes, nodes = self.size_of(node)
+        self.used_bytes -= nbytes
+        self.used_nodes -= nodes
+
+    def _charge_leaf(self, node: dict) -> None:
+        nbytes, nodes = self.size_of(node)
+        self.used_bytes += nbytes
+        self.used_nodes += nodes
+
+    def _charge_container(self, node: dict, prepaid: int = 0) -> None:
+        # 容器自己的节点数在压栈时已经预先计入（_push），字节数预先计入了 prepaid
+        if self.known_size(node) is not None:
+            # 直接返回了某个子节点（已经计过）
+            self.used_nodes -= 1
+            self.used_bytes -= prepaid
+            return
+        contents = node.get("contents") or []
+        own = shell_size(node) + max(len(contents) - 1, 0)
+        nbytes, nodes = own, 1
+        for child in contents:
+            cb, cn = self.size_of(child)
+            nbytes += cb
+            nodes += cn
+        self.remember_size(node, (nbytes, nodes))
+        self.used_bytes += own - prepaid
+
+    def quick(self, component_id: str, mode: str, scope=None) -> dict | None:
+        # 命中缓存或者是叶子时直接返回节点；容器返回 None，由调用方 yield 给 convert 处理。
+        # 没有改动过的 component 直接复用上次转换的子树（失效由 Surface.flush_dirty 处理）；
+        # 模板展开时（scope 是当前列表项）同一个 component 每一项渲染结果都不同，不走缓存。
+        if not self.accounting:
+            return self._quick_unmetered(component_id, mode, scope)
+        if scope is None:
+            key = (component_id, mode)
+            out = self.cache.get(key)
+            if out is not None:
+                # 不记账的那一遍写进缓存的子树没有大小，第一次在记账时用到再算
+                st = self.stats.get(key)
+                if st is None:
+                    self.stats[key] = self.size_of(out)
+                else:
+                    self.remember_size(out, st)
+                self._charge_leaf(out)
+                return out
+        node = self.components.get(component_id)
+        if node is None:
+            out = unsupported_component("Missing", component_id)
+            self._charge_leaf(out)
+            return out
+        handler = HANDLERS[mode].get(node.type) or DEFAULT_HANDLERS[mode]
+        if handler in CONTAINER_HANDLERS:
+            return None
+        out = handler(self, node, scope)
+        self._charge_leaf(out)
+        if scope is None:
+            self.cache[key] = out
+            self.stats[key] = self.size_of(out)
+        return out
+
+    def _quick_unmetered(self, component_id: str, mode: str, scope) -> dict | None:
+        # 不记账的那一遍：每个 component 至少生成一个节点，转换的个数超过节点上限就不用再往下转了
+        if scope is None:
+            key = (component_id, mode)
+            out = self.cache.get(key)
+            if out is not None:
+                return out
+        self._converted += 1
+        if self._converted > self.max_nodes - self.used_nodes:
+            raise _OverBudget
+        node = self.components.get(component_id)
+        if node is None:
+            return unsupported_component("Missing", component_id)
+        handler = HANDLERS[mode].get(node.type) or DEFAULT_HANDLERS[mode]
+        if handler in CONTAINER_HANDLERS:
+            return None
+        out = handler(self, node, scope)
+        if scope is None:
+            self.cache[key] = out
+            self._written.append(key)
+        return out
+
+    def convert(self, component_id: str, mode: str, scope=None) -> dict:
+        # 先不记账整个转换一遍，最后整体算一次大小：放得下（大多数回复）就直接用，
+        # 不用给每个节点单独编码、记账；放不下时撤销这一遍写进的缓存，再边转换边记账，按 overflow 截断。
+        if not self.exhausted:
+            truncated = self.truncated
+            self.accounting = False
+            self._converted = 0
+            self._written = []
+            try:
+                value = self._convert(component_id, mode, scope)
+            except _OverBudget:
+                value = None
+            finally:
+                self.accounting = True
+            if value is not None:
+                nbytes, nodes = self.size_of(value)
+                if self.used_bytes + nbytes <= self.max_bytes and self.used_nodes + nodes <= self.max_nodes:
+                    self.used_bytes += nbytes
+                    self.used_nodes += nodes
+                    return value
+            for key in self._written:
+                self.cache.pop(key, None)
+            self.truncated = truncated
+        return self._convert(component_id, mode, scope)
+
+    def _convert(self, component_id: str, mode: str, scope=None) -> dict:
+        value = self.quick(component_id, mode, scope)
+        if value is not None:
+            return value
+        # (handler generator, 缓存 key, 正在转换的 (id, mode, scope))
+        stack: list[tuple[Generator[Request, dict, dict], tuple | None, tuple]] = []
+        active: set[tuple] = set()
+        value = self._push(component_id, mode, scope, stack, active)
+        while stack:
+            gen, cache_key, active_key = stack[-1]
+            try:
+                request = gen.send(value)
+            except StopIteration as stop:
+                stack.pop()
+                active.discard(active_key)
+                value = stop.value
+                if not self.accounting:
+                    if cache_key is not None and not self.truncated:
+                        self.cache[cache_key] = value
+                        self._written.append(cache_key)
+                    continue
+                self._charge_container(value, self._prepaid.pop())
+                # 被预算截断过的子树和当前位置有关，不缓存
+                if cache_key is not None and not self.truncated:
+                    self.cache[cache_key] = value
+                    self.stats[cache_key] = self.size_of(value)
+                continue
+            value = self._push(*request, stack, active)
+        return value
+
+    def _push(self, component_id: str, mode: str, scope, stack: list, active: set) -> dict | None:
+        # 容器：把 handler generator 压栈并返回 None；超过深度或者成环时返回占位节点
+        if len(stack) >= self.budget.max_depth:
+            self.truncated = True
+            out = unsupported_component("TooDeep", component_id)
+            if self.accounting:
+                self._charge_leaf(out)
+            return out
+        # 同一个 component（同一个列表项下）又出现在自己的子树里：引用成环
+        active_key = (component_id, mode, id(scope))
+        if active_key in active:
+            out = unsupported_component("Cycle", component_id)
+            if self.accounting:
+                self._charge_leaf(out)
+            return out
+        node = self.components[component_id]
+        handler = HANDLERS[mode].get(node.type) or DEFAULT_HANDLERS[mode]
+        active.add(active_key)
+        if self.accounting:
+            self.used_nodes += 1
+            self._prepaid.append(0)
+        stack.append((handler(self, node, scope), (component_id, mode) if scope is None else None, active_key))
+        return None
+
+    def paginate(self, body: dict, pages: int) -> list[dict]:
+        # 把 body 的顶层子节点按顺序装进若干个 bubble，每个都不超过单个 bubble 的预算
+        budget = self.budget
+        max_bytes = budget.max_bubble_bytes - _ENVELOPE_BYTES
+        shell = {k: v for k, v in body.items() if k != "contents"}
+        base = shell_size(body)
+        out: list[dict] = []
+        page: list[dict] = []
+        nbytes, nodes = base, 1
+        for child in body.get("contents") or []:
+            cb, cn = self.size_of(child)
+            if page and (nbytes + cb + 1 > max_bytes or nodes + cn > budget.max_nodes):
+                out.append({**shell, "contents": page})
+                page, nbytes, nodes = [], base, 1
+                if len(out) >= pages:
+                    self.truncated = True
+                    return out
+            if nbytes + cb > max_bytes or nodes + cn > budget.max_nodes:
+                self.truncated = True  # 单个子节点就放不进一个 bubble
                 continue
-            contents.append(component_to_flex_element(component_id=cid, component=cc, surface=surface))
+            page.append(child)
+            nbytes += cb + 1
+            nodes += cn
+        if page or not out:
+            out.append({**shell, "contents": page})
+        return out
+
+
+def _layout_box(conv: FlexConverter, node: ComponentNode, scope):
+    layout = "horizontal" if node.type == "Row" else "vertical"
+    contents = []
+    if node.template is not None:
+        items = iter_template_items(conv.surface, node.template, scope)
+    else:
+        components = conv.components
+        items = ((cid, scope) for cid in node.children or () if cid in components)
+
+    if not conv.accounting:
+        quick = conv._quick_unmetered
+        for cid, item in items:
+            el = quick(cid, "element", item)
+            if el is None:
+                el = yield (cid, "element", item)
+            contents.append(el)
         return {"type": "box", "layout": layout, "contents": contents}
 
-    fallback = component_to_flex_element(component_id=component_id, component=component, surface=surface)
+    conv.reserve(shell_size({"type": "box", "layout": layout}))
+    for cid, item in items:
+        if conv.exhausted:
+            break
+        el = conv.quick(cid, "element", item)
+        if el is None:
+            el = yield (cid, "element", item)
+        comma = 1 if contents else 0
+        conv.reserve(comma)
+        if conv.over_budget():
+            # 放不下这个子节点：退回，剩下的子节点也不再展开
+            conv.refund(el)
+            conv.reserve(-comma)
+            conv.truncated = conv.exhausted = True
+            break
+        contents.append(el)
+    return {"type": "box", "layout": layout, "contents": contents}
+
+
+def _wrap_in_box(conv: FlexConverter, node: ComponentNode, scope):
+    fallback = conv.quick(node.id, "element", scope)
+    if fallback is None:
+        fallback = yield (node.id, "element", scope)
     if fallback.get("type") == "box":
         return fallback
     return {"type": "box", "layout": "vertical", "contents": [fallback]}
 
 
-def component_to_flex_element(*, component_id: str, component: dict, surface: Surface) -> dict:
-    ctype, props = unwrap_component(component)
+def _card(conv: FlexConverter, node: ComponentNode, scope):
+    child_id = node.child
+    if not child_id:
+        return unsupported_component(node.type, node.id)
+    if child_id not in conv.components:
+        return unsupported_component(node.type, node.id)
+    child = conv.quick(child_id, "box", scope)
+    if child is None:
+        child = yield (child_id, "box", scope)
+    return {
+        "type": "box",
+        "layout": "vertical",
+        "paddingAll": "12px",
+        "borderWidth": "1px",
+        "borderColor": "#DDDDDD",
+        "cornerRadius": "8px",
+        "contents": [child],
+    }
+
 
-    if ctype in {"Column", "Row"}:
-        return component_to_flex_box(component_id=component_id, component=component, surface=surface)
+def _text(conv: FlexConverter, node: ComponentNode, scope) -> dict:
+    text = resolve_prop(conv.surface, node.id, node.props, "text", scope)
+    return {"type": "text", "text": str(text or ""), "wrap": True}
+
+
+def _button(conv: FlexConverter, node: ComponentNode, scope) -> dict:
+    label = resolve_button_label(node=node, surface=conv.surface, scope=scope)
+    action_name = (node.props.get("action") or {}).get("name") or "action"
+    return {
+        "type": "button",
+        "style": "primary",
+        "action": {"type": "message", "label": str(label or "OK"), "text": f"@action {action_name}"},
+    }
 
-    if ctype == "Text":
-        text = resolve_a2ui_value(props.get("text"), surface.data_model)
-        return {"type": "text", "text": str(text or ""), "wrap": True}
 
-    if ctype == "Button":
-        label = resolve_button_label(props=props, surface=surface)
-        action_name = (props.get("action") or {}).get("name") or "action"
+def _confirm(conv: FlexConverter, node: ComponentNode, scope) -> dict:
+    # A simple Confirm mapping:
+    # Props: text, leftButton, rightButton
+    props = node.props
+    msg_text = resolve_prop(conv.surface, node.id, props, "text", scope) or "Are you sure?"
+
+    # Helper to convert a button prop to flex button
+    def make_btn(btn_prop_name: str):
+        btn_props = props.get(btn_prop_name)
+        if not btn_props:
+            # Fallback button
+            return {
+                "type": "button",
+                "style": "secondary",
+                "action": {"type": "message", "label": "OK", "text": "OK"}
+            }
+        # Inline props: { "label": "Yes", "action": { "name": "yes" } }
+        label = btn_props.get("label") or "OK"
+        action_name = (btn_props.get("action") or {}).get("name") or "action"
         return {
             "type": "button",
-            "style": "primary",
-            "action": {"type": "message", "label": str(label or "OK"), "text": f"@action {action_name}"},
+            "style": "secondary" if btn_prop_name == "leftButton" else "primary",
+            "action": {"type": "message", "label": str(label), "text": f"@action {action_name}"},
+            "flex": 1,
         }
 
-    if ctype == "Card":
-        child_id = props.get("child")
-        if not child_id:
-            return unsupported_component(ctype, component_id)
-        cc = surface.components.get(child_id)
-        if not cc:
-            return unsupported_component(ctype, component_id)
-        return {
-            "type": "box",
-            "layout": "vertical",
-            "paddingAll": "12px",
-            "borderWidth": "1px",
-            "borderColor": "#DDDDDD",
-            "cornerRadius": "8px",
-            # "contents": [component_to_flex_element(component_id=child_id, component=cc, surface=surface)],
-            "contents": [component_to_flex_box(component_id=child_id, component=cc, surface=surface)],
-        }
+    left_btn = make_btn("leftButton")
+    right_btn = make_btn("rightButton")
 
-    if ctype == "Confirm":
-        # A simple Confirm mapping:
-        # Props: text, leftButton, rightButton
-        msg_text = resolve_a2ui_value(props.get("text"), surface.data_model) or "Are you sure?"
-        
-        # Helper to convert a button prop to flex button
-        def make_btn(btn_prop_name: str):
-            btn_props = props.get(btn_prop_name)
-            if not btn_props:
-                # Fallback button
-                return {
-                    "type": "button",
-                    "style": "secondary",
-                    "action": {"type": "message", "label": "OK", "text": "OK"}
-                }
-            # We assume the prop structure matches Button component props or similar
-            # If it's just a button object directly:
-            # We reuse component_to_flex_element logic if it were a component, but here it's embedded props.
-            # Let's assume the A2UI "Confirm" passes full Button components as children or just inline props.
-            # For simplicity, let's assume inline props: { "label": "Yes", "action": { "name": "yes" } }
-            label = btn_props.get("label") or "OK"
-            action_name = (btn_props.get("action") or {}).get("name") or "action"
-            return {
-                "type": "button",
-                "style": "secondary" if btn_prop_name == "leftButton" else "primary",
-                "action": {"type": "message", "label": str(label), "text": f"@action {action_name}"},
-                "flex": 1,
+    return {
+        "type": "box",
+        "layout": "vertical",
+        "contents": [
+            {
+                "type": "text",
+                "text": str(msg_text),
+                "wrap": True,
+                "weight": "bold",
+                "align": "center",
+                "margin": "md"
+            },
+            {
+                "type": "separator",
+                "margin": "lg"
+            },
+            {
+                "type": "box",
+                "layout": "horizontal",
+                "margin": "md",
+                "spacing": "md",
+                "contents": [left_btn, right_btn]
             }
+        ],
+        "paddingAll": "20px",
+    }
 
-        left_btn = make_btn("leftButton")
-        right_btn = make_btn("rightButton")
 
-        return {
-            "type": "box",
-            "layout": "vertical",
-            "contents": [
-                {
-                    "type": "text",
-                    "text": str(msg_text),
-                    "wrap": True,
-                    "weight": "bold",
-                    "align": "center",
-                    "margin": "md"
-                },
-                {
-                    "type": "separator",
-                    "margin": "lg"
-                },
-                {
-                    "type": "box",
-                    "layout": "horizontal",
-                    "margin": "md",
-                    "spacing": "md",
-                    "contents": [left_btn, right_btn]
-                }
-            ],
-            "paddingAll": "20px",
-            # "backgroundColor": "#FFFFFF",
-            # "cornerRadius": "10px"
-        }
+def _unsupported(conv: FlexConverter, node: ComponentNode, scope) -> dict:
+    return unsupported_component(node.type, node.id)
+
+
+# component type -> handler，按渲染方式分表（Column/Row 作为 element 时就是它的 box）
+HANDLERS: dict[str, dict[str, Handler]] = {
+    "box": {
+        "Column": _layout_box,
+        "Row": _layout_box,
+    },
+    "element": {
+        "Column": _layout_box,
+        "Row": _layout_box,
+        "Text": _text,
+        "Button": _button,
+        "Card": _card,
+        "Confirm": _confirm,
+    },
+}
+
+DEFAULT_HANDLERS: dict[str, Handler] = {
+    "box": _wrap_in_box,
+    "element": _unsupported,
+}
+
+# 需要转换子节点的 handler（generator function）
+CONTAINER_HANDLERS = frozenset(
+    h for h in [*DEFAULT_HANDLERS.values(), *(h for t in HANDLERS.values() for h in t.values())]
+    if inspect.isgeneratorfunction(h)
+)
+
+
+def component_to_flex_box(*, component_id: str, component: dict, surface: Surface, scope=None) -> dict:
+    return FlexConverter(surface).convert(component_id, "box", scope)
+
 
-    return unsupported_component(ctype, component_id)
+def component_to_flex_element(*, component_id: str, component: dict, surface: Surface, scope=None) -> dict:
+    return FlexConverter(surface).convert(component_id, "element", scope)
 
 
 def unsupported_component(component_type: str, component_id: str) -> dict:
@@ -258,43 +761,140 @@ def unsupported_component(component_type: str, component_id: str) -> dict:
     }
 
 
-def resolve_button_label(*, props: dict, surface: Surface) -> str:
-    child_id = props.get("child")
+def resolve_button_label(*, node: ComponentNode, surface: Surface, scope=None) -> str:
+    child_id = node.child
     if not child_id:
         return "Submit"
 
     child = surface.components.get(child_id)
-    if not child:
+    if child is None or child.type != "Text":
         return "Submit"
 
-    ctype, cprops = unwrap_component(child)
-    if ctype != "Text":
-        return "Submit"
-
-    v = resolve_a2ui_value(cprops.get("text"), surface.data_model)
+    v = resolve_prop(surface, child_id, child.props, "text", scope)
     return str(v or "Submit")
 
 
-def resolve_a2ui_value(v: dict | None, data_model: dict):
+def resolve_prop(surface: Surface, component_id: str, props: dict, name: str, scope=None):
+    # 绑定路径在 ingest 时已经编译好（Surface.bindings），这里直接按 segment 取值
+    v = props.get(name)
     if not v:
         return None
     if "literalString" in v:
         return v["literalString"]
     if "path" in v:
-        return resolve_json_pointer(data_model, v["path"])
+        ptr = surface.bindings.pointer(component_id, name)
+        if ptr is None:
+            out = resolve_path(surface, v["path"], scope)
+        else:
+            out = walk_json_pointer(surface.data_model, ptr)
+        # 绑定到整张 RecordTable 时按原来的 list of objects 取值，显示出来和存成 list 时一样
+        return out.tolist() if isinstance(out, RecordTable) else out
     return None
 
 
-def unwrap_component(component: dict) -> tuple[str, dict]:
-    keys = list(component.keys())
-    ctype = keys[0] if keys else "Unknown"
-    return ctype, component.get(ctype) or {}
+def resolve_path(surface: Surface, path, scope):
+    # 以 / 开头的是绝对路径；模板里不以 / 开头的路径相对于当前列表项
+    if not isinstance(path, str):
+        return None
+    if path.startswith("/") or scope is None:
+        return resolve_json_pointer(surface.data_model, path)
+    rel = path[2:] if path.startswith("./") else path
+    if rel in ("", "."):
+        return scope
+    return resolve_json_pointer(scope, "/" + rel)
+
+
+def resolve_a2ui_value(v: dict | None, data_model: dict):
+    if not v:
+        return None
+    if "literalString" in v:
+        return v["literalString"]
+    if "path" in v:
+        return resolve_json_pointer(data_model, v["path"])
+    return None
 
 
-def resolve_children_ids(children: dict | None) -> list[str]:
-    if not children:
-        return []
-    explicit = children.get("explicitList")
-    if isinstance(explicit, list):
-        return [str(x) for x in explicit]
-    return []
+def iter_template_items(surface: Surface, template: tuple[str, str | None], scope) -> Iterator[tuple[str, object]]:
+    # template = ComponentNode.template = (模板 component id, 绑定的列表路径)
+    # 逐项产出 (模板 component id, 列表项)，调用方够了就停，不会展开整个列表
+    cid, binding = template
+    if cid not in surface.components:
+        return
+    items = resolve_path(surface, binding, scope)
+    if isinstance(items, RecordTable):
+        for i in range(len(items)):
+            yield cid, items.row(i)
+    elif isinstance(items, list):
+        for item in items:
+            if item is not None:
+                yield cid, item
+
+
+_size_encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), default=json_default)
+# json.dumps 每次调用都要重新建一个 C encoder；预算记账对每个新节点都要算一次大小，直接复用同一个
+_c_size_encoder = (
+    c_make_encoder(None, json_default, encode_basestring, None, ":", ",", False, False, True)
+    if c_make_encoder is not None
+    else None
+)
+
+
+def json_size(node) -> int:
+    if _c_size_encoder is None:
+        out = _size_encoder.encode(node)
+    else:
+        out = "".join(_c_size_encoder(node, 0))
+    return len(out) if out.isascii() else len(out.encode("utf-8"))
+
+
+# 容器自身（不含子节点）的 JSON 字节数；容器的样式属性种类很少，按属性缓存
+_shell_sizes: dict[tuple, int] = {}
+
+
+def shell_size(node: dict) -> int:
+    key = tuple((k, v) for k, v in node.items() if k != "contents")
+    try:
+        return _shell_sizes[key]
+    except KeyError:
+        pass
+    except TypeError:  # 属性值不可 hash
+        return json_size({**node, "contents": []})
+    size = json_size({**node, "contents": []})
+    if len(_shell_sizes) < 1024:
+        _shell_sizes[key] = size
+    return size
+
+
+def count_nodes(node) -> int:
+    n = 1
+    contents = node.get("contents") if isinstance(node, dict) else None
+    if isinstance(contents, list):
+        for child in contents:
+            n += count_nodes(child)
+    return n
+
+
+def collect_texts(node, out: list[str]) -> None:
+    stack = [node]
+    while stack:
+        n = stack.pop()
+        if not isinstance(n, dict):
+            continue
+        if n.get("type") == "text" and n.get("text"):
+            out.append(str(n["text"]))
+        elif n.get("type") == "button":
+            label = (n.get("action") or {}).get("label")
+            if label:
+                out.append(f"[{label}]")
+        stack.extend(reversed(n.get("contents") or []))
+
+
+def degraded_text(alt_text: str, bodies: list[dict]) -> dict:
+    # degrade：布局放不下时，把已经生成的内容里的文字拼成一条纯文字消息
+    texts = [alt_text]
+    for body in bodies:
+        collect_texts(body, texts)
+    text = "\n".join(texts)
+    if len(text) > MAX_TEXT_CHARS:
+        text = text[: MAX_TEXT_CHARS - 1] + "…"
+    return line_text(text)
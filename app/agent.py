@@ -1,43 +1,23 @@
 from __future__ import annotations
 
-import re
+from app.a2ui_stream import A2UISource
+from app.card_templates import card_template, static_card
+from app.intent_router import Intent, IntentRouter
 
 
-
-
-async def decide_a2ui_response(*, user_text: str) -> list[dict]:
+async def decide_a2ui_response(*, user_text: str) -> A2UISource:
+    # 可以一次返回整个 list[dict]，也可以返回异步流（A2UI 消息 dict，或 JSONL / SSE 文本块），
+    # 流式时 main 收到第一个可以渲染的 surface 就回复，不用等整个回复生成完。这个 demo 总是一次给完。
     t = (user_text or "").strip()
 
-    if re.search(r"\b(hi|hello)\b", t, re.I) or re.search(r"你好|哈囉|嗨", t):
-        return hello_card()
-
-    if re.search(r"訂位|订位|book|reservation|餐廳|餐厅|restaurant", t, re.I):
-        return booking_form_like()
-
-    if re.search(r"carousel|list|列表|輪播|轮播", t, re.I):
-        return carousel_card()
-
-    if re.search(r"confirm|confirm.*|確認|确认", t, re.I):
-        return confirm_card()
-
-    if re.search(r"location|位置|where", t, re.I):
-        return location_card()
-
-    if re.search(r"audio|music|sound|音频|音乐", t, re.I):
-        return audio_card()
-
-    if re.search(r"video|movie|视频|电影", t, re.I):
-        return video_card()
-
-    if re.search(r"image|photo|picture|图片|照片", t, re.I):
-        return image_card()
-
-    if re.search(r"help|幫助|幫助|說明|说明", t, re.I):
-        return help_card()
+    intent = intent_router.route(t)
+    if intent is not None:
+        return intent.handler()
 
     return fallback_card(t)
 
 
+@static_card
 def hello_card() -> list[dict]:
     return [
         {
@@ -56,6 +36,7 @@ def hello_card() -> list[dict]:
     ]
 
 
+@static_card
 def help_card() -> list[dict]:
     return [
         {
@@ -81,6 +62,7 @@ def help_card() -> list[dict]:
     ]
 
 
+@static_card
 def booking_form_like() -> list[dict]:
     return [
         {
@@ -101,6 +83,7 @@ def booking_form_like() -> list[dict]:
     ]
 
 
+@static_card
 def carousel_card() -> list[dict]:
     return [
         {
@@ -139,6 +122,7 @@ def carousel_card() -> list[dict]:
     ]
 
 
+@static_card
 def confirm_card() -> list[dict]:
     return [
         {
@@ -157,6 +141,7 @@ def confirm_card() -> list[dict]:
     ]
 
 
+@static_card
 def location_card() -> list[dict]:
     return [
         {
@@ -181,6 +166,7 @@ def location_card() -> list[dict]:
     ]
 
 
+@static_card
 def audio_card() -> list[dict]:
     return [
         {
@@ -203,6 +189,7 @@ def audio_card() -> list[dict]:
     ]
 
 
+@static_card
 def video_card() -> list[dict]:
     return [
         {
@@ -225,6 +212,7 @@ def video_card() -> list[dict]:
     ]
 
 
+@static_card
 def image_card() -> list[dict]:
     return [
         {
@@ -247,6 +235,7 @@ def image_card() -> list[dict]:
     ]
 
 
+@card_template
 def fallback_card(user_text: str) -> list[dict]:
     return [
         {
@@ -262,3 +251,19 @@ def fallback_card(user_text: str) -> list[dict]:
         },
         {"beginRendering": {"surfaceId": "main", "root": "root"}},
     ]
+
+
+# 按优先级排列：越前面越优先（同一句话命中多个时取最前面的）。
+INTENTS = [
+    Intent("hello", hello_card, words=("hi", "hello"), keywords=("你好", "哈囉", "嗨")),
+    Intent("booking", booking_form_like, keywords=("訂位", "订位", "book", "reservation", "餐廳", "餐厅", "restaurant")),
+    Intent("carousel", carousel_card, keywords=("carousel", "list", "列表", "輪播", "轮播")),
+    Intent("confirm", confirm_card, keywords=("confirm", "確認", "确认")),
+    Intent("location", location_card, keywords=("location", "位置", "where")),
+    Intent("audio", audio_card, keywords=("audio", "music", "sound", "音频", "音乐")),
+    Intent("video", video_card, keywords=("video", "movie", "视频", "电影")),
+    Intent("image", image_card, keywords=("image", "photo", "picture", "图片", "照片")),
+    Intent("help", help_card, keywords=("help", "幫助", "說明", "说明")),
+]
+
+intent_router = IntentRouter(INTENTS)
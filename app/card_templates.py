@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import functools
+import inspect
+from typing import Any, Callable
+
+
+class FrozenDict(dict):
+    # 仍然是 dict（json / isinstance 照常工作），只是不允许原地修改，
+    # 这样同一份模板可以被所有请求、所有 session 共享。
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("A2UI card templates are shared and read-only; copy before modifying")
+
+    __setitem__ = __delitem__ = __ior__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+    def copy(self) -> dict:
+        return dict(self)
+
+    def __reduce__(self):
+        return (type(self), (dict(self),))
+
+
+class FrozenList(list):
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("A2UI card templates are shared and read-only; copy before modifying")
+
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _readonly
+    append = extend = insert = remove = pop = clear = sort = reverse = _readonly
+
+    def copy(self) -> list:
+        return list(self)
+
+    def __reduce__(self):
+        return (type(self), (list(self),))
+
+
+def freeze(obj: Any) -> Any:
+    if isinstance(obj, dict):
+        return FrozenDict((k, freeze(v)) for k, v in obj.items())
+    if isinstance(obj, list):
+        return FrozenList(freeze(v) for v in obj)
+    return obj
+
+
+def static_card(fn: Callable[[], list[dict]]) -> Callable[[], list[dict]]:
+    # 纯字面量的卡片：import 时构建一次，之后每次调用都返回同一份只读对象。
+    built = freeze(fn())
+
+    @functools.wraps(fn)
+    def wrapper() -> list[dict]:
+        return built
+
+    return wrapper
+
+
+class _Slot:
+    __slots__ = ("name",)
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+
+def _find_slots(obj: Any, path: tuple, out: list[tuple[str, tuple]]) -> None:
+    if isinstance(obj, _Slot):
+        out.append((obj.name, path))
+    elif isinstance(obj, dict):
+        for k, v in obj.items():
+            _find_slots(v, path + (k,), out)
+    elif isinstance(obj, list):
+        for i, v in enumerate(obj):
+            _find_slots(v, path + (i,), out)
+
+
+def card_template(fn: Callable[..., list[dict]]) -> Callable[..., list[dict]]:
+    # 带动态内容的卡片：import 时用占位符调用一次 fn 构建模板并记下每个参数出现的位置；
+    # 之后每次调用只复制从根到这些位置路径上的容器（copy-on-write），其余部分共享只读模板。
+    # 参数必须原样放进结构里（不能拼进字符串）。
+    params = list(inspect.signature(fn).parameters)
+    template = freeze(fn(*(_Slot(p) for p in params)))
+    slots: list[tuple[str, tuple]] = []
+    _find_slots(template, (), slots)
+    missing = set(params) - {name for name, _ in slots}
+    if missing:
+        raise ValueError(f"{fn.__name__}: parameters not placed as values in the card: {sorted(missing)}")
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs) -> list[dict]:
+        values = dict(zip(params, args), **kwargs)
+        root = list(template)
+        copied: dict[tuple, Any] = {(): root}
+        for name, path in slots:
+            parent = root
+            for i, key in enumerate(path[:-1]):
+                prefix = path[: i + 1]
+                child = copied.get(prefix)
+                if child is None:
+                    child = parent[key].copy()
+                    parent[key] = child
+                    copied[prefix] = child
+                parent = child
+            parent[path[-1]] = values[name]
+        return root
+
+    return wrapper
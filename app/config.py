@@ -23,15 +23,91 @@ def env_bool(name: str, default: bool = False) -> bool:
     return v.lower() in {"1", "true", "yes", "y"}
 
 
+def env_int(name: str, default: int) -> int:
+    v = env_str(name)
+    return int(v) if v is not None else default
+
+
+def env_float(name: str, default: float) -> float:
+    v = env_str(name)
+    return float(v) if v is not None else default
+
+
 class Settings:
     def __init__(self) -> None:
         load_env()
         self.port = int(env_str("PORT", "3000") or "3000")
         self.env = env_str("ENV", "development") or "development"
         self.allow_insecure_dev = env_bool("ALLOW_INSECURE_DEV", default=False)
+        self.workers = env_int("WEB_CONCURRENCY", 1)
+        # 一次 webhook 内最多同时处理多少个事件（同一对话内仍按顺序）
+        self.event_concurrency = env_int("EVENT_CONCURRENCY", 16)
+        # 已编码 LINE 消息的 LRU（按 surface 内容 hash），0 = 关闭
+        self.render_cache_max_entries = env_int("RENDER_CACHE_MAX_ENTRIES", 1024)
+        # Flex 转换预算：超出时 truncate / paginate / degrade（见 app/a2ui_to_flex.py FlexBudget）
+        self.flex_overflow = env_str("FLEX_OVERFLOW", "truncate") or "truncate"
+        self.flex_max_nodes = env_int("FLEX_MAX_NODES", 1000)
+        self.flex_max_depth = env_int("FLEX_MAX_DEPTH", 32)
+        # Carousel 超过一次 reply（5 条消息）能放下的 bubble 时：more（「更多」按钮）/ push（补发）
+        self.carousel_overflow = env_str("CAROUSEL_OVERFLOW", "more") or "more"
+        self.flex_max_pages = env_int("FLEX_MAX_PAGES", 20)
+        # 多个 surface 并发转换用的线程数；0 表示在 event loop 线程里直接转换
+        self.render_workers = env_int("RENDER_WORKERS", 4)
+
+        # agent + 渲染从开始处理起超过 REPLY_PLACEHOLDER_AFTER 秒还没结果时：
+        # text（先 reply 一句占位，结果用 push）/ loading（一对一聊天显示 loading 动画）/ off
+        self.reply_placeholder = env_str("REPLY_PLACEHOLDER", "text") or "text"
+        self.reply_placeholder_after = env_float("REPLY_PLACEHOLDER_AFTER", 3.0)
+        self.reply_placeholder_text = env_str("REPLY_PLACEHOLDER_TEXT", "處理中，請稍候…") or "處理中，請稍候…"
+        self.reply_loading_seconds = env_int("REPLY_LOADING_SECONDS", 20)
+
+        # sync: 处理完才回 200；queue: 入队后立刻回 200，后台 worker 处理
+        self.webhook_mode = env_str("WEBHOOK_MODE", "sync") or "sync"
+        self.work_queue_maxsize = env_int("WORK_QUEUE_MAXSIZE", 1000)
+        self.work_queue_workers = env_int("WORK_QUEUE_WORKERS", 4)
+        self.work_queue_spill_dir = env_str("WORK_QUEUE_SPILL_DIR")
+
+        # local: 进程内的 demo agent（app/agent.py）；a2a: 远程 A2A agent（JSON-RPC + SSE）
+        self.agent_backend = env_str("AGENT_BACKEND", "local") or "local"
+        self.a2a_agent_url = env_str("A2A_AGENT_URL", "http://localhost:3001/") or "http://localhost:3001/"
+        # 每次调用的超时（秒）；reply token 快过期时会更早取消
+        self.a2a_timeout = env_float("A2A_TIMEOUT", 20.0)
+        self.a2a_max_connections = env_int("A2A_MAX_CONNECTIONS", 100)
+        self.a2a_max_keepalive = env_int("A2A_MAX_KEEPALIVE", 20)
 
         self.line_channel_secret = env_str("LINE_CHANNEL_SECRET")
         self.line_channel_access_token = env_str("LINE_CHANNEL_ACCESS_TOKEN")
 
+        # LINE API HTTP client（可以指向本地 stand-in server 做测试/压测）
+        self.line_api_base_url = env_str("LINE_API_BASE_URL", "https://api.line.me") or "https://api.line.me"
+        self.line_http_timeout = env_float("LINE_HTTP_TIMEOUT", 10.0)
+        self.line_http_max_connections = env_int("LINE_HTTP_MAX_CONNECTIONS", 100)
+        self.line_http_max_keepalive = env_int("LINE_HTTP_MAX_KEEPALIVE", 20)
+        self.line_http_keepalive_expiry = env_float("LINE_HTTP_KEEPALIVE_EXPIRY", 30.0)
+        self.line_http2 = env_bool("LINE_HTTP2", default=False)
+
+        # 出站限流 / 重试 / 熔断
+        self.line_rate_limit_rps = env_float("LINE_RATE_LIMIT_RPS", 1000.0)
+        self.line_rate_limit_burst = env_float("LINE_RATE_LIMIT_BURST", 200.0)
+        # multicast 另有 200 req/s 的上限，单独限流
+        self.line_multicast_rate_limit_rps = env_float("LINE_MULTICAST_RATE_LIMIT_RPS", 200.0)
+        self.line_retry_max_attempts = env_int("LINE_RETRY_MAX_ATTEMPTS", 5)
+        self.line_retry_base_delay = env_float("LINE_RETRY_BASE_DELAY", 0.2)
+        self.line_retry_max_delay = env_float("LINE_RETRY_MAX_DELAY", 5.0)
+        # reply token 收到后大约 1 分钟内有效，超过这个窗口就不再重试
+        self.line_reply_window_seconds = env_float("LINE_REPLY_WINDOW_SECONDS", 50.0)
+        self.line_breaker_failures = env_int("LINE_BREAKER_FAILURES", 5)
+        self.line_breaker_reset_seconds = env_float("LINE_BREAKER_RESET_SECONDS", 10.0)
+
+        # Per-conversation A2UI session store
+        # memory: 单进程；sqlite/redis: 多个 uvicorn worker 共享
+        self.session_backend = env_str("SESSION_BACKEND", "memory") or "memory"
+        self.session_sqlite_path = env_str("SESSION_SQLITE_PATH", "a2ui_sessions.db") or "a2ui_sessions.db"
+        self.session_redis_url = env_str("SESSION_REDIS_URL", "redis://localhost:6379/0") or "redis://localhost:6379/0"
+        self.session_shards = env_int("SESSION_SHARDS", 16)
+        self.session_max_entries = env_int("SESSION_MAX_ENTRIES", 100_000)
+        self.session_max_bytes = env_int("SESSION_MAX_BYTES", 256 * 1024 * 1024)
+        self.session_ttl_seconds = env_float("SESSION_TTL_SECONDS", 1800.0)
+
 
 settings = Settings()
@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Awaitable, Callable, Hashable, Iterable, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+async def dispatch_keyed(
+    items: Iterable[T],
+    *,
+    key: Callable[[T], Hashable | None],
+    handler: Callable[[T], Awaitable[None]],
+    concurrency: int,
+) -> list[BaseException]:
+    # 同一个 key（同一个对话）内按顺序处理，不同 key 之间并发，总并发数受 semaphore 限制。
+    # 单个事件失败只记录下来，不影响其他事件。
+    sem = asyncio.Semaphore(max(1, concurrency))
+    groups: dict[Hashable, list[T]] = {}
+    for item in items:
+        k = key(item)
+        groups.setdefault(k if k is not None else object(), []).append(item)
+
+    errors: list[BaseException] = []
+
+    async def run_group(group: list[T]) -> None:
+        for item in group:
+            async with sem:
+                try:
+                    await handler(item)
+                except Exception as e:
+                    logger.exception("event handler failed")
+                    errors.append(e)
+
+    await asyncio.gather(*(run_group(g) for g in groups.values()))
+    return errors
@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Iterable
+
+import httpx
+
+from app.line_api import encode_messages, multicast_to_line, push_to_line
+
+logger = logging.getLogger(__name__)
+
+# LINE Messaging API 限制
+MAX_MULTICAST_RECIPIENTS = 500
+MAX_MESSAGES_PER_REQUEST = 5
+
+
+@dataclass
+class FanoutBatch:
+    to: list[str]
+    # 按顺序发送的多段消息，每段最多 5 条，已编码成 JSON 数组
+    chunks: list[bytes]
+
+
+@dataclass
+class ChunkResult:
+    # 一个请求（一批收件人 x 第 index 段消息）的结果；error 为 None 表示送出了
+    to: list[str]
+    index: int
+    error: BaseException | None = None
+
+
+@dataclass
+class FanoutResult:
+    chunks: list[ChunkResult] = field(default_factory=list)
+
+    @property
+    def requests(self) -> int:
+        return sum(1 for c in self.chunks if c.error is None)
+
+    @property
+    def failed(self) -> list[str]:
+        # 至少有一段没送到的收件人
+        out: dict[str, None] = {}
+        for c in self.chunks:
+            if c.error is not None:
+                out.update(dict.fromkeys(c.to))
+        return list(out)
+
+    @property
+    def recipients(self) -> int:
+        # 每一段都送到了的收件人数
+        delivered: dict[str, None] = {}
+        for c in self.chunks:
+            delivered.update(dict.fromkeys(c.to))
+        return len(delivered) - len(self.failed)
+
+    @property
+    def errors(self) -> list[BaseException]:
+        return [c.error for c in self.chunks if c.error is not None]
+
+
+def plan_fanout(deliveries: Iterable[tuple[str, list[dict | bytes]]]) -> list[FanoutBatch]:
+    # 渲染结果完全相同的收件人合并到同一组：每组消息只编码一次，再按 500 人切 multicast。
+    # 消息可以是 dict，也可以是已经编码好的单条消息 JSON（render cache 命中时）
+    groups: dict[bytes, tuple[list[dict | bytes], dict[str, None]]] = {}
+    # 同一个 messages 对象只编码一次（保留引用，避免 id 被复用）
+    encoded: dict[int, tuple[list[dict | bytes], bytes]] = {}
+    for user_id, messages in deliveries:
+        seen = encoded.get(id(messages))
+        if seen is None:
+            seen = encoded[id(messages)] = (messages, encode_messages(messages))
+        key = seen[1]
+        group = groups.get(key)
+        if group is None:
+            groups[key] = group = (messages, {})
+        group[1][user_id] = None
+
+    batches = []
+    for messages, recipient_set in groups.values():
+        recipients = list(recipient_set)
+        chunks = [
+            encode_messages(messages[i : i + MAX_MESSAGES_PER_REQUEST])
+            for i in range(0, len(messages), MAX_MESSAGES_PER_REQUEST)
+        ]
+        for i in range(0, len(recipients), MAX_MULTICAST_RECIPIENTS):
+            batches.append(FanoutBatch(to=recipients[i : i + MAX_MULTICAST_RECIPIENTS], chunks=chunks))
+    return batches
+
+
+async def fan_out(
+    deliveries: Iterable[tuple[str, list[dict | bytes]]],
+    *,
+    channel_access_token: str,
+    concurrency: int = 16,
+    client: httpx.AsyncClient | None = None,
+) -> FanoutResult:
+    # 不同收件人批次并发发送（每个请求仍经过 line_api 的限流/重试/熔断，multicast 有自己的限流），
+    # 同一批次内的多段消息按顺序发送。每段单独记结果：某一段失败不影响其它段和其它批次，
+    # 调用方可以只重发 FanoutResult 里失败的那些段。
+    result = FanoutResult()
+    sem = asyncio.Semaphore(max(1, concurrency))
+
+    async def send(batch: FanoutBatch) -> None:
+        for index, chunk in enumerate(batch.chunks):
+            outcome = ChunkResult(to=batch.to, index=index)
+            try:
+                async with sem:
+                    if len(batch.to) == 1:
+                        await push_to_line(
+                            channel_access_token=channel_access_token, to=batch.to[0], messages=chunk, client=client
+                        )
+                    else:
+                        await multicast_to_line(
+                            channel_access_token=channel_access_token, to=batch.to, messages=chunk, client=client
+                        )
+            except Exception as e:
+                logger.exception("fan-out chunk %d to %d recipients failed", index, len(batch.to))
+                outcome.error = e
+            result.chunks.append(outcome)
+
+    await asyncio.gather(*(send(b) for b in plan_fanout(deliveries)))
+    return result
+
+
+async def send_to_many(
+    recipients: Iterable[str],
+    messages: list[dict | bytes],
+    *,
+    channel_access_token: str,
+    concurrency: int = 16,
+    client: httpx.AsyncClient | None = None,
+) -> FanoutResult:
+    return await fan_out(
+        ((user_id, messages) for user_id in recipients),
+        channel_access_token=channel_access_token,
+        concurrency=concurrency,
+        client=client,
+    )
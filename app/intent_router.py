@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from typing import Callable, Iterable
+
+
+@dataclass(frozen=True)
+class Intent:
+    name: str
+    handler: Callable[[], list[dict]]
+    # 子串命中，不分大小写（中文关键词都放这里）
+    keywords: tuple[str, ...] = ()
+    # 整词命中，相当于 \bword\b
+    words: tuple[str, ...] = ()
+
+
+def _is_word_char(ch: str) -> bool:
+    return ch.isalnum() or ch == "_"
+
+
+class IntentRouter:
+    # 所有 intent 的关键词编译成一棵 trie，再展开成一个正则（同一前缀只比较一次，
+    # 分支首字符都是字面量，sre 可以快速跳过不可能命中的位置）。
+    #
+    # 优先级：注册顺序越靠前越优先，和原来逐条 re.search 的语义一致 ——
+    # 在任意位置命中的最高优先级 intent 胜出。每次命中后从 start + 1 继续找，
+    # 所以互相重叠的关键词（例如 "musicarousel"）也不会漏掉。
+    def __init__(self, intents: Iterable[Intent]) -> None:
+        self.intents = list(intents)
+
+        entries: dict[str, list[tuple[int, bool]]] = {}
+        for priority, intent in enumerate(self.intents):
+            for kw in intent.keywords:
+                entries.setdefault(kw.lower(), []).append((priority, False))
+            for w in intent.words:
+                w = w.lower()
+                if not (w and _is_word_char(w[0]) and _is_word_char(w[-1])):
+                    raise ValueError(f"Intent {intent.name!r}: word {w!r} must start and end with a word character")
+                entries.setdefault(w, []).append((priority, True))
+        if "" in entries:
+            raise ValueError("Empty keyword")
+
+        trie: dict = {}
+        for kw, kinds in entries.items():
+            node = trie
+            for ch in kw:
+                node = node.setdefault(ch, {})
+            node[""] = all(is_word for _, is_word in kinds)
+
+        self.pattern = re.compile(_trie_to_regex(trie, 0), re.DOTALL) if trie else None
+
+        # 命中的一定是该位置上最长的合法关键词 L；同一位置上其它命中都是 L 的前缀，
+        # 预先算好 L 的所有前缀里子串关键词的最高优先级，整词关键词运行时再检查边界。
+        self._plain: dict[str, int | None] = {}
+        self._words: dict[str, list[tuple[int, int]]] = {}
+        for kw in entries:
+            plain: int | None = None
+            words: list[tuple[int, int]] = []
+            for i in range(1, len(kw) + 1):
+                for priority, is_word in entries.get(kw[:i], ()):
+                    if not is_word:
+                        plain = priority if plain is None else min(plain, priority)
+                    elif i == len(kw) or not _is_word_char(kw[i]):
+                        words.append((priority, i))
+            self._plain[kw] = plain
+            self._words[kw] = sorted(words)
+
+    def route(self, text: str) -> Intent | None:
+        if self.pattern is None:
+            return None
+        low = text.lower()
+        best: int | None = None
+        m = self.pattern.search(low)
+        while m is not None:
+            start = m.start()
+            kw = m.group()
+            p = self._plain[kw]
+            for priority, length in self._words[kw]:
+                if p is not None and priority >= p:
+                    break
+                end = start + length
+                if (start == 0 or not _is_word_char(low[start - 1])) and (
+                    end == len(low) or not _is_word_char(low[end])
+                ):
+                    p = priority
+                    break
+            if p is not None and (best is None or p < best):
+                best = p
+                if best == 0:
+                    break
+            m = self.pattern.search(low, start + 1)
+        return self.intents[best] if best is not None else None
+
+
+def _trie_to_regex(node: dict, depth: int) -> str:
+    branches = [
+        re.escape(ch) + _trie_to_regex(child, depth + 1) for ch, child in sorted(node.items()) if ch != ""
+    ]
+    if "" in node:
+        # 先试更长的分支，都不行再在这里结束
+        if node[""]:
+            branches.append(rf"(?<!\w.{{{depth}}})(?!\w)")
+        else:
+            branches.append("")
+    if len(branches) == 1:
+        return branches[0]
+    return "(?:" + "|".join(branches) + ")"
@@ -1,32 +1,314 @@
 from __future__ import annotations
 
+import asyncio
 import base64
+import functools
 import hashlib
 import hmac
+import json
+import logging
+import time
+import uuid
 
 import httpx
 
+from app.resilience import CircuitBreaker, CircuitOpenError, RetryPolicy, TokenBucket, parse_retry_after
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BASE_URL = "https://api.line.me"
+
+# 整个进程共用一个连接池（由 FastAPI lifespan 打开/关闭），避免每次 reply 都重新 TCP+TLS 握手。
+_client: httpx.AsyncClient | None = None
+
+# 出站限流（每个 channel token 一个令牌桶）、429/5xx 重试、上游故障时熔断。
+# LINE 对个别 endpoint 另有更低的上限（multicast 200 req/s），这些 endpoint 各自单独一个令牌桶。
+retry_policy = RetryPolicy()
+breaker = CircuitBreaker()
+_rate_limit = (1000.0, 200.0)
+MULTICAST_PATH = "/v2/bot/message/multicast"
+_endpoint_rate_limits: dict[str, tuple[float, float]] = {MULTICAST_PATH: (200.0, 200.0)}
+_buckets: dict[tuple[str, str | None], TokenBucket] = {}
+counters = {
+    "requests": 0,
+    "retries": 0,
+    "throttled": 0,
+    "server_errors": 0,
+    "transport_errors": 0,
+    "failed": 0,
+}
+
+
+class LineApiError(RuntimeError):
+    def __init__(self, what: str, status_code: int, text: str) -> None:
+        super().__init__(f"LINE {what} failed: {status_code} {text}")
+        self.status_code = status_code
+
+
+@functools.lru_cache(maxsize=16)
+def _hmac_state(channel_secret: str) -> hmac.HMAC:
+    # key 处理（补齐 / ipad、opad 两轮）只做一次，之后每个请求 copy() 这个状态再 update(body)
+    return hmac.new(channel_secret.encode("utf-8"), digestmod=hashlib.sha256)
+
 
 def verify_line_signature(*, channel_secret: str, body: bytes, signature: str) -> bool:
-    mac = hmac.new(channel_secret.encode("utf-8"), body, hashlib.sha256).digest()
-    expected = base64.b64encode(mac).decode("ascii")
+    mac = _hmac_state(channel_secret).copy()
+    mac.update(body)
+    expected = base64.b64encode(mac.digest())
 
     try:
-        return hmac.compare_digest(expected, signature)
+        return hmac.compare_digest(expected, signature.encode("ascii"))
     except Exception:
         return False
 
 
-async def reply_to_line(*, channel_access_token: str, reply_token: str, messages: list[dict]) -> None:
-    url = "https://api.line.me/v2/bot/message/reply"
-    headers = {
+def create_line_client(
+    *,
+    base_url: str = DEFAULT_BASE_URL,
+    timeout: float = 10.0,
+    max_connections: int = 100,
+    max_keepalive_connections: int = 20,
+    keepalive_expiry: float = 30.0,
+    http2: bool = False,
+    transport: httpx.AsyncBaseTransport | None = None,
+) -> httpx.AsyncClient:
+    limits = httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_keepalive_connections,
+        keepalive_expiry=keepalive_expiry,
+    )
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            logger.warning('LINE_HTTP2=true but h2 is not installed (pip install -e ".[http2]"); using HTTP/1.1')
+            http2 = False
+    return httpx.AsyncClient(
+        base_url=base_url,
+        timeout=timeout,
+        limits=limits,
+        http2=http2,
+        transport=transport,
+    )
+
+
+async def open_line_client(**kwargs) -> httpx.AsyncClient:
+    global _client
+    await close_line_client()
+    _client = create_line_client(**kwargs)
+    return _client
+
+
+async def close_line_client() -> None:
+    global _client
+    if _client is not None:
+        client, _client = _client, None
+        await client.aclose()
+
+
+def get_line_client() -> httpx.AsyncClient:
+    # lifespan 之外（脚本 / 测试）第一次用到时用默认参数建一个。
+    global _client
+    if _client is None:
+        _client = create_line_client()
+    return _client
+
+
+@functools.lru_cache(maxsize=16)
+def auth_headers(channel_access_token: str) -> dict[str, str]:
+    return {
         "Authorization": f"Bearer {channel_access_token}",
         "Content-Type": "application/json",
     }
-    payload = {"replyToken": reply_token, "messages": messages}
 
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        r = await client.post(url, headers=headers, json=payload)
 
-    if r.status_code >= 300:
-        raise RuntimeError(f"LINE reply failed: {r.status_code} {r.text}")
+def encode_json(payload) -> bytes:
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def encode_messages(messages: list[dict | bytes]) -> bytes:
+    # 消息可以是 dict，也可以是已经编码好的单条消息 JSON（render cache 命中时）
+    return b"[" + b",".join(m if isinstance(m, bytes) else encode_json(m) for m in messages) + b"]"
+
+
+def configure_resilience(
+    *,
+    rate: float,
+    burst: float,
+    max_attempts: int,
+    base_delay: float,
+    max_delay: float,
+    window: float,
+    failure_threshold: int,
+    reset_timeout: float,
+    multicast_rate: float = 200.0,
+) -> None:
+    global retry_policy, breaker, _rate_limit
+    _rate_limit = (rate, burst)
+    _endpoint_rate_limits[MULTICAST_PATH] = (multicast_rate, min(burst, multicast_rate))
+    _buckets.clear()
+    retry_policy = RetryPolicy(max_attempts=max_attempts, base_delay=base_delay, max_delay=max_delay, window=window)
+    breaker = CircuitBreaker(failure_threshold=failure_threshold, reset_timeout=reset_timeout)
+
+
+def _bucket(channel_access_token: str, path: str) -> TokenBucket:
+    endpoint = path if path in _endpoint_rate_limits else None
+    key = (channel_access_token, endpoint)
+    bucket = _buckets.get(key)
+    if bucket is None:
+        rate, burst = _endpoint_rate_limits[endpoint] if endpoint is not None else _rate_limit
+        bucket = _buckets[key] = TokenBucket(rate=rate, burst=burst)
+    return bucket
+
+
+def resilience_stats() -> dict:
+    return {
+        **counters,
+        "rate_limited_waits": sum(b.waits for b in _buckets.values()),
+        "circuit": breaker.state,
+        "circuit_opened": breaker.opened,
+        "circuit_rejected": breaker.rejected,
+    }
+
+
+async def post_to_line(
+    path: str,
+    *,
+    channel_access_token: str,
+    body: bytes,
+    what: str,
+    deadline: float | None = None,
+    extra_headers: dict[str, str] | None = None,
+    client: httpx.AsyncClient | None = None,
+) -> httpx.Response:
+    client = client or get_line_client()
+    if deadline is None:
+        deadline = time.time() + retry_policy.window
+    headers = auth_headers(channel_access_token)
+    if extra_headers:
+        headers = {**headers, **extra_headers}
+
+    attempt = 0
+    while True:
+        if not breaker.allow():
+            raise CircuitOpenError(f"LINE {what} skipped: circuit open")
+        retry_after = None
+        try:
+            await _bucket(channel_access_token, path).acquire()
+            counters["requests"] += 1
+            r = await client.post(path, headers=headers, content=body)
+        except httpx.TransportError as e:
+            counters["transport_errors"] += 1
+            breaker.record_failure()
+            error: Exception = e
+        except BaseException:
+            # 等令牌或请求途中被取消 / 出了意料之外的错：没有结论，探测名额不能一直占着
+            breaker.release_probe()
+            raise
+        else:
+            if r.status_code < 300:
+                breaker.record_success()
+                return r
+            error = LineApiError(what, r.status_code, r.text)
+            if r.status_code == 429:
+                # 被限流说明上游是活的，不计入熔断
+                breaker.record_success()
+                counters["throttled"] += 1
+                retry_after = parse_retry_after(r.headers.get("Retry-After"))
+            elif r.status_code >= 500:
+                counters["server_errors"] += 1
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+                counters["failed"] += 1
+                raise error
+
+        attempt += 1
+        delay = retry_after if retry_after is not None else retry_policy.backoff(attempt)
+        if attempt >= retry_policy.max_attempts or time.time() + delay > deadline:
+            counters["failed"] += 1
+            raise error
+        counters["retries"] += 1
+        await asyncio.sleep(delay)
+
+
+async def reply_to_line(
+    *,
+    channel_access_token: str,
+    reply_token: str,
+    messages: list[dict | bytes],
+    deadline: float | None = None,
+    client: httpx.AsyncClient | None = None,
+) -> None:
+    body = b'{"replyToken":' + encode_json(reply_token) + b',"messages":' + encode_messages(messages) + b"}"
+    await post_to_line(
+        "/v2/bot/message/reply",
+        channel_access_token=channel_access_token,
+        body=body,
+        what="reply",
+        deadline=deadline,
+        client=client,
+    )
+
+
+async def push_to_line(
+    *,
+    channel_access_token: str,
+    to: str,
+    messages: list[dict] | bytes,
+    deadline: float | None = None,
+    client: httpx.AsyncClient | None = None,
+) -> None:
+    # messages 可以是已经编码好的 JSON 数组（fan-out 时同一份消息只编码一次）
+    encoded = messages if isinstance(messages, bytes) else encode_json(messages)
+    body = b'{"to":' + encode_json(to) + b',"messages":' + encoded + b"}"
+    await post_to_line(
+        "/v2/bot/message/push",
+        channel_access_token=channel_access_token,
+        body=body,
+        what="push",
+        deadline=deadline,
+        # 同一个 retry key 重试时 LINE 不会重复发送
+        extra_headers={"X-Line-Retry-Key": str(uuid.uuid4())},
+        client=client,
+    )
+
+
+async def start_loading_animation(
+    *,
+    channel_access_token: str,
+    chat_id: str,
+    seconds: int = 20,
+    client: httpx.AsyncClient | None = None,
+) -> None:
+    # 一对一聊天里显示 loading 动画，不占用 reply token；下一条消息送达时动画自动消失。
+    # loadingSeconds 只能是 5~60 之间 5 的倍数
+    seconds = min(60, max(5, seconds // 5 * 5))
+    await post_to_line(
+        "/v2/bot/chat/loading/start",
+        channel_access_token=channel_access_token,
+        body=b'{"chatId":' + encode_json(chat_id) + b',"loadingSeconds":' + str(seconds).encode("ascii") + b"}",
+        what="loading",
+        client=client,
+    )
+
+
+async def multicast_to_line(
+    *,
+    channel_access_token: str,
+    to: list[str],
+    messages: list[dict] | bytes,
+    deadline: float | None = None,
+    client: httpx.AsyncClient | None = None,
+) -> None:
+    encoded = messages if isinstance(messages, bytes) else encode_json(messages)
+    body = b'{"to":' + encode_json(to) + b',"messages":' + encoded + b"}"
+    await post_to_line(
+        MULTICAST_PATH,
+        channel_access_token=channel_access_token,
+        body=body,
+        what="multicast",
+        deadline=deadline,
+        extra_headers={"X-Line-Retry-Key": str(uuid.uuid4())},
+        client=client,
+    )
@@ -1,21 +1,126 @@
 from __future__ import annotations
 
-import json
+import asyncio
+import functools
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, Header, Request, Response
 from fastapi.responses import JSONResponse
+from pydantic import ValidationError
 from PIL import Image
 import io
 import os
 
+from app.a2a_client import A2AClient
 from app.a2ui_state import A2UIState, apply_a2ui_messages
-from app.a2ui_to_flex import a2ui_surface_to_line_flex, line_text
+from app.a2ui_stream import A2UISource, StreamIngest, iter_a2ui_messages
+from app.a2ui_to_flex import MAX_MESSAGES_PER_REPLY, FlexBudget, line_text, parse_more_postback
 from app.agent import decide_a2ui_response
 from app.config import settings
-from app.line_api import reply_to_line, verify_line_signature
+from app.dispatch import dispatch_keyed
+from app.fanout import fan_out
+from app.line_api import (
+    close_line_client,
+    configure_resilience,
+    open_line_client,
+    reply_to_line,
+    resilience_stats,
+    start_loading_animation,
+    verify_line_signature,
+)
+from app.render_cache import RenderCache
+from app.session_backend import create_session_backend
+from app.webhook_events import (
+    MessageEvent,
+    PostbackEvent,
+    WebhookEvent,
+    event_session_key,
+    events_from_json,
+    events_to_json,
+    parse_webhook,
+)
+from app.work_queue import WorkQueue
 
-app = FastAPI()
-state = A2UIState()
+logger = logging.getLogger(__name__)
+
+session_backend = create_session_backend(settings)
+render_cache = RenderCache(
+    max_entries=settings.render_cache_max_entries,
+    budget=FlexBudget(
+        max_nodes=settings.flex_max_nodes,
+        max_depth=settings.flex_max_depth,
+        overflow=settings.flex_overflow,
+        carousel_overflow=settings.carousel_overflow,
+        max_pages=settings.flex_max_pages,
+    ),
+)
+work_queue: WorkQueue | None = None
+# 大的 component 树在线程池里转换，不卡住 event loop；None 时直接在当前线程转换
+render_executor: ThreadPoolExecutor | None = None
+# AGENT_BACKEND=a2a 时的远程 agent client（共享连接池）；None 时用进程内的 demo agent
+a2a_client: A2AClient | None = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global work_queue, render_executor, a2a_client
+    await open_line_client(
+        base_url=settings.line_api_base_url,
+        timeout=settings.line_http_timeout,
+        max_connections=settings.line_http_max_connections,
+        max_keepalive_connections=settings.line_http_max_keepalive,
+        keepalive_expiry=settings.line_http_keepalive_expiry,
+        http2=settings.line_http2,
+    )
+    configure_resilience(
+        rate=settings.line_rate_limit_rps,
+        burst=settings.line_rate_limit_burst,
+        multicast_rate=settings.line_multicast_rate_limit_rps,
+        max_attempts=settings.line_retry_max_attempts,
+        base_delay=settings.line_retry_base_delay,
+        max_delay=settings.line_retry_max_delay,
+        window=settings.line_reply_window_seconds,
+        failure_threshold=settings.line_breaker_failures,
+        reset_timeout=settings.line_breaker_reset_seconds,
+    )
+    if settings.webhook_mode == 'queue':
+        work_queue = WorkQueue(
+            process_events,
+            maxsize=settings.work_queue_maxsize,
+            workers=settings.work_queue_workers,
+            spill_dir=settings.work_queue_spill_dir,
+            dump=events_to_json,
+            load=events_from_json,
+            key=event_session_key,
+        )
+        await work_queue.start()
+    if settings.render_workers > 0:
+        render_executor = ThreadPoolExecutor(max_workers=settings.render_workers, thread_name_prefix='render')
+    if settings.agent_backend == 'a2a':
+        a2a_client = A2AClient(
+            url=settings.a2a_agent_url,
+            timeout=settings.a2a_timeout,
+            max_connections=settings.a2a_max_connections,
+            max_keepalive_connections=settings.a2a_max_keepalive,
+        )
+    yield
+    if work_queue is not None:
+        await work_queue.stop()
+        work_queue = None
+    if render_executor is not None:
+        render_executor.shutdown(wait=True)
+        render_executor = None
+    if a2a_client is not None:
+        await a2a_client.aclose()
+        a2a_client = None
+    await close_line_client()
+    await session_backend.aclose()
+
+
+app = FastAPI(lifespan=lifespan)
 
 
 @app.get('/health')
@@ -23,6 +128,20 @@ async def health():
     return {"ok": True}
 
 
+@app.get('/metrics')
+async def metrics():
+    out = {
+        "sessions": session_backend.stats(),
+        "render_cache": render_cache.stats(),
+        "line_api": resilience_stats(),
+    }
+    if work_queue is not None:
+        out["work_queue"] = work_queue.stats()
+    if a2a_client is not None:
+        out["a2a"] = a2a_client.stats()
+    return out
+
+
 @app.post('/webhook')
 async def webhook(
     request: Request,
@@ -44,44 +163,244 @@ async def webhook(
         if not ok:
             return JSONResponse(status_code=401, content={"ok": False, "error": "Invalid signature"})
 
-    payload = json.loads(body.decode('utf-8'))
-    events = payload.get('events') or []
+    # 直接从 bytes 解析成类型化的事件，不处理的事件类型在这里就丢掉
+    try:
+        events = parse_webhook(body)
+    except ValidationError:
+        return JSONResponse(status_code=400, content={"ok": False, "error": "Invalid webhook payload"})
 
-    for ev in events:
-        await handle_event(ev)
+    if work_queue is not None:
+        if not work_queue.submit(events):
+            # 非 2xx 会让 LINE 之后重送（需在 Console 开启 webhook redelivery）
+            return JSONResponse(status_code=503, content={"ok": False, "error": "Queue full"})
+        return {"ok": True}
+
+    await process_events(events)
 
     return {"ok": True}
 
 
-async def handle_event(ev: dict) -> None:
-    if ev.get('type') != 'message':
+async def process_events(events: list[WebhookEvent]) -> None:
+    # 一次 webhook 只读写一次 session backend。
+    keys = {event_session_key(ev) for ev in events} - {None}
+    states = await session_backend.load_many(sorted(keys))
+
+    async def run(ev: WebhookEvent) -> None:
+        session_key = event_session_key(ev)
+        state = states.setdefault(session_key, A2UIState()) if session_key else A2UIState()
+        await handle_event(ev, state)
+
+    await dispatch_keyed(
+        events,
+        key=event_session_key,
+        handler=run,
+        concurrency=settings.event_concurrency,
+    )
+
+    await session_backend.save_many(states)
+
+
+async def handle_event(ev: WebhookEvent, state: A2UIState) -> None:
+    if not ev.reply_token:
         return
-    msg = ev.get('message') or {}
-    if msg.get('type') != 'text':
+
+    reply = EventReply(ev)
+    reply.start_timer()
+    try:
+        await respond(ev, state, reply)
+    finally:
+        await reply.close()
+
+
+async def respond(ev: WebhookEvent, state: A2UIState, reply: EventReply) -> None:
+    offset = 0
+    if isinstance(ev, MessageEvent):
+        msg = ev.message
+        if msg is None or msg.type != 'text':
+            return
+        user_text = msg.text or ''
+
+        if a2a_client is not None:
+            # 远程 agent 的回复是流；reply token 过期时这次调用也跟着取消
+            a2ui_messages = a2a_client.stream(
+                context_id=event_session_key(ev) or '',
+                text=user_text,
+                deadline=reply_deadline(ev),
+            )
+        else:
+            a2ui_messages = await decide_a2ui_response(user_text=user_text)
+        if not isinstance(a2ui_messages, list):
+            await reply_streamed(reply, state, a2ui_messages)
+            return
+        # 这一轮里 beginRendering 过的 surface 都渲染，合并进同一个 reply；
+        # 没有 beginRendering（只更新了数据）时照旧重画 main
+        surface_ids = apply_a2ui_messages(state, a2ui_messages) or ['main']
+    elif isinstance(ev, PostbackEvent):
+        # Carousel 的「更多」按钮：同一个 surface 从 offset 开始再渲染一页
+        more = parse_more_postback(ev.postback.data if ev.postback is not None else None)
+        if more is None:
+            return
+        surface_id, offset = more
+        surface_ids = [surface_id]
+    else:
         return
 
-    reply_token = ev.get('replyToken')
-    if not reply_token:
+    messages = await render_surfaces(state, surface_ids, offset=offset)
+    await reply.send(messages)
+
+
+async def reply_streamed(reply: EventReply, state: A2UIState, source: A2UISource) -> None:
+    # 流式 agent：边收边 apply。第一次有 surface 可以渲染时（beginRendering 和 root component 都到了）
+    # 马上把当时可以渲染的 surface 渲染好、用 reply token 回复，回复的同时继续 apply 后面的消息；
+    # 回复之后才开始渲染的 surface 等流结束再用 push 补发，已经回复过的 surface 的后续更新只留在 state 里。
+    ingest = StreamIngest(state)
+    replied: list[str] = []
+    reply_task: asyncio.Task | None = None
+    try:
+        async for msg in iter_a2ui_messages(source):
+            ingest.apply(msg)
+            if reply_task is None and (ready := ingest.ready()):
+                replied = ready
+                # 渲染的是这一刻的版本（Surface.render_view），之后 apply 的消息留给下次渲染
+                messages = await render_surfaces(state, ready)
+                reply_task = asyncio.create_task(reply.send(messages))
+    finally:
+        if reply_task is not None:
+            await reply_task
+
+    if reply_task is None:
+        # 整个流都没有可以渲染的 surface：和一次给完时一样，照旧重画 main
+        await reply.send(await render_surfaces(state, list(ingest.begun) or ['main']))
         return
 
-    user_text = msg.get('text') or ''
+    late = [sid for sid in ingest.ready() if sid not in replied]
+    if late and reply.to and settings.line_channel_access_token:
+        await push_messages(reply.to, await render_surfaces(state, late))
+
+
+class EventReply:
+    # 一个事件的回复出口。reply token 只能用一次，而且很快过期：
+    # 开始处理后 REPLY_PLACEHOLDER_AFTER 秒内 agent + 渲染还没给出结果时，
+    # text 模式先用 reply token 回一句占位文字，之后的结果改用 push 送出；
+    # loading 模式（只支持一对一聊天，群组/聊天室退回 text）显示 loading 动画，reply token 留着，
+    # 结果出来时 token 还在有效期内就照常 reply，过期了就 push。
+    def __init__(self, ev: WebhookEvent) -> None:
+        self.ev = ev
+        self.to = ev.source.push_target() if ev.source is not None else None
+        self.token_used = False
+        self.placeholder_sent = False
+        # settled：已经有结果要送了，计时器不再发占位
+        self.settled = False
+        self._firing = False
+        self._lock = asyncio.Lock()
+        self._timer: asyncio.Task | None = None
+
+    def start_timer(self) -> None:
+        after = settings.reply_placeholder_after
+        if settings.reply_placeholder not in ('text', 'loading') or after <= 0:
+            return
+        if not settings.line_channel_access_token:
+            return
+        # 按本机开始处理的时间计时：事件的 timestamp 是 LINE 那边的时钟，重送的事件还可能是很久以前的，
+        # 拿它计时会让快的 agent 也先回占位。timestamp 只用来判断 reply token 是否过期（reply_deadline）
+        self._timer = asyncio.create_task(self._placeholder(after))
+
+    async def _placeholder(self, after: float) -> None:
+        await asyncio.sleep(after)
+        if self.settled:
+            return
+        self._firing = True
+        async with self._lock:
+            if self.settled or self.token_used:
+                return
+            source = self.ev.source
+            if settings.reply_placeholder == 'loading' and source is not None and source.type == 'user' and source.user_id:
+                await start_loading_animation(
+                    channel_access_token=settings.line_channel_access_token,
+                    chat_id=source.user_id,
+                    seconds=settings.reply_loading_seconds,
+                )
+            else:
+                self.token_used = True
+                await reply_to_line(
+                    channel_access_token=settings.line_channel_access_token,
+                    reply_token=self.ev.reply_token,
+                    messages=[line_text(settings.reply_placeholder_text)],
+                    deadline=reply_deadline(self.ev),
+                )
+            self.placeholder_sent = True
+
+    async def send(self, messages: list[dict | bytes]) -> None:
+        self.settled = True
+        if not settings.line_channel_access_token:
+            # 开发时如果你只是想看 webhook 收到什么，可以先不配 token。
+            # 这里返回 200，避免 LINE 重试。
+            return
 
-    a2ui_messages = await decide_a2ui_response(user_text=user_text)
-    apply_a2ui_messages(state, a2ui_messages)
+        async with self._lock:
+            deadline = reply_deadline(self.ev)
+            expired = deadline is not None and time.time() >= deadline
+            if self.token_used or (expired and self.to):
+                if self.to:
+                    await push_messages(self.to, messages)
+                return
+            self.token_used = True
+            await reply_to_line(
+                channel_access_token=settings.line_channel_access_token,
+                reply_token=self.ev.reply_token,
+                messages=messages[:MAX_MESSAGES_PER_REPLY],
+                deadline=deadline,
+            )
 
-    surface = state.surfaces.get('main')
-    if surface is None:
-        out = line_text('No surface')
+        # 一次 reply 放不下的（carousel_overflow=push）按顺序用 push 补发
+        rest = messages[MAX_MESSAGES_PER_REPLY:]
+        if rest and self.to:
+            await push_messages(self.to, rest)
+
+    async def close(self) -> None:
+        self.settled = True
+        timer = self._timer
+        if timer is None:
+            return
+        if not self._firing:
+            timer.cancel()
+            return
+        # 占位已经在发的话等它发完；失败只记日志
+        try:
+            await timer
+        except Exception:
+            logger.exception("placeholder reply failed")
+
+
+async def push_messages(to: str, messages: list[dict | bytes]) -> None:
+    # 按 5 条一段依次 push；每段都会尝试，有段没送到时最后抛出第一个错误
+    result = await fan_out([(to, messages)], channel_access_token=settings.line_channel_access_token)
+    if result.errors:
+        raise result.errors[0]
+
+
+async def render_surfaces(state: A2UIState, surface_ids: list[str], *, offset: int = 0) -> list[dict | bytes]:
+    # 各个 surface 并发转换（在 render_executor 里），结果按 surface_ids 的顺序拼起来
+    surfaces = [(sid, state.surfaces.get(sid)) for sid in surface_ids]
+    surfaces = [(sid, s.render_view()) for sid, s in surfaces if s is not None]
+    if not surfaces:
+        return [line_text('No surface')]
+
+    def render(surface_id: str, surface) -> list[bytes]:
+        return render_cache.render(surface, alt_text='A2UI Demo', surface_id=surface_id, offset=offset)
+
+    if render_executor is None:
+        results = [render(sid, s) for sid, s in surfaces]
     else:
-        out = a2ui_surface_to_line_flex(surface=surface, alt_text='A2UI Demo')
+        loop = asyncio.get_running_loop()
+        results = await asyncio.gather(
+            *(loop.run_in_executor(render_executor, functools.partial(render, sid, s)) for sid, s in surfaces)
+        )
+    return [m for messages in results for m in messages]
 
-    if not settings.line_channel_access_token:
-        # 开发时如果你只是想看 webhook 收到什么，可以先不配 token。
-        # 这里返回 200，避免 LINE 重试。
-        return
 
-    await reply_to_line(
-        channel_access_token=settings.line_channel_access_token,
-        reply_token=reply_token,
-        messages=[out],
-    )
+def reply_deadline(ev: WebhookEvent) -> float | None:
+    ts = ev.timestamp
+    if ts is None:
+        return None
+    return ts / 1000 + settings.line_reply_window_seconds
@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+from typing import Any, Iterator
+
+# 少于这么多行的列表直接用普通 list，列式存储省不了多少
+MIN_ROWS = 4
+
+
+class RecordTable:
+    # 同构记录列表（每一行都是 key 相同、顺序相同的 object）的列式存储：
+    # 每个 key 一列 tuple，不为每一行单独建 dict。
+    # JSON pointer 取 /<i>/<key> 时直接索引对应的列；只有取整行时才临时拼出 dict。
+    __slots__ = ("keys", "columns", "_length")
+
+    def __init__(self, keys: tuple[str, ...], columns: dict[str, tuple]) -> None:
+        self.keys = keys
+        self.columns = columns
+        self._length = len(columns[keys[0]]) if keys else 0
+
+    @classmethod
+    def from_rows(cls, rows: list) -> RecordTable | None:
+        # 不是同构记录列表时返回 None（调用方继续用普通 list）
+        if len(rows) < MIN_ROWS:
+            return None
+        first = rows[0]
+        if not isinstance(first, dict) or not first:
+            return None
+        keys = tuple(first)
+        for row in rows:
+            if not isinstance(row, dict) or len(row) != len(keys) or tuple(row) != keys:
+                return None
+        return cls(keys, {k: tuple(row[k] for row in rows) for k in keys})
+
+    def __len__(self) -> int:
+        return self._length
+
+    def column(self, key: str) -> tuple | None:
+        return self.columns.get(key)
+
+    def row(self, i: int) -> dict:
+        return {k: self.columns[k][i] for k in self.keys}
+
+    def __iter__(self) -> Iterator[dict]:
+        for i in range(self._length):
+            yield self.row(i)
+
+    def with_row(self, i: int, row: dict) -> RecordTable | list:
+        # 换掉第 i 行，返回新的表（原表不变）；新行的 key 和表不一致时退回普通 list
+        if isinstance(row, dict) and tuple(row) == self.keys:
+            return RecordTable(self.keys, {k: col[:i] + (row[k],) + col[i + 1 :] for k, col in self.columns.items()})
+        rows = self.tolist()
+        rows[i] = row
+        return rows
+
+    def tolist(self) -> list[dict]:
+        return list(self)
+
+    def compact(self) -> list:
+        return [list(self.keys), [list(self.columns[k]) for k in self.keys]]
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, RecordTable):
+            return self.keys == other.keys and self.columns == other.columns
+        if isinstance(other, list):
+            return self.tolist() == other
+        return NotImplemented
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def __repr__(self) -> str:
+        return f"RecordTable(keys={self.keys!r}, rows={self._length})"
+
+
+def json_default(obj: Any) -> Any:
+    # json.dumps(default=...)：RecordTable 按普通的 list of objects 编码；
+    # 有 to_json() 的只读结构（a2ui_state.ComponentNode）按它还原出的 A2UI 写法编码
+    if isinstance(obj, RecordTable):
+        return obj.tolist()
+    to_json = getattr(obj, "to_json", None)
+    if to_json is not None:
+        return to_json()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def compact_records(obj: Any) -> Any:
+    # 从 JSON 读回来的数据（session 反序列化）里，把同构记录列表重新转成 RecordTable
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            if isinstance(v, (dict, list)):
+                obj[k] = compact_records(v)
+        return obj
+    if isinstance(obj, list):
+        for i, v in enumerate(obj):
+            if isinstance(v, (dict, list)):
+                obj[i] = compact_records(v)
+        table = RecordTable.from_rows(obj)
+        return table if table is not None else obj
+    return obj
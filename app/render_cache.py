@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from app.a2ui_state import ComponentNode, Surface
+from app.a2ui_to_flex import FlexBudget, a2ui_surface_to_line_messages
+from app.card_templates import FrozenDict, FrozenList
+from app.line_api import encode_json
+from app.record_table import json_default
+
+
+def content_digest(obj) -> bytes:
+    # 只读模板（agent 的 static_card）和 ComponentNode 内容不会变，digest 算一次后缓存在对象上。
+    digest = getattr(obj, "_content_digest", None)
+    if digest is not None:
+        return digest
+    raw = json.dumps(obj, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=json_default).encode(
+        "utf-8"
+    )
+    digest = hashlib.blake2b(raw, digest_size=16).digest()
+    if isinstance(obj, (FrozenDict, FrozenList, ComponentNode)):
+        obj._content_digest = digest
+    return digest
+
+
+def surface_fingerprint(surface: Surface, alt_text: str, surface_id: str = "main", offset: int = 0) -> bytes:
+    # 稳定的内容 hash：同样的 components / dataModel / root / altText（以及翻页位置）一定得到同样的 key，
+    # 与 components 的插入顺序无关。
+    h = hashlib.blake2b(repr((surface.root, alt_text, surface_id, offset)).encode("utf-8"), digest_size=16)
+    components = surface.components
+    for cid in sorted(components):
+        h.update(b"\0%d:%s" % (len(cid), cid.encode("utf-8")))
+        h.update(content_digest(components[cid]))
+    if surface.data_model:
+        h.update(content_digest(surface.data_model))
+    return h.digest()
+
+
+class RenderCache:
+    # surface 内容 hash -> 已经编码好的 LINE message JSON（每条消息一份 bytes）。
+    # 命中时跳过 Flex 转换和 JSON 编码，直接把 bytes 拼进 reply 请求。
+    def __init__(self, *, max_entries: int = 1024, budget: FlexBudget | None = None) -> None:
+        self.max_entries = max_entries
+        self.budget = budget
+        self._entries: OrderedDict[bytes, list[bytes]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def render(self, surface: Surface, *, alt_text: str, surface_id: str = "main", offset: int = 0) -> list[bytes]:
+        if self.max_entries <= 0:
+            return self._convert(surface, alt_text, surface_id, offset)
+
+        key = surface_fingerprint(surface, alt_text, surface_id, offset)
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return data
+            self.misses += 1
+
+        data = self._convert(surface, alt_text, surface_id, offset)
+        with self._lock:
+            self._entries[key] = data
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return data
+
+    def _convert(self, surface: Surface, alt_text: str, surface_id: str, offset: int) -> list[bytes]:
+        messages = a2ui_surface_to_line_messages(
+            surface=surface, alt_text=alt_text, budget=self.budget, surface_id=surface_id, offset=offset
+        )
+        return [encode_json(m) for m in messages]
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
@@ -0,0 +1,291 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from typing import Iterable
+
+from app.a2ui_state import A2UIState, Surface
+from app.record_table import compact_records, json_default
+from app.session_store import SessionStore
+
+logger = logging.getLogger(__name__)
+
+# 序列化格式：1 字节标记 + 紧凑 JSON，较大的 state 再用 zlib 压缩。
+_RAW = b"j"
+_ZLIB = b"z"
+_COMPRESS_THRESHOLD = 512
+
+
+def encode_state(state: A2UIState) -> bytes:
+    doc = {sid: [s.root, s.components, s.data_model] for sid, s in state.surfaces.items()}
+    raw = json.dumps(doc, separators=(",", ":"), ensure_ascii=False, default=json_default).encode("utf-8")
+    if len(raw) > _COMPRESS_THRESHOLD:
+        return _ZLIB + zlib.compress(raw, 1)
+    return _RAW + raw
+
+
+def decode_state(data: bytes) -> A2UIState:
+    tag, body = data[:1], data[1:]
+    if tag == _ZLIB:
+        body = zlib.decompress(body)
+    elif tag != _RAW:
+        raise ValueError(f"Unknown session encoding: {tag!r}")
+    doc = json.loads(body)
+    state = A2UIState()
+    for sid, (root, components, data_model) in doc.items():
+        # RecordTable 按普通 list 存，读回来时再转成列式
+        state.surfaces[sid] = Surface(components=components, data_model=compact_records(data_model), root=root)
+    return state
+
+
+def _apply_saved_versions(states: dict[str, A2UIState], saved: dict[str, int]) -> int:
+    # 写入成功的 state 记下新版本（同一个对象之后还能接着保存）；返回因为版本冲突没写入的个数
+    for key, version in saved.items():
+        states[key].version = version
+    conflicts = [key for key in states if key not in saved]
+    if conflicts:
+        logger.warning("session changed by another worker since it was loaded; not saving %s", conflicts)
+    return len(conflicts)
+
+
+class SessionBackend(ABC):
+    # 多个进程共用的 backend（sqlite / redis）按版本做 compare-and-set：load_many 记下读到的版本
+    # （A2UIState.version），save_many 只在存储里的版本没变时才写入。两个进程同时处理同一个对话时
+    # 先保存的生效，后保存的那份不写（记在 stats 的 conflicts 里并打 warning），不会悄悄覆盖掉对方的改动。
+    @abstractmethod
+    async def load_many(self, keys: Iterable[str]) -> dict[str, A2UIState]: ...
+
+    @abstractmethod
+    async def save_many(self, states: dict[str, A2UIState]) -> None: ...
+
+    @abstractmethod
+    async def delete(self, key: str) -> None: ...
+
+    def stats(self) -> dict:
+        return {}
+
+    async def aclose(self) -> None:
+        return None
+
+
+class MemorySessionBackend(SessionBackend):
+    # 单进程：直接保存活对象，不做序列化，也不需要版本检查（同一个对话在进程内读到的是同一个对象）。
+    def __init__(self, store: SessionStore | None = None) -> None:
+        self.store = store if store is not None else SessionStore()
+
+    async def load_many(self, keys: Iterable[str]) -> dict[str, A2UIState]:
+        out: dict[str, A2UIState] = {}
+        for key in keys:
+            state = self.store.get(key)
+            if state is not None:
+                out[key] = state
+        return out
+
+    async def save_many(self, states: dict[str, A2UIState]) -> None:
+        for key, state in states.items():
+            self.store.put(key, state)
+
+    async def delete(self, key: str) -> None:
+        self.store.delete(key)
+
+    def stats(self) -> dict:
+        return {"backend": "memory", **self.store.stats()}
+
+
+class SqliteSessionBackend(SessionBackend):
+    def __init__(self, path: str, *, ttl_seconds: float = 1800.0) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.conflicts = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS a2ui_sessions "
+            "(key TEXT PRIMARY KEY, data BLOB NOT NULL, touched REAL NOT NULL, version INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS a2ui_sessions_touched ON a2ui_sessions (touched)")
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(a2ui_sessions)")}
+        if "version" not in columns:
+            # 旧版本建的表：补上 version 列（另一个进程可能同时在补）
+            try:
+                self._conn.execute("ALTER TABLE a2ui_sessions ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+            except sqlite3.OperationalError:
+                pass
+
+    def _load_many(self, keys: list[str]) -> dict[str, A2UIState]:
+        if not keys:
+            return {}
+        cutoff = time.time() - self.ttl_seconds
+        marks = ",".join("?" * len(keys))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT key, data, version FROM a2ui_sessions WHERE key IN ({marks}) AND touched >= ?",
+                [*keys, cutoff],
+            ).fetchall()
+        out = {}
+        for key, data, version in rows:
+            out[key] = state = decode_state(data)
+            state.version = version
+        self.hits += len(out)
+        self.misses += len(keys) - len(out)
+        return out
+
+    def _save_many(self, states: dict[str, A2UIState]) -> None:
+        if not states:
+            return
+        now = time.time()
+        cutoff = now - self.ttl_seconds
+        encoded = {key: encode_state(state) for key, state in states.items()}
+        marks = ",".join("?" * len(states))
+        saved: dict[str, int] = {}
+        with self._lock:
+            # IMMEDIATE：一开始就拿写锁，读版本和写入之间别的进程插不进来
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                current = {
+                    key: (version, touched)
+                    for key, version, touched in self._conn.execute(
+                        f"SELECT key, version, touched FROM a2ui_sessions WHERE key IN ({marks})", list(states)
+                    )
+                }
+                rows = []
+                for key, state in states.items():
+                    version, touched = current.get(key, (0, 0.0))
+                    # 已经过期的行读的时候当作不存在（版本 0），版本号照样往上加，不会回到旧值
+                    if (version if touched >= cutoff else 0) != state.version:
+                        continue
+                    saved[key] = version + 1
+                    rows.append((key, encoded[key], now, version + 1))
+                self._conn.executemany(
+                    "INSERT INTO a2ui_sessions (key, data, touched, version) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET "
+                    "data = excluded.data, touched = excluded.touched, version = excluded.version",
+                    rows,
+                )
+                self._conn.execute("DELETE FROM a2ui_sessions WHERE touched < ?", (cutoff,))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        self.conflicts += _apply_saved_versions(states, saved)
+
+    def _delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM a2ui_sessions WHERE key = ?", (key,))
+
+    async def load_many(self, keys: Iterable[str]) -> dict[str, A2UIState]:
+        return await asyncio.to_thread(self._load_many, list(keys))
+
+    async def save_many(self, states: dict[str, A2UIState]) -> None:
+        await asyncio.to_thread(self._save_many, states)
+
+    async def delete(self, key: str) -> None:
+        await asyncio.to_thread(self._delete, key)
+
+    def stats(self) -> dict:
+        return {"backend": "sqlite", "hits": self.hits, "misses": self.misses, "conflicts": self.conflicts}
+
+    async def aclose(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class RedisSessionBackend(SessionBackend):
+    # client 需要兼容 redis.asyncio.Redis（测试里可以换成 fakeredis）。
+    # 每个 session 两个 key：<prefix><key> 存编码后的 state，<prefix><key>:v 存版本号，TTL 相同。
+    def __init__(self, client, *, ttl_seconds: float = 1800.0, prefix: str = "a2ui:session:") -> None:
+        self.client = client
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+        self.conflicts = 0
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs) -> RedisSessionBackend:
+        try:
+            from redis.asyncio import Redis
+        except ImportError as e:
+            raise RuntimeError('SESSION_BACKEND=redis requires: pip install -e ".[redis]"') from e
+        return cls(Redis.from_url(url), **kwargs)
+
+    async def load_many(self, keys: Iterable[str]) -> dict[str, A2UIState]:
+        keys = list(keys)
+        if not keys:
+            return {}
+        names = [self.prefix + k for k in keys]
+        values = await self.client.mget(names + [name + ":v" for name in names])
+        out = {}
+        for key, data, version in zip(keys, values, values[len(keys):]):
+            if data is not None:
+                out[key] = state = decode_state(data)
+                state.version = int(version or 0)
+        self.hits += len(out)
+        self.misses += len(keys) - len(out)
+        return out
+
+    async def save_many(self, states: dict[str, A2UIState]) -> None:
+        if not states:
+            return
+        from redis.exceptions import WatchError
+
+        ttl = max(1, int(self.ttl_seconds))
+        encoded = {key: encode_state(state) for key, state in states.items()}
+        versions = [self.prefix + key + ":v" for key in states]
+        async with self.client.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    # WATCH 之后读到的版本一直有效到 EXEC；中间有别的进程写了就 WatchError，重新比较
+                    await pipe.watch(*versions)
+                    current = await pipe.mget(versions)
+                    saved = {
+                        key: int(version or 0) + 1
+                        for key, version in zip(states, current)
+                        if int(version or 0) == states[key].version
+                    }
+                    pipe.multi()
+                    for key, version in saved.items():
+                        pipe.set(self.prefix + key, encoded[key], ex=ttl)
+                        pipe.set(self.prefix + key + ":v", version, ex=ttl)
+                    await pipe.execute()
+                    break
+                except WatchError:
+                    continue
+        self.conflicts += _apply_saved_versions(states, saved)
+
+    async def delete(self, key: str) -> None:
+        await self.client.delete(self.prefix + key, self.prefix + key + ":v")
+
+    def stats(self) -> dict:
+        return {"backend": "redis", "hits": self.hits, "misses": self.misses, "conflicts": self.conflicts}
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+
+def create_session_backend(settings) -> SessionBackend:
+    kind = settings.session_backend
+    if kind == "memory":
+        return MemorySessionBackend(
+            SessionStore(
+                shards=settings.session_shards,
+                max_entries=settings.session_max_entries,
+                max_bytes=settings.session_max_bytes,
+                ttl_seconds=settings.session_ttl_seconds,
+            )
+        )
+    if kind == "sqlite":
+        return SqliteSessionBackend(settings.session_sqlite_path, ttl_seconds=settings.session_ttl_seconds)
+    if kind == "redis":
+        return RedisSessionBackend.from_url(settings.session_redis_url, ttl_seconds=settings.session_ttl_seconds)
+    raise ValueError(f"Unknown SESSION_BACKEND: {kind}")
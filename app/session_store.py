@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable
+
+from app.a2ui_state import A2UIState
+
+
+# 估算的是进程里占的内存，不只是编码长度（常数按 tracemalloc 实测取整）：
+# 每个 component 除了编码长度，还有 ComponentNode、props dict 和 components / parents / bindings 表项，约 1 KB；
+# Flex 缓存按 flex_stats 记下的子树字节数，再加上每项约 250 B 的 dict 和 key 开销；
+# 不用截断的渲染不逐个记子树大小（见 FlexConverter.convert），这些项按平均约 400 B 算。
+_COMPONENT_OVERHEAD = 1000
+_FLEX_ENTRY_OVERHEAD = 250
+_FLEX_ENTRY_UNSIZED = 400
+
+
+def estimate_state_bytes(state: A2UIState) -> int:
+    # 每个 surface 的编码长度在 ingest 时增量维护（Surface.approx_bytes），保存时不用把整个 state 重新编码一遍
+    total = 0
+    for sid, s in state.surfaces.items():
+        total += len(sid) + len(s.root or "") + s.approx_bytes() + len(s.components) * _COMPONENT_OVERHEAD
+        stats = list(s.flex_stats.values())  # 渲染线程可能同时在写
+        entries = len(s.flex_cache)
+        total += sum(nbytes for nbytes, _ in stats) + entries * _FLEX_ENTRY_OVERHEAD
+        total += max(0, entries - len(stats)) * _FLEX_ENTRY_UNSIZED
+    return total
+
+
+@dataclass
+class _Entry:
+    state: A2UIState
+    size: int
+    touched: float
+
+
+class _Shard:
+    def __init__(self, *, max_entries: int, max_bytes: int) -> None:
+        self.lock = threading.Lock()
+        self.entries: OrderedDict[str, _Entry] = OrderedDict()
+        self.bytes = 0
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def remove(self, key: str) -> _Entry | None:
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry.size
+        return entry
+
+    def expire(self, now: float, ttl: float) -> None:
+        # entries 按最近使用排序，过期的一定在队头。
+        while self.entries:
+            key, entry = next(iter(self.entries.items()))
+            if now - entry.touched < ttl:
+                break
+            self.remove(key)
+            self.expirations += 1
+
+    def shrink(self) -> None:
+        while self.entries and (len(self.entries) > self.max_entries or self.bytes > self.max_bytes):
+            key = next(iter(self.entries))
+            self.remove(key)
+            self.evictions += 1
+
+
+class SessionStore:
+    def __init__(
+        self,
+        *,
+        shards: int = 16,
+        max_entries: int = 100_000,
+        max_bytes: int = 256 * 1024 * 1024,
+        ttl_seconds: float = 1800.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        shards = max(1, shards)
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self.shards = [
+            _Shard(max_entries=max(1, max_entries // shards), max_bytes=max(1, max_bytes // shards))
+            for _ in range(shards)
+        ]
+
+    def _shard(self, key: str) -> _Shard:
+        return self.shards[hash(key) % len(self.shards)]
+
+    def get(self, key: str) -> A2UIState | None:
+        shard = self._shard(key)
+        now = self.clock()
+        with shard.lock:
+            shard.expire(now, self.ttl_seconds)
+            entry = shard.entries.get(key)
+            if entry is None:
+                shard.misses += 1
+                return None
+            shard.hits += 1
+            entry.touched = now
+            shard.entries.move_to_end(key)
+            return entry.state
+
+    def get_or_create(self, key: str) -> A2UIState:
+        state = self.get(key)
+        if state is None:
+            state = A2UIState()
+            self.put(key, state)
+        return state
+
+    def put(self, key: str, state: A2UIState) -> None:
+        size = estimate_state_bytes(state)
+        shard = self._shard(key)
+        now = self.clock()
+        with shard.lock:
+            shard.remove(key)
+            shard.entries[key] = _Entry(state=state, size=size, touched=now)
+            shard.bytes += size
+            shard.expire(now, self.ttl_seconds)
+            shard.shrink()
+
+    def delete(self, key: str) -> None:
+        shard = self._shard(key)
+        with shard.lock:
+            shard.remove(key)
+
+    def __len__(self) -> int:
+        return sum(len(s.entries) for s in self.shards)
+
+    def stats(self) -> dict:
+        out = {"entries": 0, "bytes": 0, "hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+        for s in self.shards:
+            with s.lock:
+                out["entries"] += len(s.entries)
+                out["bytes"] += s.bytes
+                out["hits"] += s.hits
+                out["misses"] += s.misses
+                out["evictions"] += s.evictions
+                out["expirations"] += s.expirations
+        return out
@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+from dataclasses import field
+from typing import Annotated, Literal, Union
+
+from pydantic import ConfigDict, Field, TypeAdapter
+from pydantic.dataclasses import dataclass
+
+# LINE webhook 事件的类型化结构（pydantic dataclass，__slots__，没有实例 __dict__）。
+# 请求体的原始 bytes 直接交给 pydantic-core 解析 + 校验，不经过 json.loads 生成的中间 dict；
+# 只保留处理时用得到的字段，其余字段（emojis / mention / deliveryContext ...）解析时直接跳过。
+# 不处理的事件类型（follow / join / memberJoined ...）按 type 分派成只有 type 的空结构，随后丢掉。
+
+_CONFIG = ConfigDict(populate_by_name=True)
+
+
+@dataclass(slots=True, config=_CONFIG)
+class Source:
+    type: str = "user"
+    user_id: Annotated[str | None, Field(alias="userId")] = None
+    group_id: Annotated[str | None, Field(alias="groupId")] = None
+    room_id: Annotated[str | None, Field(alias="roomId")] = None
+
+    def session_key(self) -> str | None:
+        # 群组/聊天室里所有成员共享同一份 UI，一对一聊天按 userId 隔离
+        if self.group_id:
+            return f"group:{self.group_id}"
+        if self.room_id:
+            return f"room:{self.room_id}"
+        if self.user_id:
+            return f"user:{self.user_id}"
+        return None
+
+    def push_target(self) -> str | None:
+        return self.group_id or self.room_id or self.user_id
+
+
+@dataclass(slots=True, config=_CONFIG)
+class Message:
+    type: str
+    id: str | None = None
+    text: str | None = None
+
+
+@dataclass(slots=True, config=_CONFIG)
+class Postback:
+    data: str = ""
+
+
+@dataclass(slots=True, config=_CONFIG)
+class MessageEvent:
+    type: Literal["message"]
+    reply_token: Annotated[str | None, Field(alias="replyToken")] = None
+    timestamp: int | None = None
+    source: Source | None = None
+    message: Message | None = None
+
+
+@dataclass(slots=True, config=_CONFIG)
+class PostbackEvent:
+    type: Literal["postback"]
+    reply_token: Annotated[str | None, Field(alias="replyToken")] = None
+    timestamp: int | None = None
+    source: Source | None = None
+    postback: Postback | None = None
+
+
+# LINE 文档里列出的、这里不处理的事件类型
+IGNORED_EVENT_TYPES = (
+    "follow",
+    "unfollow",
+    "join",
+    "leave",
+    "memberJoined",
+    "memberLeft",
+    "beacon",
+    "accountLink",
+    "things",
+    "unsend",
+    "videoPlayComplete",
+    "activated",
+    "deactivated",
+    "botSuspended",
+    "botResumed",
+    "module",
+    "delivery",
+)
+
+
+@dataclass(slots=True, config=_CONFIG)
+class IgnoredEvent:
+    type: Literal[IGNORED_EVENT_TYPES]
+
+
+@dataclass(slots=True, config=_CONFIG)
+class OtherEvent:
+    type: str
+
+
+WebhookEvent = Union[MessageEvent, PostbackEvent]
+
+
+# 先按 type 直接分派（一次查表）；上面没列出的新事件类型在查表失败后落到 OtherEvent，
+# 同一次解析里完成，不会因为一个新类型把整个请求体再解析一遍
+_AnyEvent = Annotated[
+    Union[
+        Annotated[Union[MessageEvent, PostbackEvent, IgnoredEvent], Field(discriminator="type")],
+        OtherEvent,
+    ],
+    Field(union_mode="left_to_right"),
+]
+
+
+@dataclass(slots=True, config=_CONFIG)
+class WebhookBody:
+    events: list[_AnyEvent] = field(default_factory=list)
+
+
+_body_adapter = TypeAdapter(WebhookBody)
+_events_adapter = TypeAdapter(list[_AnyEvent])
+
+
+def parse_webhook(body: bytes) -> list[WebhookEvent]:
+    # 格式不对时抛 pydantic.ValidationError
+    events = _body_adapter.validate_json(body).events
+    return [ev for ev in events if isinstance(ev, (MessageEvent, PostbackEvent))]
+
+
+def events_from_json(events: list[dict]) -> list[WebhookEvent]:
+    return [ev for ev in _events_adapter.validate_python(events) if isinstance(ev, (MessageEvent, PostbackEvent))]
+
+
+def events_to_json(events: list[WebhookEvent]) -> list[dict]:
+    # 落盘（WorkQueue spill）用：按 LINE 原来的字段名输出，events_from_json 可以读回来
+    return _events_adapter.dump_python(events, mode="json", by_alias=True, exclude_none=True)
+
+
+def event_session_key(ev: WebhookEvent) -> str | None:
+    return ev.source.session_key() if ev.source is not None else None
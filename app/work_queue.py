@@ -0,0 +1,223 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+
+def _pid_alive(pid: int) -> bool:
+    if pid == os.getpid():
+        return False  # 本进程刚启动，之前用同一个 pid 认领的不可能还在处理
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class WorkQueue:
+    # webhook 先验签、入队、立刻回 200；worker 在后台跑 agent / 转换 / reply。
+    # 队列满时：配置了 spill_dir 就落盘，否则丢弃（计入 dropped）。
+    # 事件不是普通 JSON 对象时，dump / load 负责和可以 JSON 编码的值互相转换（落盘 / 读回）。
+    # 顺序：落盘的批次没读回来之前，新的批次也先落盘，整体仍按提交顺序处理；
+    # 给了 key（事件 -> 对话 key）时，含有同一个对话的批次按出队顺序一个接一个处理，不同对话照常并发。
+    # 多个进程可以共用一个 spill_dir：读回之前先把文件原子改名成 <name>.claimed-<pid> 认领，
+    # 改名失败（FileNotFoundError）说明别的进程已经认领了，跳过；同一个批次只会被一个进程处理。
+    def __init__(
+        self,
+        handler: Callable[[list[Any]], Awaitable[None]],
+        *,
+        maxsize: int = 1000,
+        workers: int = 4,
+        spill_dir: str | None = None,
+        dump: Callable[[list[Any]], list] | None = None,
+        load: Callable[[list], list[Any]] | None = None,
+        key: Callable[[Any], str | None] | None = None,
+    ) -> None:
+        self.handler = handler
+        self.key = key
+        self.dump = dump
+        self.load = load
+        self.maxsize = max(1, maxsize)
+        self.workers = max(1, workers)
+        self.spill_dir = Path(spill_dir) if spill_dir else None
+        self._queue: asyncio.Queue[tuple[float, list[Any]]] | None = None
+        self._tasks: list[asyncio.Task] = []
+        self._spill_seq = 0
+        # 落盘了还没读回队列的批次数
+        self._spill_backlog = 0
+        # 对话 key -> 最后一个含有这个 key 的批次处理完时完成的 future
+        self._tails: dict[str, asyncio.Future] = {}
+
+        self.enqueued = 0
+        self.processed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    async def start(self) -> None:
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        if self.spill_dir is not None:
+            self.spill_dir.mkdir(parents=True, exist_ok=True)
+            self._release_orphaned_claims()
+            self._spill_backlog = len(list(self.spill_dir.glob("*.json")))
+            self._refill()  # 上次进程退出前没处理完的批次
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self, *, drain: bool = True) -> None:
+        if self._queue is None:
+            return
+        if drain:
+            await self._queue.join()
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, events: list[Any]) -> bool:
+        if self._queue is None:
+            raise RuntimeError("WorkQueue not started")
+        item = (time.time(), events)
+        if self._spill_backlog:
+            # 前面还有落盘的批次：排在它们后面
+            self._spill(item)
+            return True
+        try:
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+            if self.spill_dir is None:
+                self.dropped += 1
+                return False
+            self._spill(item)
+            return True
+        self.enqueued += 1
+        return True
+
+    def _spill(self, item: tuple[float, list[Any]]) -> None:
+        assert self.spill_dir is not None
+        self._spill_seq += 1
+        name = f"{time.time_ns():020d}-{os.getpid()}-{self._spill_seq:06d}.json"
+        tmp = self.spill_dir / (name + ".tmp")
+        events = self.dump(item[1]) if self.dump is not None else item[1]
+        tmp.write_bytes(json.dumps({"t": item[0], "events": events}, separators=(",", ":")).encode("utf-8"))
+        os.replace(tmp, self.spill_dir / name)
+        self.spilled += 1
+        self._spill_backlog += 1
+
+    def _refill(self) -> None:
+        if self.spill_dir is None or self._queue is None:
+            return
+        claim_suffix = f".claimed-{os.getpid()}"
+        for path in sorted(self.spill_dir.glob("*.json")):
+            if self._queue.full():
+                return
+            claimed = path.with_name(path.name + claim_suffix)
+            try:
+                os.replace(path, claimed)
+            except FileNotFoundError:
+                # 别的进程先认领了
+                self._spill_backlog = max(0, self._spill_backlog - 1)
+                continue
+            try:
+                doc = json.loads(claimed.read_bytes())
+                item = (float(doc["t"]), self.load(doc["events"]) if self.load is not None else doc["events"])
+                claimed.unlink()
+            except Exception:
+                # 读不出来的文件改名隔离（*.bad，留着排查），不让它卡住后面的批次或者弄死 worker
+                logger.exception("failed to load spilled batch %s; moving it aside", path)
+                self._quarantine(claimed, path.with_suffix(".bad"))
+                continue
+            finally:
+                self._spill_backlog = max(0, self._spill_backlog - 1)
+            self._queue.put_nowait(item)
+            self.enqueued += 1
+        self._spill_backlog = 0
+
+    def _quarantine(self, path: Path, target: Path) -> None:
+        try:
+            os.replace(path, target)
+        except OSError:
+            logger.exception("failed to quarantine spilled batch %s", path)
+
+    def _release_orphaned_claims(self) -> None:
+        # 认领了但没处理完进程就退出了的文件：改回 *.json，重新排队
+        assert self.spill_dir is not None
+        for path in self.spill_dir.glob("*.json.claimed-*"):
+            pid = path.name.rpartition("-")[2]
+            if pid.isdigit() and _pid_alive(int(pid)):
+                continue
+            try:
+                os.replace(path, path.with_name(path.name.rpartition(".claimed-")[0]))
+            except FileNotFoundError:
+                pass  # 别的进程同时在做同样的事
+
+    async def _worker(self) -> None:
+        assert self._queue is not None
+        while True:
+            enqueued_at, events = await self._queue.get()
+            wait = max(0.0, time.time() - enqueued_at)
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+            # 出队和登记之间没有 await，登记顺序就是出队顺序
+            keys, before, done = self._chain(events)
+            try:
+                for fut in before:
+                    await fut
+                await self.handler(events)
+                self.processed += 1
+            except Exception:
+                logger.exception("background batch failed")
+                self.failed += 1
+            finally:
+                self._unchain(keys, done)
+                self._queue.task_done()
+            self._refill()
+
+    def _chain(self, events: list[Any]) -> tuple[set[str], list[asyncio.Future], asyncio.Future | None]:
+        if self.key is None:
+            return set(), [], None
+        keys = {self.key(ev) for ev in events} - {None}
+        if not keys:
+            return keys, [], None
+        done = asyncio.get_running_loop().create_future()
+        before = []
+        for k in keys:
+            prev = self._tails.get(k)
+            if prev is not None and prev not in before:
+                before.append(prev)
+            self._tails[k] = done
+        return keys, before, done
+
+    def _unchain(self, keys: set[str], done: asyncio.Future | None) -> None:
+        if done is None:
+            return
+        done.set_result(None)
+        for k in keys:
+            if self._tails.get(k) is done:
+                del self._tails[k]
+
+    def stats(self) -> dict:
+        done = self.processed + self.failed
+        return {
+            "depth": self._queue.qsize() if self._queue is not None else 0,
+            "maxsize": self.maxsize,
+            "workers": self.workers,
+            "enqueued": self.enqueued,
+            "processed": self.processed,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "spilled": self.spilled,
+            "spill_pending": len(list(self.spill_dir.glob("*.json"))) if self.spill_dir is not None else 0,
+            "wait_ms_avg": round(self.wait_total / done * 1000, 3) if done else 0.0,
+            "wait_ms_max": round(self.wait_max * 1000, 3),
+        }
@@ -0,0 +1,77 @@
+"""Memory per stored component and per-render dispatch cost on a large surface.
+
+The surface is ingested from freshly decoded JSON, as it would be from an agent.
+Compare against a tree that stored the raw component dicts and had no Flex cache or
+size budget (~745 B/component, ~2 us/component full render): the parents / bindings
+indexes and the Flex cache that make incremental re-renders cheap are not free on a
+cold full render.
+
+    python benchmarks/bench_component_model.py
+"""
+from __future__ import annotations
+
+import gc
+import json
+import sys
+import timeit
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.a2ui_state import A2UIState, apply_a2ui_messages  # noqa: E402
+from app.a2ui_to_flex import FlexBudget, a2ui_surface_to_line_flex  # noqa: E402
+from bench_flex_converter import wide  # noqa: E402
+
+# 不截断：每次都完整转换整棵树
+UNLIMITED = FlexBudget(max_bubble_bytes=1 << 30, max_nodes=1 << 30)
+
+
+def messages_json(rows: int) -> bytes:
+    return json.dumps(
+        [
+            {"surfaceUpdate": {"surfaceId": "main", "components": wide(rows)}},
+            {"dataModelUpdate": {"surfaceId": "main", "contents": [{"key": "m", "valueMap": []}]}},
+            {"beginRendering": {"surfaceId": "main", "root": "root"}},
+        ]
+    ).encode("utf-8")
+
+
+def measure(raw: bytes) -> tuple[int, int, A2UIState]:
+    # 只算 ingest 之后 state 自己持有的内存（component 的 props 等原始内容两边相同，也算在内）
+    gc.collect()
+    tracemalloc.start()
+    state = A2UIState()
+    apply_a2ui_messages(state, json.loads(raw))
+    gc.collect()
+    ingested = tracemalloc.get_traced_memory()[0]
+    a2ui_surface_to_line_flex(surface=state.surfaces["main"], budget=UNLIMITED)
+    state.surfaces["main"].flex_cache.clear()
+    state.surfaces["main"].flex_stats.clear()
+    gc.collect()
+    rendered = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return ingested, rendered, state
+
+
+def main() -> None:
+    for rows in (200, 2000):
+        raw = messages_json(rows)
+        ingested, rendered, state = measure(raw)
+        surface = state.surfaces["main"]
+        n = len(surface.components)
+
+        def full_render():
+            surface.flex_cache.clear()
+            a2ui_surface_to_line_flex(surface=surface, budget=UNLIMITED)
+
+        rounds = max(1, 20_000 // n)
+        t = min(timeit.repeat(full_render, number=rounds, repeat=5)) / rounds
+        print(
+            f"{n:6d} components  ingest {ingested / n:6.0f} B/component  "
+            f"after render {rendered / n:6.0f} B/component  full render {t * 1e3:7.2f} ms ({t / n * 1e9:5.0f} ns/component)"
+        )
+
+
+if __name__ == "__main__":
+    main()
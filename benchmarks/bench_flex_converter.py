@@ -0,0 +1,69 @@
+"""Full (uncached) Flex conversion of large component trees.
+
+    python benchmarks/bench_flex_converter.py
+"""
+from __future__ import annotations
+
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.a2ui_state import A2UIState, apply_a2ui_messages  # noqa: E402
+from app.a2ui_to_flex import a2ui_surface_to_line_flex  # noqa: E402
+
+
+def wide(n: int) -> list[dict]:
+    # n 行，每行 Row(label Text, value Text, Button)
+    rows = [f"row{i}" for i in range(n)]
+    components = [{"id": "root", "component": {"Column": {"children": {"explicitList": rows}}}}]
+    for i in range(n):
+        components += [
+            {"id": f"row{i}", "component": {"Row": {"children": {"explicitList": [f"l{i}", f"v{i}", f"b{i}"]}}}},
+            {"id": f"l{i}", "component": {"Text": {"text": {"literalString": f"Metric {i}"}}}},
+            {"id": f"v{i}", "component": {"Text": {"text": {"path": f"/m/{i}"}}}},
+            {"id": f"b{i}", "component": {"Button": {"child": f"bt{i}", "action": {"name": f"open{i}"}}}},
+            {"id": f"bt{i}", "component": {"Text": {"text": {"literalString": "Open"}}}},
+        ]
+    return components
+
+
+def deep(n: int) -> list[dict]:
+    components = [{"id": f"c{i}", "component": {"Card": {"child": f"c{i + 1}"}}} for i in range(n)]
+    components.append({"id": f"c{n}", "component": {"Text": {"text": {"literalString": "leaf"}}}})
+    return components
+
+
+def surface_of(components: list[dict], root: str):
+    state = A2UIState()
+    apply_a2ui_messages(
+        state,
+        [
+            {"surfaceUpdate": {"surfaceId": "main", "components": components}},
+            {"beginRendering": {"surfaceId": "main", "root": root}},
+        ],
+    )
+    return state.surfaces["main"]
+
+
+def main() -> None:
+    for name, surface, rounds in (
+        ("wide 500 rows", surface_of(wide(500), "root"), 50),
+        ("deep 30 cards", surface_of(deep(30), "c0"), 2000),
+        ("deep 5000 cards", surface_of(deep(5000), "c0"), 20),
+    ):
+        def full_render():
+            surface.flex_cache.clear()
+            a2ui_surface_to_line_flex(surface=surface)
+
+        try:
+            t = min(timeit.repeat(full_render, number=rounds, repeat=5))
+        except RecursionError:
+            print(f"{name:16s} RecursionError")
+            continue
+        print(f"{name:16s} {t / rounds * 1e3:8.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Intent routing: sequential re.search cascade vs compiled IntentRouter.
+
+    python benchmarks/bench_intent_router.py
+"""
+from __future__ import annotations
+
+import random
+import re
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.agent import INTENTS, intent_router  # noqa: E402
+from app.intent_router import Intent, IntentRouter  # noqa: E402
+
+
+def legacy_route(t: str) -> str | None:
+    if re.search(r"\b(hi|hello)\b", t, re.I) or re.search(r"你好|哈囉|嗨", t):
+        return "hello"
+    if re.search(r"訂位|订位|book|reservation|餐廳|餐厅|restaurant", t, re.I):
+        return "booking"
+    if re.search(r"carousel|list|列表|輪播|轮播", t, re.I):
+        return "carousel"
+    if re.search(r"confirm|confirm.*|確認|确认", t, re.I):
+        return "confirm"
+    if re.search(r"location|位置|where", t, re.I):
+        return "location"
+    if re.search(r"audio|music|sound|音频|音乐", t, re.I):
+        return "audio"
+    if re.search(r"video|movie|视频|电影", t, re.I):
+        return "video"
+    if re.search(r"image|photo|picture|图片|照片", t, re.I):
+        return "image"
+    if re.search(r"help|幫助|幫助|說明|说明", t, re.I):
+        return "help"
+    return None
+
+
+CORPUS = [
+    "你好", "Hello there!", "hi", "哈囉～", "嗨嗨", "帮我订位", "我想訂位兩個人今晚七點",
+    "Can I book a table for 4?", "restaurant near me", "附近有什麼餐廳", "show me the list",
+    "輪播給我看", "confirm", "請確認我的訂單", "确认一下", "where are you", "你們的位置在哪",
+    "play some music", "來點音樂", "send me a video", "我要看电影", "show a photo", "给我图片",
+    "help", "說明一下怎麼用", "今天天氣如何？", "謝謝你", "ok", "👍", "@action opt_a",
+    "我明天下午三點想和朋友去吃飯，大概五個人，有沒有推薦的地方？" * 3,
+    "Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor " * 4,
+]
+
+
+def synthetic_router(n: int) -> tuple[IntentRouter, list[tuple[str, re.Pattern]]]:
+    # 模拟几百个 intent 时的成本：每个 intent 若干个随机关键词
+    rnd = random.Random(0)
+    alphabet = "abcdefghijklmnopqrstuvwxyz"
+    intents = []
+    for i in range(n):
+        words = ["".join(rnd.choice(alphabet) for _ in range(7)) for _ in range(4)]
+        intents.append(Intent(f"synthetic{i}", lambda: [], keywords=tuple(words)))
+    all_intents = list(INTENTS) + intents
+    cascade = [(it.name, re.compile(intent_regex(it), re.I)) for it in all_intents]
+    return IntentRouter(all_intents), cascade
+
+
+def intent_regex(intent: Intent) -> str:
+    alts = [re.escape(k) for k in intent.keywords] + [rf"\b{re.escape(w)}\b" for w in intent.words]
+    return "|".join(alts)
+
+
+def main() -> None:
+    mismatches = [t for t in CORPUS if legacy_route(t) != ((r := intent_router.route(t)) and r.name)]
+    assert not mismatches, mismatches
+
+    n = 2000
+    legacy = timeit.timeit(lambda: [legacy_route(t) for t in CORPUS], number=n)
+    router = timeit.timeit(lambda: [intent_router.route(t) for t in CORPUS], number=n)
+    per = n * len(CORPUS)
+    print(f"{len(INTENTS)} intents   legacy cascade: {legacy / per * 1e6:7.2f} us/msg   router: {router / per * 1e6:7.2f} us/msg")
+
+    for size in (100, 300):
+        big, cascade = synthetic_router(size)
+
+        def run_cascade():
+            for t in CORPUS:
+                for name, pat in cascade:
+                    if pat.search(t):
+                        break
+
+        n = 200
+        c = timeit.timeit(run_cascade, number=n)
+        r = timeit.timeit(lambda: [big.route(t) for t in CORPUS], number=n)
+        per = n * len(CORPUS)
+        print(f"{size + len(INTENTS)} intents   compiled cascade: {c / per * 1e6:7.2f} us/msg   router: {r / per * 1e6:7.2f} us/msg")
+
+
+if __name__ == "__main__":
+    main()
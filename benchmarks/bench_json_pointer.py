@@ -0,0 +1,75 @@
+"""JSON pointer resolution: split/unescape on every lookup vs compiled pointer cache.
+
+    python benchmarks/bench_json_pointer.py
+"""
+from __future__ import annotations
+
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.a2ui_state import Surface, compile_json_pointer, resolve_json_pointer  # noqa: E402
+from app.a2ui_to_flex import a2ui_surface_to_line_flex  # noqa: E402
+
+
+def legacy_resolve(obj, pointer: str | None):
+    if pointer is None or pointer == "" or pointer == "/":
+        return obj
+    if not pointer.startswith("/"):
+        return None
+    cur = obj
+    for part in pointer.split("/")[1:]:
+        part = part.replace("~1", "/").replace("~0", "~")
+        if cur is None:
+            return None
+        if isinstance(cur, list):
+            try:
+                idx = int(part)
+            except ValueError:
+                return None
+            if idx < 0 or idx >= len(cur):
+                return None
+            cur = cur[idx]
+        elif isinstance(cur, dict):
+            cur = cur.get(part)
+        else:
+            return None
+    return cur
+
+
+def bound_surface(n: int) -> Surface:
+    rows = [{"name": f"item {i}", "price": {"amount": i * 10, "currency": "JPY"}} for i in range(n)]
+    components = {
+        "root": {"Column": {"children": {"explicitList": [f"t{i}" for i in range(n)]}}},
+    }
+    for i in range(n):
+        components[f"t{i}"] = {"Text": {"text": {"path": f"/order/items/{i}/name"}}}
+    return Surface(components=components, data_model={"order": {"items": rows}}, root="root")
+
+
+def main() -> None:
+    n = 2000
+    surface = bound_surface(n)
+    pointers = [f"/order/items/{i}/price/amount" for i in range(n)]
+    assert all(legacy_resolve(surface.data_model, p) == resolve_json_pointer(surface.data_model, p) for p in pointers)
+
+    rounds = 50
+    legacy = timeit.timeit(lambda: [legacy_resolve(surface.data_model, p) for p in pointers], number=rounds)
+    compiled = timeit.timeit(lambda: [resolve_json_pointer(surface.data_model, p) for p in pointers], number=rounds)
+    per = rounds * n
+    print(f"{n} pointers   legacy: {legacy / per * 1e9:7.0f} ns/lookup   compiled: {compiled / per * 1e9:7.0f} ns/lookup")
+    print(f"pointer cache: {compile_json_pointer.cache_info()}")
+
+    def full_render():
+        surface.flex_cache.clear()
+        a2ui_surface_to_line_flex(surface=surface, alt_text="bench")
+
+    rounds = 20
+    t = timeit.timeit(full_render, number=rounds)
+    print(f"full render of {n} bound Text components: {t / rounds * 1e3:7.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
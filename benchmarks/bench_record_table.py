@@ -0,0 +1,58 @@
+"""Memory of a decoded valueArray result set: list of dicts vs RecordTable.
+
+    python benchmarks/bench_record_table.py
+"""
+from __future__ import annotations
+
+import sys
+import timeit
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.a2ui_state import decode_value, resolve_json_pointer  # noqa: E402
+
+
+def result_set(n: int) -> dict:
+    return {
+        "key": "results",
+        "valueArray": [
+            {
+                "valueMap": [
+                    {"key": "title", "valueString": f"Restaurant {i}"},
+                    {"key": "rating", "valueNumber": i % 5},
+                    {"key": "open", "valueBoolean": i % 2 == 0},
+                    {"key": "image", "valueString": "https://example.com/a.png"},
+                ]
+            }
+            for i in range(n)
+        ],
+    }
+
+
+def measure(build) -> tuple[object, int]:
+    tracemalloc.start()
+    obj = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return obj, size
+
+
+def main() -> None:
+    for n in (100, 10_000):
+        entry = result_set(n)
+        rows, rows_bytes = measure(lambda: [{kv["key"]: decode_value(kv) for kv in v["valueMap"]} for v in entry["valueArray"]])
+        table, table_bytes = measure(lambda: decode_value(entry))
+        assert table == rows
+        print(f"{n:6d} rows   list of dicts: {rows_bytes / 1024:8.1f} KiB   RecordTable: {table_bytes / 1024:8.1f} KiB")
+
+        data_rows, data_table = {"results": rows}, {"results": table}
+        pointers = [f"/results/{i}/title" for i in range(n)]
+        a = timeit.timeit(lambda: [resolve_json_pointer(data_rows, p) for p in pointers], number=5)
+        b = timeit.timeit(lambda: [resolve_json_pointer(data_table, p) for p in pointers], number=5)
+        print(f"{n:6d} rows   lookup list: {a / 5 / n * 1e9:6.0f} ns   table: {b / 5 / n * 1e9:6.0f} ns")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""Webhook ingress CPU: signature check + parsing a large multi-event batch.
+
+Old path: hmac.new() per request, json.loads into dicts, then .get() probes per event.
+New path: copy of a precomputed HMAC state, then typed structs straight from the bytes.
+
+Measured results are modest and noisy: repeated runs on one machine gave x1.05-x1.26
+for 1-100 events and x1.04-x1.24 at 1000 events, and other machines have measured
+x0.96 at 1000 events. Both paths spend most of their time in C-level JSON parsing,
+so treat large batches as break-even. The typed path exists for its typed events and
+for skipping unhandled event types, not for raw parsing speed.
+
+The second table uses an event type that is not in IGNORED_EVENT_TYPES. Such events
+used to fail the dispatch-by-type parse and send the whole body through a second,
+lenient parse (x0.30-x0.45 for 10-1000 events). They now fall through to OtherEvent
+within the same parse: 3-3.5x faster than before and x0.88-x1.12 against json.loads,
+slightly behind the listed types because each one first fails the type lookup.
+
+    python benchmarks/bench_webhook_ingress.py
+"""
+from __future__ import annotations
+
+import base64
+import hashlib
+import hmac
+import json
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.line_api import verify_line_signature  # noqa: E402
+from app.webhook_events import MessageEvent, event_session_key, parse_webhook  # noqa: E402
+
+SECRET = "0123456789abcdef0123456789abcdef"
+
+
+def batch(n: int, other: str = "memberJoined") -> bytes:
+    events = []
+    for i in range(n):
+        base = {
+            "mode": "active",
+            "timestamp": 1700000000000 + i,
+            "webhookEventId": f"01HZ{i:020d}",
+            "deliveryContext": {"isRedelivery": False},
+            "source": {"type": "group", "groupId": f"G{i % 7}", "userId": f"U{i:032d}"},
+        }
+        kind = i % 4
+        if kind == 0:
+            events.append({**base, "type": "message", "replyToken": f"r{i}", "message": {
+                "type": "text", "id": str(i), "quoteToken": "q" * 40, "text": f"hello {i}",
+                "emojis": [{"index": 0, "productId": "5ac1bfd5040ab15980c9b435", "emojiId": "001"}],
+                "mention": {"mentionees": [{"index": 0, "length": 4, "type": "user", "userId": "U" * 33}]},
+            }})
+        elif kind == 1:
+            events.append({**base, "type": "postback", "replyToken": f"r{i}", "postback": {
+                "data": f"a2ui:more:main:{i}", "params": {"datetime": "2024-01-01T00:00"},
+            }})
+        elif kind == 2:
+            events.append({**base, "type": "message", "replyToken": f"r{i}", "message": {
+                "type": "image", "id": str(i), "contentProvider": {"type": "line"},
+                "imageSet": {"id": "x" * 32, "index": 1, "total": 4},
+            }})
+        else:
+            events.append({**base, "type": other, "replyToken": f"r{i}", "joined": {
+                "members": [{"type": "user", "userId": f"U{j:032d}"} for j in range(20)],
+            }})
+    return json.dumps({"destination": "U" * 33, "events": events}).encode("utf-8")
+
+
+def dict_session_key(source: dict | None) -> str | None:
+    # 旧路径：从 dict 里按 groupId / roomId / userId 的顺序取 key
+    source = source or {}
+    for kind, field_name in (("group", "groupId"), ("room", "roomId"), ("user", "userId")):
+        v = source.get(field_name)
+        if v:
+            return f"{kind}:{v}"
+    return None
+
+
+def old_path(body: bytes, signature: str) -> int:
+    mac = hmac.new(SECRET.encode("utf-8"), body, hashlib.sha256).digest()
+    assert hmac.compare_digest(base64.b64encode(mac).decode("ascii"), signature)
+    payload = json.loads(body.decode("utf-8"))
+    handled = 0
+    for ev in payload.get("events") or []:
+        if ev.get("type") not in ("message", "postback"):
+            continue
+        dict_session_key(ev.get("source"))
+        if ev.get("type") == "message":
+            msg = ev.get("message") or {}
+            if msg.get("type") == "text" and ev.get("replyToken"):
+                handled += len(msg.get("text") or "")
+    return handled
+
+
+def new_path(body: bytes, signature: str) -> int:
+    assert verify_line_signature(channel_secret=SECRET, body=body, signature=signature)
+    handled = 0
+    for ev in parse_webhook(body):
+        event_session_key(ev)
+        if isinstance(ev, MessageEvent) and ev.message is not None and ev.message.type == "text" and ev.reply_token:
+            handled += len(ev.message.text or "")
+    return handled
+
+
+def main() -> None:
+    # memberJoined 在已知的不处理类型里；membership 没列出来，走 OtherEvent
+    for other in ("memberJoined", "membership"):
+        print(f"every 4th event: {other}")
+        for n in (1, 10, 100, 1000):
+            body = batch(n, other)
+            signature = base64.b64encode(hmac.new(SECRET.encode("utf-8"), body, hashlib.sha256).digest()).decode("ascii")
+            assert old_path(body, signature) == new_path(body, signature)
+            number = max(10, 20_000 // n)
+            # 两条路径交替跑，减少机器负载波动的影响；各取最好的一轮
+            old = new = float("inf")
+            for _ in range(7):
+                old = min(old, timeit.timeit(lambda: old_path(body, signature), number=number) / number)
+                new = min(new, timeit.timeit(lambda: new_path(body, signature), number=number) / number)
+            print(f"{n:5d} events {len(body):8d} B  json.loads+dict {old * 1e6:9.1f} us  typed {new * 1e6:9.1f} us  x{old / new:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import json
+
+import pytest
+
+import app.fanout as fanout
+import app.main as main
+from app import line_api
+from app.render_cache import RenderCache
+from app.webhook_events import events_from_json
+
+
+def decode_messages(messages):
+    # reply / push 收到的 messages：整个请求编码好的 bytes，或者 dict / 已编码 bytes 混合的列表
+    if isinstance(messages, (bytes, str)):
+        return json.loads(messages)
+    return [m if isinstance(m, dict) else json.loads(m) for m in messages]
+
+
+@pytest.fixture
+def text_event():
+    # 文字消息事件：text_event("menu")、text_event(user_id="U2")、text_event(source={...}, timestamp=...)
+    def build(text="hi", *, user_id="U1", source=None, timestamp=None):
+        doc = {
+            "type": "message",
+            "replyToken": "r",
+            "source": source or {"type": "user", "userId": user_id},
+            "message": {"type": "text", "text": text},
+        }
+        if timestamp is not None:
+            doc["timestamp"] = timestamp
+        return events_from_json([doc])[0]
+
+    return build
+
+
+@pytest.fixture
+def line_sent(monkeypatch):
+    # 替换掉发给 LINE 的调用，按顺序记下 (种类, reply token / 推送对象 / chat id, 解码后的 messages)；
+    # 每个测试一份新的 RenderCache，不会命中别的测试留下的渲染结果
+    out = []
+
+    async def fake_reply(**kwargs):
+        out.append(("reply", kwargs["reply_token"], decode_messages(kwargs["messages"])))
+
+    async def fake_push(**kwargs):
+        out.append(("push", kwargs["to"], decode_messages(kwargs["messages"])))
+
+    async def fake_loading(**kwargs):
+        out.append(("loading", kwargs["chat_id"], None))
+
+    monkeypatch.setattr(main, "reply_to_line", fake_reply)
+    monkeypatch.setattr(fanout, "push_to_line", fake_push)
+    monkeypatch.setattr(main, "start_loading_animation", fake_loading)
+    monkeypatch.setattr(main, "render_cache", RenderCache())
+    monkeypatch.setattr(main.settings, "line_channel_access_token", "token")
+    return out
+
+
+@pytest.fixture
+def line_resilience(monkeypatch):
+    # configure_resilience 改的是 line_api 模块级的限流 / 重试 / 熔断状态：先交给 monkeypatch 记下，测试结束后还原
+    for name in ("retry_policy", "breaker", "_rate_limit"):
+        monkeypatch.setattr(line_api, name, getattr(line_api, name))
+    monkeypatch.setattr(line_api, "_buckets", {})
+    monkeypatch.setattr(line_api, "_endpoint_rate_limits", dict(line_api._endpoint_rate_limits))
+    return line_api.configure_resilience
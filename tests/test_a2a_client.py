@@ -0,0 +1,125 @@
+import asyncio
+import json
+import time
+
+import httpx
+import pytest
+
+import app.main as main
+from app.a2a_client import A2AClient, A2AError
+from app.a2a_server import create_app
+from app.a2ui_state import A2UIState
+from app.agent import hello_card
+
+
+def client_for(app, **kwargs):
+    return A2AClient(url="http://agent/", transport=httpx.ASGITransport(app=app), **kwargs)
+
+
+async def collect(client, context_id, text, **kwargs):
+    return [msg async for msg in client.stream(context_id=context_id, text=text, **kwargs)]
+
+
+@pytest.mark.asyncio
+async def test_stream_returns_agent_a2ui_messages_in_order():
+    client = client_for(create_app())
+    try:
+        assert await collect(client, "user:U1", "你好") == hello_card()
+    finally:
+        await client.aclose()
+    assert client.stats()["calls"] == 1 and client.stats()["active_contexts"] == 0
+
+
+@pytest.mark.asyncio
+async def test_calls_for_one_context_are_serialized_and_contexts_run_concurrently():
+    log = []
+    queued = []
+
+    async def decide(*, user_text):
+        log.append(("start", user_text))
+        queued.append(client.stats()["queued_turns"])
+        await asyncio.sleep(0.05)
+        log.append(("end", user_text))
+        return hello_card()
+
+    client = client_for(create_app(decide=decide))
+    try:
+        await asyncio.gather(collect(client, "user:U1", "a"), collect(client, "user:U1", "b"))
+        # b 在 a 的流读完之前不会发出去：a 在途时 b 排着队
+        assert log == [("start", "a"), ("end", "a"), ("start", "b"), ("end", "b")]
+        assert queued == [1, 0] and client.stats()["queued_turns"] == 0
+        queued.clear()
+
+        log.clear()
+        await asyncio.gather(collect(client, "user:U1", "a"), collect(client, "user:U2", "b"))
+        assert log[:2] == [("start", "a"), ("start", "b")]
+    finally:
+        await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_deadline_ends_stream_and_frees_context():
+    client = client_for(create_app(delay=1.0), timeout=5.0)
+    try:
+        started = time.monotonic()
+        assert await collect(client, "user:U1", "hi", deadline=time.time() + 0.1) == []
+        assert time.monotonic() - started < 1.0
+    finally:
+        await client.aclose()
+    assert client.stats()["timeouts"] == 1 and client.stats()["active_contexts"] == 0
+
+
+@pytest.mark.asyncio
+async def test_early_close_cancels_remote_task():
+    # 逐块送出 SSE，读完第一条 A2UI 消息就停下
+    cancelled = []
+
+    def handler(request):
+        req = json.loads(request.content)
+        if req["method"] == "tasks/cancel":
+            cancelled.append(req["params"]["id"])
+            return httpx.Response(200, json={"jsonrpc": "2.0", "id": req["id"], "result": {}})
+        events = [
+            {"kind": "task", "id": "t1", "status": {"state": "submitted"}},
+            {"kind": "artifact-update", "taskId": "t1", "artifact": {"parts": [{"kind": "data", "data": msg}]}},
+        ]
+        body = b"".join(b"data: " + json.dumps({"jsonrpc": "2.0", "id": req["id"], "result": e}).encode() + b"\n\n" for e in events)
+        return httpx.Response(200, content=body, headers={"Content-Type": "text/event-stream"})
+
+    msg = hello_card()[0]
+    client = A2AClient(url="http://agent/", transport=httpx.MockTransport(handler))
+    try:
+        stream = client.stream(context_id="user:U1", text="hi")
+        assert await stream.__anext__() == msg
+        await stream.aclose()
+    finally:
+        await client.aclose()
+    assert cancelled == ["t1"]
+
+
+@pytest.mark.asyncio
+async def test_rpc_errors_raise():
+    def handler(request):
+        return httpx.Response(200, json={"jsonrpc": "2.0", "id": 1, "error": {"code": -32601, "message": "nope"}})
+
+    client = A2AClient(url="http://agent/", transport=httpx.MockTransport(handler))
+    try:
+        with pytest.raises(A2AError):
+            await collect(client, "user:U1", "hi")
+    finally:
+        await client.aclose()
+    assert client.stats()["errors"] == 1
+
+
+@pytest.mark.asyncio
+async def test_handle_event_uses_remote_agent(monkeypatch, line_sent, text_event):
+    client = client_for(create_app())
+    monkeypatch.setattr(main, "a2a_client", client)
+
+    state = A2UIState()
+    try:
+        await main.handle_event(text_event("hello"), state)
+    finally:
+        await client.aclose()
+    assert [s[0] for s in line_sent] == ["reply"] and line_sent[0][2][0]["type"] == "flex"
+    assert state.surfaces["main"].root == "root"
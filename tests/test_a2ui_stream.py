@@ -0,0 +1,109 @@
+import asyncio
+import json
+
+import pytest
+
+import app.main as main
+from app.a2ui_state import A2UIState
+from app.a2ui_stream import StreamIngest, iter_a2ui_messages
+
+
+def text_surface(surface_id, text):
+    return [
+        {
+            "surfaceUpdate": {
+                "surfaceId": surface_id,
+                "components": [{"id": "root", "component": {"Text": {"text": {"path": "/t"}}}}],
+            }
+        },
+        {"dataModelUpdate": {"surfaceId": surface_id, "contents": [{"key": "t", "valueString": text}]}},
+        {"beginRendering": {"surfaceId": surface_id, "root": "root"}},
+    ]
+
+
+def body_text(message):
+    return message["contents"]["body"]["contents"][0]["text"]
+
+
+async def collect(source):
+    return [msg async for msg in iter_a2ui_messages(source)]
+
+
+async def chunks(*parts):
+    for part in parts:
+        yield part
+
+
+@pytest.mark.asyncio
+async def test_jsonl_split_across_chunks():
+    msgs = text_surface("main", "哈囉")
+    raw = "\n".join(json.dumps(m, ensure_ascii=False) for m in msgs).encode("utf-8")
+    # 切在多字节字符和 JSON 中间
+    parts = [raw[i : i + 7] for i in range(0, len(raw), 7)]
+    assert await collect(chunks(*parts)) == msgs
+    assert await collect(msgs) == msgs
+
+
+@pytest.mark.asyncio
+async def test_sse_lines_and_garbage_are_skipped():
+    msg = {"beginRendering": {"surfaceId": "main", "root": "root"}}
+    sse = f": keepalive\nevent: message\nid: 1\ndata: {json.dumps(msg)}\n\ndata: not json\ndata: [1]\n"
+    assert await collect(chunks(sse[:20], sse[20:])) == [msg]
+    assert await collect(chunks(msg)) == [msg]
+
+
+def test_surface_is_ready_only_once_root_component_arrived():
+    ingest = StreamIngest(A2UIState())
+    ingest.apply({"beginRendering": {"surfaceId": "main", "root": "root"}})
+    assert ingest.ready() == []
+    ingest.apply(text_surface("main", "x")[0])
+    assert ingest.ready() == ["main"]
+    ingest.apply({"deleteSurface": {"surfaceId": "main"}})
+    assert ingest.ready() == []
+
+
+@pytest.mark.asyncio
+async def test_reply_goes_out_before_stream_finishes(monkeypatch, line_sent, text_event):
+    sent = line_sent
+    resume = asyncio.Event()
+
+    async def stream():
+        for msg in text_surface("main", "first"):
+            yield msg
+        await resume.wait()
+        yield {"dataModelUpdate": {"surfaceId": "main", "contents": [{"key": "t", "valueString": "later"}]}}
+        for msg in text_surface("side", "second"):
+            yield msg
+
+    async def decide(*, user_text):
+        return stream()
+
+    monkeypatch.setattr(main, "decide_a2ui_response", decide)
+
+    state = A2UIState()
+    task = asyncio.create_task(main.handle_event(text_event(), state))
+    for _ in range(100):
+        if sent:
+            break
+        await asyncio.sleep(0.01)
+    assert not task.done()
+    assert [s[0] for s in sent] == ["reply"]
+    assert [body_text(m) for m in sent[0][2]] == ["first"]
+
+    resume.set()
+    await task
+    assert [s[0] for s in sent] == ["reply", "push"]
+    assert [body_text(m) for m in sent[1][2]] == ["second"]
+    # 回复之后的数据更新留在 state 里，下次渲染用
+    assert state.surfaces["main"].data_model["t"] == "later"
+
+
+@pytest.mark.asyncio
+async def test_stream_without_renderable_surface_rerenders_main(monkeypatch, line_sent, text_event):
+    async def decide(*, user_text):
+        return chunks(b'{"dataModelUpdate": {"surfaceId": "main", "contents": []}}\n')
+
+    monkeypatch.setattr(main, "decide_a2ui_response", decide)
+
+    await main.handle_event(text_event(), A2UIState())
+    assert [s[0] for s in line_sent] == ["reply"] and len(line_sent[0][2]) == 1
@@ -0,0 +1,81 @@
+from app.a2ui_state import A2UIState, BindingIndex, JsonPointer, apply_a2ui_messages, parse_json_pointer
+
+
+def ptr(*parts):
+    return JsonPointer(parts)
+from app.a2ui_to_flex import a2ui_surface_to_line_flex
+
+
+def test_affected_covers_ancestors_and_descendants_only():
+    index = BindingIndex()
+    index.add("name", {"text": ptr("user", "name")})
+    index.add("user", {"text": ptr("user")})
+    index.add("city", {"text": ptr("user", "address", "city")})
+    index.add("total", {"text": ptr("order", "total")})
+    index.add("everything", {"text": ptr()})
+
+    assert index.affected(("user", "name")) == {"name", "user", "everything"}
+    assert index.affected(("user",)) == {"name", "user", "city", "everything"}
+    assert index.affected(("order", "items", "0")) == {"everything"}
+    assert index.affected(("order",)) == {"total", "everything"}
+    assert index.affected(()) == {"name", "user", "city", "total", "everything"}
+
+
+def test_remove_prunes_trie():
+    index = BindingIndex()
+    index.add("a", {"text": ptr("x", "y")})
+    index.add("b", {"text": ptr("x", "y"), "url": ptr("x", "z")})
+    index.remove("a")
+    assert index.affected(("x",)) == {"b"}
+    index.remove("b")
+    assert index.affected(("x",)) == set()
+    assert index._root == {}
+    assert len(index) == 0
+
+
+def test_ingest_preparses_pointers_per_prop():
+    state = A2UIState()
+    apply_a2ui_messages(
+        state,
+        [
+            {
+                "surfaceUpdate": {
+                    "surfaceId": "main",
+                    "components": [
+                        {"id": "root", "component": {"Column": {"children": {"explicitList": ["t"]}}}},
+                        {"id": "t", "component": {"Text": {"text": {"path": "/a~1b/c~0d"}}}},
+                    ],
+                }
+            },
+            {
+                "dataModelUpdate": {
+                    "surfaceId": "main",
+                    "contents": [{"key": "a/b", "valueMap": [{"key": "c~d", "valueString": "escaped"}]}],
+                }
+            },
+            {"beginRendering": {"surfaceId": "main", "root": "root"}},
+        ],
+    )
+    surface = state.surfaces["main"]
+
+    assert surface.bindings.pointer("t", "text").parts == ("a/b", "c~d")
+    assert surface.bindings.pointer("root", "text") is None
+    assert parse_json_pointer("relative") is None
+    body = a2ui_surface_to_line_flex(surface=surface)["contents"]["body"]
+    assert body["contents"][0]["text"] == "escaped"
+
+
+def test_compiled_pointer_is_shared_and_precomputes_indices():
+    from app.a2ui_state import compile_json_pointer, resolve_json_pointer
+
+    p = compile_json_pointer("/items/1/a~1b")
+    assert p is compile_json_pointer("/items/1/a~1b")
+    assert p.parts == ("items", "1", "a/b")
+    assert p.indices == (None, 1, None)
+    assert compile_json_pointer("items") is None
+
+    data = {"items": [{"a/b": 0}, {"a/b": 2}], "1": "key"}
+    assert resolve_json_pointer(data, "/items/1/a~1b") == 2
+    assert resolve_json_pointer(data, "/items/x") is None
+    assert resolve_json_pointer(data, "/items/-1") is None
+    assert resolve_json_pointer(data, "/1") == "key"
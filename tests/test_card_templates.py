@@ -0,0 +1,47 @@
+import json
+import pickle
+
+import pytest
+
+from app.agent import carousel_card, fallback_card, hello_card
+from app.card_templates import card_template
+
+
+def test_static_cards_are_built_once_and_read_only():
+    assert hello_card() is hello_card()
+
+    card = carousel_card()
+    with pytest.raises(TypeError):
+        card.append({})
+    with pytest.raises(TypeError):
+        card[0]["surfaceUpdate"]["surfaceId"] = "other"
+    with pytest.raises(TypeError):
+        card[0]["surfaceUpdate"]["components"][0]["component"].pop("Carousel")
+
+    # 仍然是普通的 list/dict，序列化没问题
+    assert json.loads(json.dumps(card)) == card
+    assert pickle.loads(pickle.dumps(card)) == card
+
+
+def test_fallback_card_copies_only_the_slot_path():
+    a = fallback_card("first")
+    b = fallback_card(user_text="second")
+
+    comps_a = a[0]["surfaceUpdate"]["components"]
+    comps_b = b[0]["surfaceUpdate"]["components"]
+    assert comps_a[2]["component"]["Text"]["text"] == {"literalString": "first"}
+    assert comps_b[2]["component"]["Text"]["text"] == {"literalString": "second"}
+
+    # 不含占位符的部分直接共享
+    assert a[1] is b[1]
+    assert comps_a[0] is comps_b[0]
+    assert comps_a[3] is comps_b[3]
+    assert comps_a[2] is not comps_b[2]
+
+
+def test_card_template_rejects_parameters_inside_strings():
+    with pytest.raises(ValueError):
+
+        @card_template
+        def bad(name):
+            return [{"text": f"hi {name}"}]
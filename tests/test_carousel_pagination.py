@@ -0,0 +1,137 @@
+import json
+
+import pytest
+
+import app.main as main
+from app.a2ui_state import A2UIState, apply_a2ui_messages
+from app.a2ui_to_flex import (
+    MAX_CAROUSEL_BUBBLES,
+    FlexBudget,
+    a2ui_surface_to_line_messages,
+    parse_more_postback,
+)
+from app.render_cache import RenderCache
+from app.webhook_events import events_from_json
+
+
+def menu_state(n):
+    state = A2UIState()
+    apply_a2ui_messages(
+        state,
+        [
+            {
+                "surfaceUpdate": {
+                    "surfaceId": "main",
+                    "components": [
+                        {"id": "root", "component": {"Carousel": {"children": {"template": {"componentId": "item", "dataBinding": "/menu"}}}}},
+                        {"id": "item", "component": {"Text": {"text": {"path": "name"}}}},
+                    ],
+                }
+            },
+            {
+                "dataModelUpdate": {
+                    "surfaceId": "main",
+                    "contents": [
+                        {"key": "menu", "valueArray": [{"valueMap": [{"key": "name", "valueString": f"dish {i}"}]} for i in range(n)]}
+                    ],
+                }
+            },
+            {"beginRendering": {"surfaceId": "main", "root": "root"}},
+        ],
+    )
+    return state
+
+
+def webhook_event(doc):
+    return events_from_json([doc])[0]
+
+
+def names(message):
+    return [b["body"]["contents"][0].get("text") for b in message["contents"]["contents"]]
+
+
+def more_data(message):
+    return message["contents"]["contents"][-1]["body"]["contents"][0]["action"]["data"]
+
+
+def test_carousel_splits_into_messages_of_at_most_max_bubbles():
+    messages = a2ui_surface_to_line_messages(surface=menu_state(30).surfaces["main"])
+    assert [len(m["contents"]["contents"]) for m in messages] == [12, 12, 6]
+    assert names(messages[1])[0] == "dish 12"
+    assert names(messages[2])[-1] == "dish 29"
+
+
+def test_carousel_overflow_ends_with_more_postback_and_offset_renders_next_page():
+    surface = menu_state(100).surfaces["main"]
+    messages = a2ui_surface_to_line_messages(surface=surface)
+    assert len(messages) == 5
+    assert len(messages[-1]["contents"]["contents"]) == MAX_CAROUSEL_BUBBLES
+    assert names(messages[-1])[-2] == "dish 58"
+    assert more_data(messages[-1]) == "a2ui:more:main:59"
+
+    assert parse_more_postback(more_data(messages[-1])) == ("main", 59)
+    rest = a2ui_surface_to_line_messages(surface=surface, offset=59)
+    assert [len(m["contents"]["contents"]) for m in rest] == [12, 12, 12, 5]
+    assert names(rest[0])[0] == "dish 59"
+    assert names(rest[-1])[-1] == "dish 99"
+
+
+def test_push_policy_returns_every_page_up_to_max_pages():
+    surface = menu_state(100).surfaces["main"]
+    messages = a2ui_surface_to_line_messages(surface=surface, budget=FlexBudget(carousel_overflow="push"))
+    assert len(messages) == 9
+    assert sum(len(m["contents"]["contents"]) for m in messages) == 100
+
+    capped = a2ui_surface_to_line_messages(surface=surface, budget=FlexBudget(carousel_overflow="push", max_pages=3))
+    assert len(capped) == 3 and names(capped[-1])[-1] == "dish 35"
+
+
+def test_carousel_byte_limit_starts_new_message():
+    surface = menu_state(10).surfaces["main"]
+    messages = a2ui_surface_to_line_messages(surface=surface, budget=FlexBudget(max_carousel_bytes=1400))
+    assert len(messages) > 1
+    for m in messages:
+        assert len(json.dumps(m["contents"], separators=(",", ":"))) <= 1400
+    assert [n for m in messages for n in names(m)] == [f"dish {i}" for i in range(10)]
+
+
+def test_unknown_carousel_policy_and_bad_postback():
+    with pytest.raises(ValueError):
+        FlexBudget(carousel_overflow="spill")
+    assert parse_more_postback("a2ui:more:main:x") is None
+    assert parse_more_postback("other") is None
+    assert parse_more_postback("a2ui:more:a:b:3") == ("a:b", 3)
+
+
+@pytest.mark.asyncio
+async def test_handle_event_replies_first_five_and_pushes_the_rest(monkeypatch, line_sent, text_event):
+    sent = line_sent
+
+    async def decide(*, user_text):
+        return []
+
+    monkeypatch.setattr(main, "decide_a2ui_response", decide)
+    monkeypatch.setattr(main, "render_cache", RenderCache(budget=FlexBudget(carousel_overflow="push")))
+
+    state = menu_state(100)
+    await main.handle_event(text_event("menu"), state)
+    assert [s[0] for s in sent] == ["reply", "push"]
+    assert len(sent[0][2]) == 5
+    assert sent[1][1] == "U1" and len(sent[1][2]) == 4
+
+
+@pytest.mark.asyncio
+async def test_more_postback_rerenders_from_offset(line_sent):
+    await main.handle_event(
+        webhook_event(
+            {
+                "type": "postback",
+                "replyToken": "r",
+                "source": {"type": "user", "userId": "U1"},
+                "postback": {"data": "a2ui:more:main:59"},
+            }
+        ),
+        menu_state(100),
+    )
+    assert [s[0] for s in line_sent] == ["reply"]
+    assert names(line_sent[0][2][0])[0] == "dish 59"
@@ -0,0 +1,64 @@
+from app.a2ui_state import A2UIState, ComponentNode, Surface, apply_a2ui_messages, component_node
+from app.card_templates import freeze
+
+
+def test_node_pre_resolves_children_and_round_trips():
+    raw = {"Column": {"children": {"explicitList": ["a", "b"]}, "alignment": "center"}}
+    node = component_node("root", raw)
+    assert node.type == "Column" and node.children == ("a", "b")
+    assert "children" not in node.props
+    assert node.to_json() == raw
+    assert not hasattr(node, "__dict__")
+
+    card = component_node("c", {"Card": {"child": "t"}})
+    assert card.child == "t" and card.child_ids() == ("t",)
+
+    tpl = {"List": {"children": {"template": {"componentId": "row", "dataBinding": "/items"}}}}
+    node = component_node("list", tpl)
+    assert node.template == ("row", "/items") and node.child_ids() == ("row",)
+    assert "children/template/dataBinding" in node.pointers
+    assert node.to_json() == tpl
+
+
+def test_malformed_components_become_unknown_and_keep_nonstandard_children():
+    assert component_node("x", "oops").type == "Unknown"
+    assert component_node("x", {"Text": None}).props == {}
+
+    raw = {"Row": {"children": {"explicitList": ["a"], "extra": 1}}}
+    node = component_node("r", raw)
+    assert node.children == ("a",) and node.to_json() == raw
+
+
+def test_frozen_template_components_share_one_node():
+    frozen = freeze({"Text": {"text": {"literalString": "hi"}}})
+    assert component_node("t", frozen) is component_node("t", frozen)
+
+    surface = Surface(components={"t": frozen})
+    dirty_before = set(surface.dirty_components)
+    surface.set_component("t", frozen)
+    assert surface.dirty_components == dirty_before
+
+
+def test_surface_stores_nodes_and_indexes_parents():
+    state = A2UIState()
+    apply_a2ui_messages(
+        state,
+        [
+            {
+                "surfaceUpdate": {
+                    "surfaceId": "main",
+                    "components": [
+                        {"id": "root", "component": {"Column": {"children": {"explicitList": ["card", "t"]}}}},
+                        {"id": "card", "component": {"Card": {"child": "t"}}},
+                        {"id": "t", "component": {"Text": {"text": {"path": "/name"}}}},
+                    ],
+                }
+            }
+        ],
+    )
+    surface = state.surfaces["main"]
+    assert all(isinstance(n, ComponentNode) for n in surface.components.values())
+    assert surface.parents["t"] == ("root", "card")
+
+    surface.set_component("root", {"Column": {"children": {"explicitList": ["card"]}}})
+    assert surface.parents["t"] == "card"
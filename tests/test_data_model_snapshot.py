@@ -0,0 +1,79 @@
+import pytest
+
+from app.a2ui_state import A2UIState, apply_a2ui_messages
+from app.a2ui_to_flex import a2ui_surface_to_line_flex
+
+
+def update(path, contents):
+    msg = {"surfaceId": "main", "contents": contents}
+    if path is not None:
+        msg["path"] = path
+    return {"dataModelUpdate": msg}
+
+
+def setup_state():
+    state = A2UIState()
+    apply_a2ui_messages(
+        state,
+        [
+            {"surfaceUpdate": {"surfaceId": "main", "components": [{"id": "t", "component": {"Text": {"text": {"path": "/user/name"}}}}]}},
+            update(
+                None,
+                [
+                    {"key": "user", "valueMap": [{"key": "name", "valueString": "Ann"}]},
+                    {"key": "order", "valueMap": [{"key": "total", "valueNumber": 1}]},
+                ],
+            ),
+            {"beginRendering": {"surfaceId": "main", "root": "t"}},
+        ],
+    )
+    return state
+
+
+def test_snapshot_is_not_affected_by_later_updates():
+    state = setup_state()
+    surface = state.surfaces["main"]
+    snap = surface.snapshot_data_model()
+    assert surface.snapshot_data_model() is snap
+
+    apply_a2ui_messages(state, [update("/user", [{"key": "name", "valueString": "Bob"}])])
+
+    assert snap["user"]["name"] == "Ann"
+    assert surface.data_model["user"]["name"] == "Bob"
+    # 没改动的子树共享
+    assert surface.data_model["order"] is snap["order"]
+    assert a2ui_surface_to_line_flex(surface=surface)["contents"]["body"]["contents"][0]["text"] == "Bob"
+
+
+def test_persistent_versions_are_read_only_and_root_update_replaces():
+    state = setup_state()
+    surface = state.surfaces["main"]
+    snap = surface.snapshot_data_model()
+    with pytest.raises(TypeError):
+        snap["user"]["name"] = "x"
+
+    apply_a2ui_messages(state, [update("/a/b", [{"key": "c", "valueBoolean": True}])])
+    assert surface.data_model["a"]["b"]["c"] is True
+    assert "a" not in snap
+
+    apply_a2ui_messages(state, [update(None, [{"key": "only", "valueString": "x"}])])
+    assert surface.data_model == {"only": "x"}
+    assert snap["user"]["name"] == "Ann"
+
+
+def test_render_view_is_isolated_from_later_ingest():
+    state = setup_state()
+    surface = state.surfaces["main"]
+    view = surface.render_view()
+
+    apply_a2ui_messages(
+        state,
+        [
+            update("/user", [{"key": "name", "valueString": "Bob"}]),
+            {"surfaceUpdate": {"surfaceId": "main", "components": [{"id": "x", "component": {"Text": {"text": {"literalString": "new"}}}}]}},
+        ],
+    )
+
+    assert "x" not in view.components and "x" in surface.components
+    assert a2ui_surface_to_line_flex(surface=view)["contents"]["body"]["contents"][0]["text"] == "Ann"
+    assert a2ui_surface_to_line_flex(surface=surface)["contents"]["body"]["contents"][0]["text"] == "Bob"
@@ -0,0 +1,58 @@
+import asyncio
+
+import pytest
+
+from app.dispatch import dispatch_keyed
+
+
+@pytest.mark.asyncio
+async def test_keeps_order_per_key_and_runs_keys_concurrently():
+    seen: list[tuple[str, int]] = []
+    in_flight = 0
+    peak = 0
+
+    async def handler(item):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        seen.append(item)
+        in_flight -= 1
+
+    items = [(k, i) for i in range(3) for k in ("a", "b", "c", "d")]
+    errors = await dispatch_keyed(items, key=lambda it: it[0], handler=handler, concurrency=2)
+
+    assert errors == []
+    assert peak == 2
+    for k in "abcd":
+        assert [i for kk, i in seen if kk == k] == [0, 1, 2]
+
+
+@pytest.mark.asyncio
+async def test_failing_event_does_not_abort_the_rest():
+    done = []
+
+    async def handler(item):
+        if item == 2:
+            raise RuntimeError("LINE reply failed: 400")
+        done.append(item)
+
+    errors = await dispatch_keyed([1, 2, 3], key=lambda it: "same", handler=handler, concurrency=4)
+
+    assert done == [1, 3]
+    assert len(errors) == 1 and isinstance(errors[0], RuntimeError)
+
+
+@pytest.mark.asyncio
+async def test_events_without_key_are_independent():
+    started = []
+
+    async def handler(item):
+        started.append(item)
+        await asyncio.sleep(0.01)
+
+    await asyncio.wait_for(
+        dispatch_keyed(range(8), key=lambda it: None, handler=handler, concurrency=8),
+        timeout=0.05,
+    )
+    assert sorted(started) == list(range(8))
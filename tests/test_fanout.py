@@ -0,0 +1,95 @@
+import json
+
+import httpx
+import pytest
+
+from app import line_api
+from app.a2ui_state import A2UIState, apply_a2ui_messages
+from app.a2ui_to_flex import a2ui_surface_to_line_flex
+from app.agent import carousel_card
+from app.fanout import fan_out, plan_fanout, send_to_many
+
+
+def test_plan_coalesces_identical_payloads_and_chunks():
+    promo = [{"type": "text", "text": f"m{i}"} for i in range(7)]
+    other = [{"type": "text", "text": "other"}]
+    deliveries = [(f"U{i}", promo) for i in range(1200)] + [("V1", other), ("U0", promo)]
+
+    batches = plan_fanout(deliveries)
+
+    assert [len(b.to) for b in batches] == [500, 500, 200, 1]
+    assert [len(json.loads(c)) for c in batches[0].chunks] == [5, 2]
+    assert batches[0].chunks is batches[1].chunks
+
+
+@pytest.fixture
+def fast_retries(line_resilience):
+    line_resilience(
+        rate=10000.0, burst=10000.0, max_attempts=3, base_delay=0.001, max_delay=0.002,
+        window=5.0, failure_threshold=5, reset_timeout=10.0, multicast_rate=10000.0,
+    )
+
+
+@pytest.mark.asyncio
+async def test_send_to_many_uses_multicast_and_push(fast_retries):
+    calls = []
+
+    def handler(request):
+        calls.append((request.url.path, json.loads(request.content), request.headers.get("x-line-retry-key")))
+        return httpx.Response(200, json={})
+
+    client = line_api.create_line_client(transport=httpx.MockTransport(handler))
+    state = A2UIState()
+    apply_a2ui_messages(state, carousel_card())
+    promo = [a2ui_surface_to_line_flex(surface=state.surfaces["main"], alt_text="promo")]
+
+    result = await send_to_many([f"U{i}" for i in range(1200)], promo, channel_access_token="t", client=client)
+    single = await fan_out([("U9", promo)], channel_access_token="t", client=client)
+    await client.aclose()
+
+    assert result.requests == 3 and result.recipients == 1200 and not result.failed
+    assert single.requests == 1
+    paths = sorted(path for path, _, _ in calls)
+    assert paths == ["/v2/bot/message/multicast"] * 3 + ["/v2/bot/message/push"]
+    assert all(body["messages"] == promo for _, body, _ in calls)
+    assert len({key for _, _, key in calls}) == 4
+
+
+@pytest.mark.asyncio
+async def test_failed_chunk_does_not_fail_the_rest(fast_retries):
+    calls = []
+
+    def handler(request):
+        body = json.loads(request.content)
+        calls.append(body["messages"][0]["text"])
+        # 第一批收件人的第二段一直失败（不会重试成功的 400）
+        if body["to"][0] == "U0" and body["messages"][0]["text"] == "m5":
+            return httpx.Response(400, json={"message": "bad"})
+        return httpx.Response(200, json={})
+
+    client = line_api.create_line_client(transport=httpx.MockTransport(handler))
+    messages = [{"type": "text", "text": f"m{i}"} for i in range(12)]
+    result = await send_to_many([f"U{i}" for i in range(600)], messages, channel_access_token="t", client=client)
+    await client.aclose()
+
+    # 两批收件人（500 + 100）x 三段消息：每段都发了，只有一段失败
+    assert len(result.chunks) == 6 and len(calls) == 6
+    bad = [c for c in result.chunks if c.error is not None]
+    assert [(len(c.to), c.index) for c in bad] == [(500, 1)]
+    assert isinstance(bad[0].error, line_api.LineApiError)
+    assert result.requests == 5
+    assert result.recipients == 100 and len(result.failed) == 500
+
+
+def test_multicast_has_its_own_rate_limit(line_resilience):
+    line_resilience(
+        rate=1000.0, burst=200.0, max_attempts=3, base_delay=0.001, max_delay=0.002,
+        window=5.0, failure_threshold=5, reset_timeout=10.0,
+    )
+    multicast = line_api._bucket("t", line_api.MULTICAST_PATH)
+    push = line_api._bucket("t", "/v2/bot/message/push")
+
+    assert multicast is not push
+    assert push is line_api._bucket("t", "/v2/bot/message/reply")
+    assert (multicast.rate, multicast.burst) == (200.0, 200.0)
+    assert (push.rate, push.burst) == (1000.0, 200.0)
@@ -0,0 +1,126 @@
+import pytest
+
+from app.a2ui_state import A2UIState, apply_a2ui_messages
+from app.a2ui_to_flex import FlexBudget, FlexConverter, a2ui_surface_to_line_messages, json_size
+
+
+def column_surface(n, text="row"):
+    components = [{"id": "root", "component": {"Column": {"children": {"explicitList": [f"t{i}" for i in range(n)]}}}}]
+    components += [{"id": f"t{i}", "component": {"Text": {"text": {"literalString": f"{text} {i}"}}}} for i in range(n)]
+    state = A2UIState()
+    apply_a2ui_messages(
+        state,
+        [
+            {"surfaceUpdate": {"surfaceId": "main", "components": components}},
+            {"beginRendering": {"surfaceId": "main", "root": "root"}},
+        ],
+    )
+    return state.surfaces["main"]
+
+
+def test_byte_accounting_matches_serialized_size():
+    surface = column_surface(20)
+    conv = FlexConverter(surface)
+    body = conv.convert("root", "box")
+    assert conv.used_bytes == json_size(body)
+    assert conv.used_nodes == 21
+
+    # 第二次渲染全部命中缓存，记账结果一样
+    conv = FlexConverter(surface)
+    assert conv.convert("root", "box") is body
+    assert conv.used_bytes == json_size(body)
+
+
+def test_truncate_stops_at_node_budget():
+    surface = column_surface(50)
+    [msg] = a2ui_surface_to_line_messages(surface=surface, budget=FlexBudget(max_nodes=10))
+    rows = msg["contents"]["body"]["contents"]
+    assert len(rows) == 9  # 加上 Column 自己共 10 个节点
+    assert rows[-1]["text"] == "row 8"
+
+
+def test_truncate_keeps_message_under_bubble_limit():
+    surface = column_surface(2000, text="x" * 40)
+    [msg] = a2ui_surface_to_line_messages(surface=surface)
+    assert 0 < len(msg["contents"]["body"]["contents"]) < 2000
+    assert json_size(msg["contents"]) <= FlexBudget().max_bubble_bytes
+
+
+def test_paginate_splits_into_bubbles():
+    surface = column_surface(25)
+    msgs = a2ui_surface_to_line_messages(surface=surface, budget=FlexBudget(max_nodes=10, overflow="paginate"))
+    pages = [[t["text"] for t in m["contents"]["body"]["contents"]] for m in msgs]
+    assert [len(p) for p in pages] == [9, 9, 7]
+    assert sum(pages, []) == [f"row {i}" for i in range(25)]
+
+
+def test_paginate_caps_message_count():
+    surface = column_surface(200)
+    msgs = a2ui_surface_to_line_messages(surface=surface, budget=FlexBudget(max_nodes=10, overflow="paginate"))
+    assert len(msgs) == 5
+
+
+def test_degrade_to_text():
+    surface = column_surface(50)
+    [msg] = a2ui_surface_to_line_messages(surface=surface, alt_text="menu", budget=FlexBudget(max_nodes=5, overflow="degrade"))
+    assert msg == {"type": "text", "text": "menu\nrow 0\nrow 1\nrow 2\nrow 3"}
+
+
+def test_unknown_policy_rejected():
+    with pytest.raises(ValueError):
+        FlexBudget(overflow="explode")
+
+
+
+def template_columns_surface(columns, rows, pad=0):
+    # 每个 Column 的行都按模板逐项渲染（不走缓存），截断时大量节点被丢掉/退回
+    root = {"id": "root", "component": {"Column": {"children": {"explicitList": [f"c{i}" for i in range(columns)]}}}}
+    components = [root, {"id": "row", "component": {"Text": {"text": {"path": "name"}}}}]
+    components += [
+        {"id": f"c{i}", "component": {"Column": {"children": {"template": {"componentId": "row", "dataBinding": f"/l{i}"}}}}}
+        for i in range(columns)
+    ]
+    contents = [
+        {"key": f"l{i}", "valueArray": [{"valueMap": [{"key": "name", "valueString": f"item {i}-{j} " + "x" * pad}]} for j in range(rows)]}
+        for i in range(columns)
+    ]
+    state = A2UIState()
+    apply_a2ui_messages(
+        state,
+        [
+            {"surfaceUpdate": {"surfaceId": "main", "components": components}},
+            {"dataModelUpdate": {"surfaceId": "main", "contents": contents}},
+            {"beginRendering": {"surfaceId": "main", "root": "root"}},
+        ],
+    )
+    return state.surfaces["main"]
+
+
+@pytest.mark.parametrize("overflow,pad,bubbles", [("paginate", 20, 2), ("truncate", 20, 1), ("truncate", 60, 1)])
+def test_overflowing_template_rows_stay_within_bubble_limit(overflow, pad, bubbles):
+    budget = FlexBudget(overflow=overflow)
+    msgs = a2ui_surface_to_line_messages(surface=template_columns_surface(2, 300, pad), budget=budget)
+    assert len(msgs) == bubbles
+    for m in msgs:
+        assert 0 < json_size(m["contents"]) <= budget.max_bubble_bytes
+        assert m["contents"]["body"]["contents"][0]["contents"]
+
+
+def test_truncated_accounting_matches_serialized_size():
+    # 截断时容器的外壳和逗号也预先计入，第一列放不下时保留能放下的前几行，而不是整列丢掉
+    conv = FlexConverter(template_columns_surface(2, 300, 60))
+    body = conv.convert("root", "box")
+    assert conv.truncated
+    assert conv.used_bytes == json_size(body) <= conv.max_bytes
+    assert len(body["contents"]) == 1 and body["contents"][0]["contents"]
+
+
+def test_size_ledger_is_not_fooled_by_reused_ids():
+    # 被丢掉的节点释放后，CPython 会把它的 id 给新对象；模拟这种情况
+    conv = FlexConverter(column_surface(1))
+    stale = {"type": "text", "text": "x"}
+    conv.size_of(stale)
+    fresh = {"type": "box", "layout": "vertical", "contents": [{"type": "text", "text": "y" * 100}]}
+    conv._sizes[id(fresh)] = conv._sizes.pop(id(stale))
+    assert conv.known_size(fresh) is None
+    assert conv.size_of(fresh) == (json_size(fresh), 2)
@@ -0,0 +1,41 @@
+from app.a2ui_state import A2UIState, apply_a2ui_messages
+from app.a2ui_to_flex import MAX_DEPTH, a2ui_surface_to_line_flex
+
+
+def render(components, root):
+    state = A2UIState()
+    apply_a2ui_messages(
+        state,
+        [
+            {"surfaceUpdate": {"surfaceId": "main", "components": components}},
+            {"beginRendering": {"surfaceId": "main", "root": root}},
+        ],
+    )
+    return a2ui_surface_to_line_flex(surface=state.surfaces["main"])
+
+
+def test_very_deep_tree_is_cut_at_max_depth_without_recursion_error():
+    n = 5000
+    components = [{"id": f"c{i}", "component": {"Card": {"child": f"c{i + 1}"}}} for i in range(n)]
+    components.append({"id": f"c{n}", "component": {"Text": {"text": {"literalString": "leaf"}}}})
+    node = render(components, "c0")["contents"]["body"]
+
+    depth = 0
+    while node.get("contents"):
+        node = node["contents"][0]
+        depth += 1
+    assert depth <= 2 * MAX_DEPTH + 2
+    assert node["text"].startswith("[Unsupported component: TooDeep")
+
+
+def test_reference_cycle_renders_placeholder():
+    components = [
+        {"id": "root", "component": {"Column": {"children": {"explicitList": ["a"]}}}},
+        {"id": "a", "component": {"Card": {"child": "b"}}},
+        {"id": "b", "component": {"Column": {"children": {"explicitList": ["t", "a"]}}}},
+        {"id": "t", "component": {"Text": {"text": {"literalString": "hi"}}}},
+    ]
+    body = render(components, "root")["contents"]["body"]
+    inner = body["contents"][0]["contents"][0]["contents"]
+    assert inner[0]["text"] == "hi"
+    assert inner[1]["text"].startswith("[Unsupported component: Cycle id=a")
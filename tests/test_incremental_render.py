@@ -0,0 +1,107 @@
+from app.a2ui_state import A2UIState, apply_a2ui_messages
+from app.a2ui_to_flex import a2ui_surface_to_line_flex
+
+
+def dashboard(n):
+    rows = [f"row{i}" for i in range(n)]
+    components = [{"id": "root", "component": {"Column": {"children": {"explicitList": rows + ["btn"]}}}}]
+    for i in range(n):
+        components.append(
+            {"id": f"row{i}", "component": {"Row": {"children": {"explicitList": [f"label{i}", f"value{i}"]}}}}
+        )
+        components.append({"id": f"label{i}", "component": {"Text": {"text": {"literalString": f"Metric {i}"}}}})
+        components.append({"id": f"value{i}", "component": {"Text": {"text": {"path": f"/metrics/m{i}"}}}})
+    components.append({"id": "btn", "component": {"Button": {"child": "btnText", "action": {"name": "refresh"}}}})
+    components.append({"id": "btnText", "component": {"Text": {"text": {"literalString": "Refresh"}}}})
+    return [
+        {"surfaceUpdate": {"surfaceId": "main", "components": components}},
+        {
+            "dataModelUpdate": {
+                "surfaceId": "main",
+                "contents": [
+                    {"key": "metrics", "valueMap": [{"key": f"m{i}", "valueNumber": i} for i in range(n)]}
+                ],
+            }
+        },
+        {"beginRendering": {"surfaceId": "main", "root": "root"}},
+    ]
+
+
+def render(state):
+    return a2ui_surface_to_line_flex(surface=state.surfaces["main"])
+
+
+def test_data_update_rerenders_only_bound_subtree():
+    state = A2UIState()
+    apply_a2ui_messages(state, dashboard(50))
+    before = render(state)["contents"]["body"]["contents"]
+
+    apply_a2ui_messages(
+        state,
+        [{"dataModelUpdate": {"surfaceId": "main", "path": "/metrics", "contents": [{"key": "m7", "valueNumber": 700}]}}],
+    )
+    after = render(state)["contents"]["body"]["contents"]
+
+    assert after[7]["contents"][1]["text"] == "700"
+    assert after[7] is not before[7]
+    assert all(after[i] is before[i] for i in range(50) if i != 7)
+    assert after[50] is before[50]
+
+
+def test_component_replacement_invalidates_ancestors_only():
+    state = A2UIState()
+    apply_a2ui_messages(state, dashboard(5))
+    before = render(state)["contents"]["body"]["contents"]
+
+    apply_a2ui_messages(
+        state,
+        [
+            {
+                "surfaceUpdate": {
+                    "surfaceId": "main",
+                    "components": [{"id": "btnText", "component": {"Text": {"text": {"literalString": "Reload"}}}}],
+                }
+            }
+        ],
+    )
+    after = render(state)["contents"]["body"]["contents"]
+
+    assert after[5]["action"]["label"] == "Reload"
+    assert all(after[i] is before[i] for i in range(5))
+
+
+def test_root_data_model_replacement_invalidates_all_bindings():
+    state = A2UIState()
+    apply_a2ui_messages(state, dashboard(3))
+    render(state)
+
+    apply_a2ui_messages(
+        state,
+        [
+            {
+                "dataModelUpdate": {
+                    "surfaceId": "main",
+                    "contents": [{"key": "metrics", "valueMap": [{"key": "m0", "valueString": "zero"}]}],
+                }
+            }
+        ],
+    )
+    rows = render(state)["contents"]["body"]["contents"]
+    assert [r["contents"][1]["text"] for r in rows[:3]] == ["zero", "", ""]
+
+
+def test_late_component_invalidates_parent_that_skipped_it():
+    state = A2UIState()
+    messages = dashboard(3)
+    components = messages[0]["surfaceUpdate"]["components"]
+    late = next(c for c in components if c["id"] == "label1")
+    components.remove(late)
+    apply_a2ui_messages(state, messages)
+    before = render(state)["contents"]["body"]["contents"]
+    assert [t["text"] for t in before[1]["contents"]] == ["1"]
+
+    apply_a2ui_messages(state, [{"surfaceUpdate": {"surfaceId": "main", "components": [late]}}])
+    after = render(state)["contents"]["body"]["contents"]
+
+    assert [t["text"] for t in after[1]["contents"]] == ["Metric 1", "1"]
+    assert after[0] is before[0] and after[2] is before[2]
@@ -0,0 +1,65 @@
+import random
+import re
+
+import pytest
+
+from app.agent import INTENTS, decide_a2ui_response, intent_router
+from app.intent_router import Intent, IntentRouter
+
+
+def reference_route(intents, text):
+    # 原来的写法：按顺序逐条 re.search
+    for intent in intents:
+        alts = [re.escape(k) for k in intent.keywords] + [rf"\b{re.escape(w)}\b" for w in intent.words]
+        if re.search("|".join(alts), text, re.I):
+            return intent.name
+    return None
+
+
+def routed_name(router, text):
+    intent = router.route(text)
+    return intent.name if intent else None
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("Hello!", "hello"),
+        ("this is nothing", None),  # "hi" 只能整词命中
+        ("我想订位然后看列表", "booking"),
+        ("show me the list, then confirm", "carousel"),
+        ("musicarousel", "carousel"),  # 重叠的关键词也按优先级
+        ("where is the 餐廳", "booking"),
+        ("HELP", "help"),
+        ("今天天氣如何", None),
+    ],
+)
+def test_routes_by_priority(text, expected):
+    assert routed_name(intent_router, text) == expected
+    assert reference_route(INTENTS, text) == expected
+
+
+def test_matches_sequential_search_on_random_text():
+    rnd = random.Random(42)
+    vocab = ["hi", "hello", "his", "list", "music", "car", "ousel", "確認", "位置", "help", " ", "_", "x", "你好", "o"]
+    for _ in range(3000):
+        text = "".join(rnd.choice(vocab) for _ in range(rnd.randint(0, 8)))
+        assert routed_name(intent_router, text) == reference_route(INTENTS, text), text
+
+
+def test_word_and_keyword_sharing_a_prefix():
+    intents = [
+        Intent("word", lambda: [], words=("ab",)),
+        Intent("plain", lambda: [], keywords=("abc",)),
+        Intent("short", lambda: [], keywords=("a",)),
+    ]
+    router = IntentRouter(intents)
+    for text in ["ab", "abc", "xab", "ab c", "a", "zzz", "ab_", "ab-abc"]:
+        assert routed_name(router, text) == reference_route(intents, text), text
+
+
+@pytest.mark.asyncio
+async def test_decide_uses_router_and_falls_back():
+    assert "Carousel" in (await decide_a2ui_response(user_text="輪播"))[0]["surfaceUpdate"]["components"][0]["component"]
+    fallback = await decide_a2ui_response(user_text="  今天天氣如何  ")
+    assert fallback[0]["surfaceUpdate"]["components"][2]["component"]["Text"]["text"]["literalString"] == "今天天氣如何"
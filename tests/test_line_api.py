@@ -0,0 +1,186 @@
+import asyncio
+import json
+import time
+
+import httpx
+import pytest
+
+from app import line_api
+from app.resilience import TokenBucket
+
+
+@pytest.mark.asyncio
+async def test_reply_uses_shared_client_and_base_url():
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(200, json={})
+
+    client = await line_api.open_line_client(
+        base_url="http://line-standin.local", transport=httpx.MockTransport(handler)
+    )
+    try:
+        for token in ("r1", "r2"):
+            await line_api.reply_to_line(
+                channel_access_token="secret-token",
+                reply_token=token,
+                messages=[{"type": "text", "text": "你好"}],
+            )
+        assert line_api.get_line_client() is client
+    finally:
+        await line_api.close_line_client()
+
+    assert [str(r.url) for r in requests] == ["http://line-standin.local/v2/bot/message/reply"] * 2
+    assert requests[0].headers["authorization"] == "Bearer secret-token"
+    assert json.loads(requests[1].content) == {"replyToken": "r2", "messages": [{"type": "text", "text": "你好"}]}
+
+
+@pytest.mark.asyncio
+async def test_reply_raises_on_error_status():
+    client = line_api.create_line_client(
+        transport=httpx.MockTransport(lambda request: httpx.Response(400, text="Invalid reply token"))
+    )
+    with pytest.raises(RuntimeError, match="400 Invalid reply token"):
+        await line_api.reply_to_line(channel_access_token="t", reply_token="r", messages=[], client=client)
+    await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_loading_animation_rounds_seconds_to_allowed_values():
+    bodies = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        assert request.url.path == "/v2/bot/chat/loading/start"
+        bodies.append(json.loads(request.content))
+        return httpx.Response(202, json={})
+
+    client = line_api.create_line_client(transport=httpx.MockTransport(handler))
+    for seconds in (1, 22, 600):
+        await line_api.start_loading_animation(channel_access_token="t", chat_id="U1", seconds=seconds, client=client)
+    await client.aclose()
+    assert [b["loadingSeconds"] for b in bodies] == [5, 20, 60]
+    assert bodies[0]["chatId"] == "U1"
+
+
+@pytest.fixture(autouse=True)
+def restore_resilience(line_resilience):
+    # fast_policy 改的全局配置在每个测试结束后还原
+    return line_resilience
+
+
+def fast_policy(**overrides):
+    params = dict(
+        rate=1000.0,
+        burst=100.0,
+        max_attempts=5,
+        base_delay=0.001,
+        max_delay=0.002,
+        window=5.0,
+        failure_threshold=3,
+        reset_timeout=60.0,
+    )
+    params.update(overrides)
+    line_api.configure_resilience(**params)
+
+
+def scripted_client(statuses):
+    calls = []
+
+    def handler(request):
+        status, headers = statuses[min(len(calls), len(statuses) - 1)]
+        calls.append(request)
+        return httpx.Response(status, headers=headers, text="err" if status >= 300 else "{}")
+
+    return line_api.create_line_client(transport=httpx.MockTransport(handler)), calls
+
+
+@pytest.mark.asyncio
+async def test_retries_429_honouring_retry_after():
+    fast_policy()
+    client, calls = scripted_client([(429, {"Retry-After": "0"}), (200, {})])
+
+    await line_api.reply_to_line(channel_access_token="t", reply_token="r", messages=[], client=client)
+
+    assert len(calls) == 2
+    stats = line_api.resilience_stats()
+    assert stats["throttled"] >= 1 and stats["circuit"] == "closed"
+    await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_does_not_retry_past_reply_deadline():
+    fast_policy(base_delay=10.0, max_delay=10.0)
+    client, calls = scripted_client([(503, {})])
+
+    with pytest.raises(line_api.LineApiError) as e:
+        await line_api.reply_to_line(
+            channel_access_token="t", reply_token="r", messages=[], deadline=time.time(), client=client
+        )
+    assert e.value.status_code == 503
+    assert len(calls) == 1
+    await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_circuit_opens_and_sheds_load():
+    fast_policy(max_attempts=1, failure_threshold=2)
+    client, calls = scripted_client([(500, {})])
+
+    for _ in range(2):
+        with pytest.raises(line_api.LineApiError):
+            await line_api.reply_to_line(channel_access_token="t", reply_token="r", messages=[], client=client)
+    with pytest.raises(line_api.CircuitOpenError):
+        await line_api.reply_to_line(channel_access_token="t", reply_token="r", messages=[], client=client)
+
+    assert len(calls) == 2
+    assert line_api.resilience_stats()["circuit"] == "open"
+    assert line_api.resilience_stats()["circuit_rejected"] == 1
+    await client.aclose()
+    fast_policy()
+
+
+def test_token_bucket_reserves_in_order():
+    now = [0.0]
+    bucket = TokenBucket(rate=10.0, burst=2.0, clock=lambda: now[0])
+
+    assert bucket.reserve() == 0.0
+    assert bucket.reserve() == 0.0
+    assert bucket.reserve() == pytest.approx(0.1)
+    assert bucket.reserve() == pytest.approx(0.2)
+    now[0] = 1.0
+    assert bucket.reserve() == 0.0
+
+
+@pytest.mark.asyncio
+async def test_cancelled_half_open_probe_releases_the_probe_slot():
+    fast_policy(max_attempts=1, failure_threshold=1, reset_timeout=0.01)
+    hang = asyncio.Event()
+    healthy = False
+
+    async def handler(request):
+        if not healthy:
+            if line_api.breaker.probing:
+                await hang.wait()  # 探测请求卡住，随后被取消
+            return httpx.Response(500, text="err")
+        return httpx.Response(200, json={})
+
+    client = line_api.create_line_client(transport=httpx.MockTransport(handler))
+    with pytest.raises(line_api.LineApiError):
+        await line_api.reply_to_line(channel_access_token="t", reply_token="r", messages=[], client=client)
+    await asyncio.sleep(0.02)
+
+    probe = asyncio.create_task(
+        line_api.reply_to_line(channel_access_token="t", reply_token="r", messages=[], client=client)
+    )
+    await asyncio.sleep(0.01)
+    assert line_api.breaker.probing
+    probe.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await probe
+
+    healthy = True
+    await line_api.reply_to_line(channel_access_token="t", reply_token="r", messages=[], client=client)
+    assert line_api.resilience_stats()["circuit"] == "closed"
+    await client.aclose()
+    fast_policy()
@@ -0,0 +1,63 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import app.main as main
+from app.a2ui_state import A2UIState, apply_a2ui_messages
+
+
+def text_surface(surface_id, text):
+    return [
+        {
+            "surfaceUpdate": {
+                "surfaceId": surface_id,
+                "components": [{"id": "root", "component": {"Text": {"text": {"literalString": text}}}}],
+            }
+        },
+        {"beginRendering": {"surfaceId": surface_id, "root": "root"}},
+    ]
+
+
+def test_apply_returns_surfaces_rendered_in_batch():
+    state = A2UIState()
+    batch = text_surface("b", "B") + text_surface("a", "A") + text_surface("b", "B2") + text_surface("gone", "x")
+    batch.append({"deleteSurface": {"surfaceId": "gone"}})
+    assert apply_a2ui_messages(state, batch) == ["b", "a"]
+    assert apply_a2ui_messages(state, [{"dataModelUpdate": {"surfaceId": "a", "contents": []}}]) == []
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("workers", [0, 2])
+async def test_all_rendered_surfaces_go_out_in_one_reply(monkeypatch, line_sent, text_event, workers):
+    async def decide(*, user_text):
+        return text_surface("main", "first") + text_surface("side", "second")
+
+    executor = ThreadPoolExecutor(max_workers=workers) if workers else None
+    monkeypatch.setattr(main, "decide_a2ui_response", decide)
+    monkeypatch.setattr(main, "render_executor", executor)
+    try:
+        await main.handle_event(text_event(), A2UIState())
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    assert [s[0] for s in line_sent] == ["reply"]
+    texts = [m["contents"]["body"]["contents"][0]["text"] for m in line_sent[0][2]]
+    assert texts == ["first", "second"]
+
+
+@pytest.mark.asyncio
+async def test_data_only_turn_rerenders_main(monkeypatch, line_sent, text_event):
+    async def decide(*, user_text):
+        return []
+
+    monkeypatch.setattr(main, "decide_a2ui_response", decide)
+
+    await main.handle_event(text_event(), A2UIState())
+    assert line_sent == [("reply", "r", [{"type": "text", "text": "No surface"}])]
+
+    state = A2UIState()
+    apply_a2ui_messages(state, text_surface("main", "kept"))
+    await main.handle_event(text_event(), state)
+    messages = line_sent[1][2]
+    assert len(messages) == 1 and messages[0]["contents"]["body"]["contents"][0]["text"] == "kept"
@@ -0,0 +1,127 @@
+import pytest
+
+from app.a2ui_state import A2UIState, apply_a2ui_messages, decode_value, resolve_json_pointer
+from app.a2ui_to_flex import a2ui_surface_to_line_flex
+from app.record_table import RecordTable
+from app.session_backend import decode_state, encode_state
+
+
+def slots(n):
+    return {
+        "key": "slots",
+        "valueArray": [
+            {"valueMap": [{"key": "time", "valueString": f"{10 + i}:00"}, {"key": "free", "valueNumber": i}]}
+            for i in range(n)
+        ],
+    }
+
+
+def test_homogeneous_value_array_is_stored_by_column():
+    table = decode_value(slots(6))
+    assert isinstance(table, RecordTable)
+    assert len(table) == 6
+    assert table.column("time")[2] == "12:00"
+    assert table == [{"time": f"{10 + i}:00", "free": i} for i in range(6)]
+
+    data = {"slots": table}
+    assert resolve_json_pointer(data, "/slots/3/free") == 3
+    assert resolve_json_pointer(data, "/slots/3") == {"time": "13:00", "free": 3}
+    assert resolve_json_pointer(data, "/slots/3/missing") is None
+    assert resolve_json_pointer(data, "/slots/6/time") is None
+    assert resolve_json_pointer(data, "/slots/x/time") is None
+
+
+def test_small_or_mixed_arrays_stay_lists():
+    assert decode_value(slots(2)) == [{"time": "10:00", "free": 0}, {"time": "11:00", "free": 1}]
+    assert not isinstance(decode_value(slots(2)), RecordTable)
+    mixed = decode_value({"valueArray": [{"valueString": "a"}, {"valueNumber": 1}, {"valueBoolean": True}, {}]})
+    assert mixed == ["a", 1, True, None]
+
+
+def test_table_renders_and_survives_session_codec():
+    state = A2UIState()
+    apply_a2ui_messages(
+        state,
+        [
+            {"surfaceUpdate": {"surfaceId": "main", "components": [{"id": "t", "component": {"Text": {"text": {"path": "/slots/4/time"}}}}]}},
+            {"dataModelUpdate": {"surfaceId": "main", "contents": [slots(8)]}},
+            {"beginRendering": {"surfaceId": "main", "root": "t"}},
+        ],
+    )
+    restored = decode_state(encode_state(state))
+    surface = restored.surfaces["main"]
+    assert isinstance(surface.data_model["slots"], RecordTable)
+    assert surface.data_model == state.surfaces["main"].data_model
+    assert a2ui_surface_to_line_flex(surface=surface)["contents"]["body"]["contents"][0]["text"] == "14:00"
+
+
+def test_text_bound_to_whole_table_shows_the_rows():
+    state = A2UIState()
+    components = [
+        {"id": "root", "component": {"Column": {"children": {"explicitList": ["t", "b"]}}}},
+        {"id": "t", "component": {"Text": {"text": {"path": "/slots"}}}},
+        {"id": "b", "component": {"Button": {"child": "bt", "action": {"name": "pick"}}}},
+        {"id": "bt", "component": {"Text": {"text": {"path": "/slots"}}}},
+    ]
+    apply_a2ui_messages(
+        state,
+        [
+            {"surfaceUpdate": {"surfaceId": "main", "components": components}},
+            {"dataModelUpdate": {"surfaceId": "main", "contents": [slots(6)]}},
+            {"beginRendering": {"surfaceId": "main", "root": "root"}},
+        ],
+    )
+    assert isinstance(state.surfaces["main"].data_model["slots"], RecordTable)
+    text, button = a2ui_surface_to_line_flex(surface=state.surfaces["main"])["contents"]["body"]["contents"]
+    rows = str([{"time": f"{10 + i}:00", "free": i} for i in range(6)])
+    assert text["text"] == rows
+    assert button["action"]["label"] == rows
+
+
+def items_state(frozen):
+    state = A2UIState()
+    rows = [{"valueMap": [{"key": "name", "valueString": f"n{i}"}, {"key": "qty", "valueNumber": i}]} for i in range(5)]
+    apply_a2ui_messages(state, [{"dataModelUpdate": {"surfaceId": "main", "contents": [{"key": "items", "valueArray": rows}]}}])
+    surface = state.surfaces["main"]
+    if frozen:
+        surface.snapshot_data_model()
+    return state, surface
+
+
+def item_update(path, contents):
+    return [{"dataModelUpdate": {"surfaceId": "main", "path": path, "contents": contents}}]
+
+
+@pytest.mark.parametrize("frozen", [False, True])
+def test_path_update_into_table_row_keeps_other_rows(frozen):
+    state, surface = items_state(frozen)
+    before = surface.data_model
+    apply_a2ui_messages(state, item_update("/items/2", [{"key": "name", "valueString": "X"}]))
+    items = surface.data_model["items"]
+    assert isinstance(items, RecordTable)
+    assert [r["name"] for r in items] == ["n0", "n1", "X", "n3", "n4"]
+    assert items.row(2) == {"name": "X", "qty": 2}
+    if frozen:
+        assert before["items"].row(2)["name"] == "n2"  # 旧版本不受影响
+
+    # 新 key 让这一行和其他行不同构：退回普通 list，其余行照旧
+    apply_a2ui_messages(state, item_update("/items/1", [{"key": "note", "valueString": "hi"}]))
+    items = surface.data_model["items"]
+    assert isinstance(items, list) and len(items) == 5
+    assert items[1] == {"name": "n1", "qty": 1, "note": "hi"} and items[4]["name"] == "n4"
+
+    apply_a2ui_messages(state, item_update("/items/1", [{"key": "qty", "valueNumber": 9}]))
+    assert surface.data_model["items"][1]["qty"] == 9
+
+
+@pytest.mark.parametrize("frozen", [False, True])
+def test_path_update_at_list_replaces_elements_by_index_or_is_rejected(frozen):
+    state, surface = items_state(frozen)
+    apply_a2ui_messages(state, item_update("/items", [{"key": "0", "valueMap": [{"key": "name", "valueString": "A"}, {"key": "qty", "valueNumber": 7}]}]))
+    assert [r["name"] for r in surface.data_model["items"]] == ["A", "n1", "n2", "n3", "n4"]
+
+    before = surface.data_model["items"]
+    for path, key in (("/items/9", "name"), ("/items/x", "name"), ("/items", "name"), ("/items/-1", "name")):
+        apply_a2ui_messages(state, item_update(path, [{"key": key, "valueString": "lost?"}]))
+        assert surface.data_model["items"] == before
+    assert [r["name"] for r in surface.data_model["items"]] == ["A", "n1", "n2", "n3", "n4"]
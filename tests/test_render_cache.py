@@ -0,0 +1,54 @@
+import json
+
+from app.a2ui_state import A2UIState, apply_a2ui_messages
+from app.a2ui_to_flex import a2ui_surface_to_line_flex
+from app.agent import carousel_card, fallback_card, hello_card
+from app.line_api import encode_messages
+from app.render_cache import RenderCache, surface_fingerprint
+
+
+def surface_for(messages):
+    state = A2UIState()
+    apply_a2ui_messages(state, messages)
+    return state.surfaces["main"]
+
+
+def test_repeated_static_intent_hits_cache_with_identical_bytes():
+    cache = RenderCache(max_entries=8)
+    first = cache.render(surface_for(carousel_card()), alt_text="A2UI Demo")
+    second = cache.render(surface_for(carousel_card()), alt_text="A2UI Demo")
+
+    assert second is first
+    assert len(first) == 1
+    assert json.loads(first[0]) == a2ui_surface_to_line_flex(surface=surface_for(carousel_card()), alt_text="A2UI Demo")
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_fingerprint_depends_on_content_not_insertion_order():
+    a = surface_for(hello_card())
+    b = surface_for(hello_card())
+    b.components = dict(reversed(list(b.components.items())))
+    assert surface_fingerprint(a, "x") == surface_fingerprint(b, "x")
+
+    assert surface_fingerprint(a, "x") != surface_fingerprint(a, "y")
+    assert surface_fingerprint(a, "x") != surface_fingerprint(a, "x", offset=11)
+    assert surface_fingerprint(surface_for(fallback_card("a")), "x") != surface_fingerprint(
+        surface_for(fallback_card("b")), "x"
+    )
+
+    c = surface_for(hello_card())
+    c.data_model["name"] = "Alice"
+    assert surface_fingerprint(a, "x") != surface_fingerprint(c, "x")
+
+
+def test_lru_bound():
+    cache = RenderCache(max_entries=2)
+    for text in ("a", "b", "c"):
+        cache.render(surface_for(fallback_card(text)), alt_text="x")
+    assert cache.stats()["entries"] == 2
+    assert cache.stats()["evictions"] == 1
+
+
+def test_encode_messages_mixes_cached_bytes_and_dicts():
+    body = encode_messages([b'{"type":"text","text":"cached"}', {"type": "text", "text": "fresh"}])
+    assert json.loads(body) == [{"type": "text", "text": "cached"}, {"type": "text", "text": "fresh"}]
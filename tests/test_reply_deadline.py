@@ -0,0 +1,73 @@
+import asyncio
+import time
+
+import pytest
+
+import app.main as main
+from app.a2ui_state import A2UIState
+from app.agent import hello_card
+
+
+@pytest.fixture
+def sent(line_sent, monkeypatch):
+    monkeypatch.setattr(main.settings, "reply_placeholder", "text")
+    monkeypatch.setattr(main.settings, "reply_placeholder_after", 0.05)
+    return line_sent
+
+
+def agent(delay):
+    async def decide(*, user_text):
+        await asyncio.sleep(delay)
+        return hello_card()
+
+    return decide
+
+
+@pytest.mark.asyncio
+async def test_fast_agent_replies_once_without_placeholder(monkeypatch, sent, text_event):
+    monkeypatch.setattr(main, "decide_a2ui_response", agent(0))
+    await main.handle_event(text_event(), A2UIState())
+    await asyncio.sleep(0.1)
+    assert [s[0] for s in sent] == ["reply"]
+    assert sent[0][2][0]["type"] == "flex"
+
+
+@pytest.mark.asyncio
+async def test_slow_agent_gets_placeholder_then_push(monkeypatch, sent, text_event):
+    monkeypatch.setattr(main, "decide_a2ui_response", agent(0.3))
+    await main.handle_event(text_event(), A2UIState())
+    assert [s[0] for s in sent] == ["reply", "push"]
+    assert sent[0][2] == [{"type": "text", "text": main.settings.reply_placeholder_text}]
+    assert sent[1][2][0]["type"] == "flex"
+
+
+@pytest.mark.asyncio
+async def test_placeholder_timer_counts_from_local_processing_start(monkeypatch, sent, text_event):
+    # 事件的 timestamp 已经是 5 秒前（LINE 的时钟 / 重送）：agent 很快时不回占位，reply token 也还有效
+    monkeypatch.setattr(main.settings, "reply_placeholder_after", 1.0)
+    monkeypatch.setattr(main, "decide_a2ui_response", agent(0.05))
+    await main.handle_event(text_event(timestamp=int((time.time() - 5) * 1000)), A2UIState())
+    assert [s[0] for s in sent] == ["reply"]
+    assert sent[0][2][0]["type"] == "flex"
+
+
+@pytest.mark.asyncio
+async def test_loading_mode_keeps_reply_token_for_user_chats(monkeypatch, sent, text_event):
+    monkeypatch.setattr(main.settings, "reply_placeholder", "loading")
+    monkeypatch.setattr(main, "decide_a2ui_response", agent(0.2))
+    await main.handle_event(text_event(), A2UIState())
+    assert [s[0] for s in sent] == ["loading", "reply"]
+    assert sent[0][1] == "U1" and sent[1][2][0]["type"] == "flex"
+
+    sent.clear()
+    await main.handle_event(text_event(source={"type": "group", "groupId": "G1", "userId": "U1"}), A2UIState())
+    assert [s[0] for s in sent] == ["reply", "push"]
+
+
+@pytest.mark.asyncio
+async def test_expired_reply_token_falls_back_to_push(monkeypatch, sent, text_event):
+    monkeypatch.setattr(main.settings, "reply_placeholder", "off")
+    monkeypatch.setattr(main, "decide_a2ui_response", agent(0))
+    ts = int((time.time() - main.settings.line_reply_window_seconds - 1) * 1000)
+    await main.handle_event(text_event(timestamp=ts), A2UIState())
+    assert [s[0] for s in sent] == ["push"]
@@ -0,0 +1,138 @@
+import asyncio
+import sqlite3
+import time
+
+import pytest
+from fakeredis import FakeAsyncRedis
+
+from app.a2ui_state import A2UIState, apply_a2ui_messages
+from app.a2ui_to_flex import a2ui_surface_to_line_flex
+from app.agent import carousel_card, hello_card
+from app.session_backend import (
+    RedisSessionBackend,
+    SessionBackend,
+    SqliteSessionBackend,
+    decode_state,
+    encode_state,
+)
+
+
+def make_state(messages):
+    state = A2UIState()
+    apply_a2ui_messages(state, messages)
+    return state
+
+
+def test_encode_decode_roundtrip_renders_identically():
+    for messages in (hello_card(), carousel_card()):
+        state = make_state(messages)
+        data = encode_state(state)
+        restored = decode_state(data)
+
+        assert restored.surfaces["main"].root == "root"
+        assert a2ui_surface_to_line_flex(surface=restored.surfaces["main"]) == a2ui_surface_to_line_flex(
+            surface=state.surfaces["main"]
+        )
+
+    # 大一些的 state 会被压缩
+    assert encode_state(make_state(carousel_card()))[:1] == b"z"
+
+
+@pytest.mark.asyncio
+async def test_sqlite_backend_is_shared_between_workers(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    worker_a = SqliteSessionBackend(path)
+    worker_b = SqliteSessionBackend(path)
+
+    await worker_a.save_many({"user:U1": make_state(hello_card())})
+    loaded = await worker_b.load_many(["user:U1", "user:U2"])
+
+    assert list(loaded) == ["user:U1"]
+    assert loaded["user:U1"].surfaces["main"].components["root"].to_json() == {
+        "Column": {"children": {"explicitList": ["title", "desc", "btn"]}}
+    }
+    assert worker_b.stats() == {"backend": "sqlite", "hits": 1, "misses": 1, "conflicts": 0}
+
+    await worker_a.aclose()
+    await worker_b.aclose()
+
+
+@pytest.mark.asyncio
+async def test_redis_backend_batches_and_expires():
+    client = FakeAsyncRedis()
+    backend = RedisSessionBackend(client, ttl_seconds=60)
+
+    await backend.save_many({"user:U1": make_state(hello_card()), "user:U2": make_state(carousel_card())})
+    loaded = await backend.load_many(["user:U1", "user:U2", "user:U3"])
+
+    assert set(loaded) == {"user:U1", "user:U2"}
+    assert 0 < await client.ttl("a2ui:session:user:U1") <= 60
+
+    await backend.delete("user:U1")
+    assert await backend.load_many(["user:U1"]) == {}
+    await backend.aclose()
+
+
+def test_session_backend_is_abstract():
+    with pytest.raises(TypeError):
+        SessionBackend()
+
+
+async def assert_concurrent_save_keeps_first_writer(worker_a, worker_b):
+    await worker_a.save_many({"user:U1": make_state(hello_card())})
+    a = (await worker_a.load_many(["user:U1"]))["user:U1"]
+    b = (await worker_b.load_many(["user:U1"]))["user:U1"]
+    a.surfaces["main"].root = "from-a"
+    b.surfaces["main"].root = "from-b"
+
+    await worker_a.save_many({"user:U1": a})
+    # b 读到的版本已经被 a 改过：不覆盖
+    await worker_b.save_many({"user:U1": b})
+    assert (await worker_b.load_many(["user:U1"]))["user:U1"].surfaces["main"].root == "from-a"
+    assert worker_b.stats()["conflicts"] == 1
+
+    # 两个 worker 都以为对话是新的：先存的生效
+    await worker_a.save_many({"user:U2": make_state(hello_card())})
+    await worker_b.save_many({"user:U2": make_state(carousel_card())})
+    assert (await worker_a.load_many(["user:U2"]))["user:U2"].surfaces["main"].components.keys() == (
+        make_state(hello_card()).surfaces["main"].components.keys()
+    )
+    assert worker_b.stats()["conflicts"] == 2
+
+    # 保存成功后版本跟着更新，同一个对象可以接着保存
+    a.surfaces["main"].root = "again"
+    await worker_a.save_many({"user:U1": a})
+    assert (await worker_b.load_many(["user:U1"]))["user:U1"].surfaces["main"].root == "again"
+    assert worker_a.stats()["conflicts"] == 0
+
+
+@pytest.mark.asyncio
+async def test_sqlite_backend_rejects_stale_writes(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    worker_a, worker_b = SqliteSessionBackend(path), SqliteSessionBackend(path)
+    await assert_concurrent_save_keeps_first_writer(worker_a, worker_b)
+    await worker_a.aclose()
+    await worker_b.aclose()
+
+
+@pytest.mark.asyncio
+async def test_redis_backend_rejects_stale_writes():
+    client = FakeAsyncRedis()
+    await assert_concurrent_save_keeps_first_writer(RedisSessionBackend(client), RedisSessionBackend(client))
+    assert await client.ttl("a2ui:session:user:U1:v") > 0
+
+
+def test_sqlite_backend_adds_version_column_to_old_table(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE a2ui_sessions (key TEXT PRIMARY KEY, data BLOB NOT NULL, touched REAL NOT NULL)")
+    conn.execute("INSERT INTO a2ui_sessions VALUES (?, ?, ?)", ("user:U1", encode_state(make_state(hello_card())), time.time()))
+    conn.commit()
+    conn.close()
+
+    backend = SqliteSessionBackend(path)
+    state = asyncio.run(backend.load_many(["user:U1"]))["user:U1"]
+    assert state.version == 0
+    asyncio.run(backend.save_many({"user:U1": state}))
+    assert state.version == 1 and backend.stats()["conflicts"] == 0
+    asyncio.run(backend.aclose())
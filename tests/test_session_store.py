@@ -0,0 +1,200 @@
+import random
+
+import pytest
+
+from app import a2ui_state, main
+from app.a2ui_state import A2UIState, apply_a2ui_messages
+from app.a2ui_to_flex import a2ui_surface_to_line_messages, json_size
+from app.agent import hello_card
+from app.session_backend import MemorySessionBackend
+from app.session_store import SessionStore, estimate_state_bytes
+from app.webhook_events import event_session_key, events_from_json
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def session_key(source):
+    doc = {"type": "message"}
+    if source is not None:
+        doc["source"] = source
+    return event_session_key(events_from_json([doc])[0])
+
+
+def test_session_key_prefers_group_then_room_then_user():
+    assert session_key({"type": "user", "userId": "U1"}) == "user:U1"
+    assert session_key({"type": "group", "groupId": "G1", "userId": "U1"}) == "group:G1"
+    assert session_key({"type": "room", "roomId": "R1", "userId": "U1"}) == "room:R1"
+    assert session_key(None) is None
+
+
+def test_lru_eviction_and_counters():
+    store = SessionStore(shards=1, max_entries=2)
+    a = store.get_or_create("a")
+    store.get_or_create("b")
+    assert store.get("a") is a  # a 变成最近使用
+    store.get_or_create("c")
+
+    assert store.get("b") is None
+    assert store.get("a") is a
+    stats = store.stats()
+    assert stats["entries"] == 2
+    assert stats["evictions"] == 1
+    assert stats["hits"] == 2
+
+
+def test_byte_bound_evicts_oldest():
+    store = SessionStore(shards=1, max_bytes=12_000)
+    for key in ("a", "b", "c"):
+        state = A2UIState()
+        apply_a2ui_messages(state, hello_card())
+        store.put(key, state)
+
+    assert len(store) < 3
+    assert store.get("c") is not None
+    assert store.stats()["bytes"] <= 12_000
+
+
+def test_size_estimate_counts_cached_flex_subtrees():
+    state = A2UIState()
+    apply_a2ui_messages(state, hello_card())
+    before = estimate_state_bytes(state)
+    surface = state.surfaces["main"]
+    a2ui_surface_to_line_messages(surface=surface)
+
+    # 渲染留下的 Flex 缓存也占内存，要算进 session 的大小
+    assert surface.flex_cache
+    cached = sum(json_size(out) for out in surface.flex_cache.values())
+    assert estimate_state_bytes(state) > before + cached
+
+
+def test_idle_ttl_expires_sessions():
+    clock = FakeClock()
+    store = SessionStore(shards=1, ttl_seconds=10, clock=clock)
+    store.get_or_create("a")
+    clock.now = 5
+    assert store.get("a") is not None
+    clock.now = 14
+    assert store.get("a") is not None
+    clock.now = 30
+    assert store.get("a") is None
+    assert store.stats()["expirations"] == 1
+
+
+@pytest.mark.asyncio
+async def test_process_events_isolates_users(monkeypatch, text_event):
+    store = SessionStore()
+    monkeypatch.setattr(main, "session_backend", MemorySessionBackend(store))
+
+    await main.process_events([text_event("hello", user_id="U1"), text_event("location", user_id="U2")])
+
+    s1 = store.get("user:U1").surfaces["main"]
+    s2 = store.get("user:U2").surfaces["main"]
+    assert s1.components["root"].type == "Column"
+    assert s2.components["root"].type == "Location"
+
+
+def test_size_estimate_is_updated_incrementally(monkeypatch):
+    state = A2UIState()
+    apply_a2ui_messages(state, hello_card())
+    apply_a2ui_messages(
+        state,
+        [
+            {
+                "dataModelUpdate": {
+                    "surfaceId": "main",
+                    "path": "/",
+                    "contents": [
+                        {"key": "user", "valueMap": [{"key": "name", "valueString": "Ann"}]},
+                        {"key": "note", "valueString": "x" * 100},
+                    ],
+                }
+            }
+        ],
+    )
+    surface = state.surfaces["main"]
+    store = SessionStore(shards=1)
+    store.put("a", state)
+
+    # 之后的保存只编码改动的部分，不再把整个 state 编码一遍
+    encoded = []
+    real = a2ui_state.json_bytes
+    monkeypatch.setattr(a2ui_state, "json_bytes", lambda v: encoded.append(v) or real(v))
+    apply_a2ui_messages(
+        state,
+        [
+            {"dataModelUpdate": {"surfaceId": "main", "path": "/user", "contents": [{"key": "name", "valueString": "Bob Smith"}]}},
+            {"surfaceUpdate": {"surfaceId": "main", "components": [{"id": "extra", "component": {"Text": {"text": {"literalString": "hi"}}}}]}},
+        ],
+    )
+    store.put("a", state)
+    assert encoded == ["name", "Ann", "name", "Bob Smith", {"Text": {"text": {"literalString": "hi"}}}]
+
+    incremental = surface.approx_bytes()
+    surface.component_bytes = surface.data_bytes = None
+    assert incremental == surface.approx_bytes()
+    assert store.stats()["bytes"] == estimate_state_bytes(state)
+
+
+def data_update(path, contents):
+    return {"dataModelUpdate": {"surfaceId": "main", "path": path, "contents": contents}}
+
+
+def assert_tracked_size_is_exact(surface):
+    tracked = surface.approx_bytes()
+    surface.component_bytes = surface.data_bytes = None
+    assert tracked == surface.approx_bytes()
+
+
+def test_size_estimate_follows_replaced_and_created_path_entries():
+    state = A2UIState()
+    apply_a2ui_messages(state, [data_update("/", [])])
+    surface = state.surfaces["main"]
+    surface.approx_bytes()
+    for _ in range(10):
+        # 标量被换成新建的 object、object 又被换回标量：整个 x 都要重新计入
+        apply_a2ui_messages(state, [data_update("/", [{"key": "x", "valueString": "x" * 100_000}])])
+        assert_tracked_size_is_exact(surface)
+        apply_a2ui_messages(state, [data_update("/x", [{"key": "k", "valueString": "v"}])])
+        assert_tracked_size_is_exact(surface)
+    assert surface.data_bytes == len('{"x":{"k":"v"}}')
+
+    # 路径上缺失的 object 一路新建
+    apply_a2ui_messages(state, [data_update("/a/b/c", [{"key": "d", "valueNumber": 1}])])
+    assert_tracked_size_is_exact(surface)
+
+
+@pytest.mark.parametrize("frozen", [False, True])
+def test_size_estimate_matches_full_encoding_under_random_updates(frozen):
+    rng = random.Random(7)
+    keys = ["a", "b", "0", "1", "rows"]
+
+    def value(depth=0):
+        kind = rng.randrange(5 if depth < 2 else 2)
+        if kind == 0:
+            return {"valueString": "s" * rng.randrange(20)}
+        if kind == 1:
+            return {"valueNumber": rng.randrange(1000)}
+        if kind == 2:
+            return {"valueMap": [{"key": rng.choice(keys), **value(depth + 1)} for _ in range(rng.randrange(3))]}
+        if kind == 3:
+            return {"valueArray": [value(depth + 1) for _ in range(rng.randrange(4))]}
+        # 同构的 object 列表会存成 RecordTable
+        return {"valueArray": [{"valueMap": [{"key": "name", "valueString": f"n{i}"}]} for i in range(rng.randrange(1, 4))]}
+
+    state = A2UIState()
+    apply_a2ui_messages(state, [data_update("/", [])])
+    surface = state.surfaces["main"]
+    if frozen:
+        surface.snapshot_data_model()
+    surface.approx_bytes()
+    for _ in range(500):
+        path = "/" + "/".join(rng.choice(keys + ["name"]) for _ in range(rng.randrange(4)))
+        contents = [{"key": rng.choice(keys), **value()} for _ in range(rng.randrange(1, 3))]
+        apply_a2ui_messages(state, [data_update(path if path != "/" or rng.random() < 0.8 else None, contents)])
+        assert_tracked_size_is_exact(surface)
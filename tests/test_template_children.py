@@ -0,0 +1,91 @@
+from app.a2ui_state import A2UIState, apply_a2ui_messages
+from app.a2ui_to_flex import MAX_CAROUSEL_BUBBLES, a2ui_surface_to_line_flex
+
+
+def menu(n, root_type="Carousel"):
+    components = [
+        {"id": "root", "component": {root_type: {"children": {"template": {"componentId": "item", "dataBinding": "/menu"}}}}},
+        {"id": "item", "component": {"Column": {"children": {"explicitList": ["name", "price"]}}}},
+        {"id": "name", "component": {"Text": {"text": {"path": "name"}}}},
+        {"id": "price", "component": {"Text": {"text": {"path": "./price"}}}},
+    ]
+    rows = [
+        {"valueMap": [{"key": "name", "valueString": f"dish {i}"}, {"key": "price", "valueNumber": 100 + i}]}
+        for i in range(n)
+    ]
+    return [
+        {"surfaceUpdate": {"surfaceId": "main", "components": components}},
+        {"dataModelUpdate": {"surfaceId": "main", "contents": [{"key": "menu", "valueArray": rows}]}},
+        {"beginRendering": {"surfaceId": "main", "root": "root"}},
+    ]
+
+
+def texts(box):
+    return [c["text"] for c in box["contents"]]
+
+
+def test_carousel_template_expands_bound_list_up_to_bubble_limit():
+    state = A2UIState()
+    apply_a2ui_messages(state, menu(30))
+    msg = a2ui_surface_to_line_flex(surface=state.surfaces["main"])
+
+    bubbles = msg["contents"]["contents"]
+    assert len(bubbles) == MAX_CAROUSEL_BUBBLES
+    assert texts(bubbles[0]["body"]) == ["dish 0", "100"]
+    assert texts(bubbles[11]["body"]) == ["dish 11", "111"]
+
+
+def test_column_template_rerenders_when_list_changes():
+    state = A2UIState()
+    apply_a2ui_messages(state, menu(3, root_type="Column"))
+    surface = state.surfaces["main"]
+    rows = a2ui_surface_to_line_flex(surface=surface)["contents"]["body"]["contents"]
+    assert [texts(r) for r in rows] == [["dish 0", "100"], ["dish 1", "101"], ["dish 2", "102"]]
+
+    apply_a2ui_messages(
+        state,
+        [
+            {
+                "dataModelUpdate": {
+                    "surfaceId": "main",
+                    "path": "/menu",
+                    "contents": [{"key": "1", "valueMap": [{"key": "name", "valueString": "x"}]}],
+                }
+            }
+        ],
+    )
+    # path 指向 list 时 key 是下标：只替换第 1 项，其余的项保留
+    rows = a2ui_surface_to_line_flex(surface=surface)["contents"]["body"]["contents"]
+    assert [texts(r)[0] for r in rows] == ["dish 0", "x", "dish 2"]
+
+    apply_a2ui_messages(state, menu(2, root_type="Column")[1:2])
+    rows = a2ui_surface_to_line_flex(surface=surface)["contents"]["body"]["contents"]
+    assert [texts(r) for r in rows] == [["dish 0", "100"], ["dish 1", "101"]]
+
+
+def test_template_expansion_stops_at_size_budget():
+    state = A2UIState()
+    apply_a2ui_messages(state, menu(2000, root_type="Column"))
+    rows = a2ui_surface_to_line_flex(surface=state.surfaces["main"])["contents"]["body"]["contents"]
+    assert 0 < len(rows) < 2000
+
+
+def test_self_referencing_template_is_cut_as_cycle():
+    state = A2UIState()
+    apply_a2ui_messages(
+        state,
+        [
+            {
+                "surfaceUpdate": {
+                    "surfaceId": "main",
+                    "components": [
+                        {"id": "root", "component": {"Column": {"children": {"template": {"componentId": "root", "dataBinding": "."}}}}},
+                    ],
+                }
+            },
+            {"dataModelUpdate": {"surfaceId": "main", "contents": [{"key": "x", "valueString": "y"}]}},
+            {"beginRendering": {"surfaceId": "main", "root": "root"}},
+        ],
+    )
+    # 根节点不在模板作用域里，"." 解析不到 list，直接是空的
+    assert a2ui_surface_to_line_flex(surface=state.surfaces["main"])["contents"]["body"]["contents"] == []
@@ -0,0 +1,119 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import main, webhook_events
+from app.line_api import verify_line_signature
+from app.webhook_events import (
+    MessageEvent,
+    PostbackEvent,
+    event_session_key,
+    events_from_json,
+    events_to_json,
+    parse_webhook,
+)
+from app.work_queue import WorkQueue
+
+BODY = json.dumps(
+    {
+        "destination": "Uxxx",
+        "events": [
+            {
+                "type": "message",
+                "mode": "active",
+                "timestamp": 1700000000000,
+                "replyToken": "r1",
+                "webhookEventId": "01H",
+                "deliveryContext": {"isRedelivery": False},
+                "source": {"type": "group", "groupId": "G1", "userId": "U1"},
+                "message": {"type": "text", "id": "m1", "text": "hello", "emojis": [{"index": 0, "productId": "p"}]},
+            },
+            {"type": "follow", "replyToken": "r2", "source": {"type": "user", "userId": "U2"}},
+            {"type": "postback", "replyToken": "r3", "source": {"type": "user", "userId": "U3"}, "postback": {"data": "x", "params": {}}},
+            {"type": "unsend", "unsend": {"messageId": "m0"}},
+        ],
+    }
+).encode("utf-8")
+
+
+def test_parse_keeps_only_handled_events_as_typed_structs():
+    events = parse_webhook(BODY)
+    assert [type(ev) for ev in events] == [MessageEvent, PostbackEvent]
+
+    msg = events[0]
+    assert msg.reply_token == "r1" and msg.timestamp == 1700000000000
+    assert msg.message.text == "hello"
+    assert event_session_key(msg) == "group:G1"
+    assert msg.source.push_target() == "G1"
+    assert events[1].postback.data == "x"
+    assert not hasattr(msg, "__dict__")
+
+
+def test_unlisted_event_type_is_parsed_in_the_same_pass(monkeypatch):
+    calls = []
+    adapter = webhook_events._body_adapter
+
+    class CountingAdapter:
+        def validate_json(self, body):
+            calls.append(body)
+            return adapter.validate_json(body)
+
+    monkeypatch.setattr(webhook_events, "_body_adapter", CountingAdapter())
+    body = BODY.replace(b'"follow"', b'"membership"')
+    events = parse_webhook(body)
+    assert [type(ev) for ev in events] == [MessageEvent, PostbackEvent]
+    assert len(calls) == 1
+
+
+def test_events_round_trip_through_json():
+    events = parse_webhook(BODY)
+    doc = events_to_json(events)
+    assert doc[0]["replyToken"] == "r1" and doc[0]["source"]["groupId"] == "G1"
+    assert events_from_json(json.loads(json.dumps(doc))) == events
+
+
+def test_signature_uses_precomputed_state_and_rejects_garbage():
+    sig = base64.b64encode(hmac.new(b"secret", BODY, hashlib.sha256).digest()).decode("ascii")
+    assert verify_line_signature(channel_secret="secret", body=BODY, signature=sig)
+    assert verify_line_signature(channel_secret="secret", body=BODY, signature=sig)
+    assert not verify_line_signature(channel_secret="other", body=BODY, signature=sig)
+    assert not verify_line_signature(channel_secret="secret", body=BODY + b" ", signature=sig)
+    assert not verify_line_signature(channel_secret="secret", body=BODY, signature="簽名")
+
+
+@pytest.mark.asyncio
+async def test_spilled_typed_events_are_restored(tmp_path):
+    gate = asyncio.Event()
+    seen = []
+
+    async def handler(events):
+        await gate.wait()
+        seen.append(events)
+
+    q = WorkQueue(handler, maxsize=1, workers=1, spill_dir=str(tmp_path), dump=events_to_json, load=events_from_json)
+    await q.start()
+    events = parse_webhook(BODY)
+    for _ in range(3):
+        assert q.submit(events)
+    await asyncio.sleep(0)
+    assert q.stats()["spilled"] >= 1
+
+    gate.set()
+    for _ in range(100):
+        if len(seen) == 3:
+            break
+        await asyncio.sleep(0.01)
+    await q.stop()
+    assert seen == [events] * 3
+
+
+def test_webhook_rejects_malformed_payload(monkeypatch):
+    monkeypatch.setattr(main.settings, "allow_insecure_dev", True)
+    with TestClient(main.app) as client:
+        assert client.post("/webhook", content=b"not json").status_code == 400
+        assert client.post("/webhook", json={"events": [{"type": 1}]}).status_code == 400
@@ -0,0 +1,236 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import main, work_queue
+from app.webhook_events import MessageEvent
+from app.work_queue import WorkQueue
+
+
+@pytest.mark.asyncio
+async def test_spills_to_disk_when_full_and_drains_in_order(tmp_path):
+    gate = asyncio.Event()
+    seen = []
+
+    async def handler(events):
+        await gate.wait()
+        seen.append(events[0]["n"])
+
+    q = WorkQueue(handler, maxsize=2, workers=1, spill_dir=str(tmp_path))
+    await q.start()
+    for n in range(5):
+        assert q.submit([{"n": n}])
+    await asyncio.sleep(0)
+
+    stats = q.stats()
+    assert stats["spilled"] >= 2
+    assert stats["spill_pending"] == stats["spilled"]
+
+    gate.set()
+    for _ in range(100):
+        if len(seen) == 5:
+            break
+        await asyncio.sleep(0.01)
+    await q.stop()
+
+    assert seen == [0, 1, 2, 3, 4]
+    assert q.stats()["spill_pending"] == 0
+    assert q.stats()["processed"] == 5
+
+
+@pytest.mark.asyncio
+async def test_drops_without_spill_dir():
+    gate = asyncio.Event()
+
+    async def handler(events):
+        await gate.wait()
+
+    q = WorkQueue(handler, maxsize=1, workers=1)
+    await q.start()
+    await asyncio.sleep(0)
+    results = [q.submit([{}]) for _ in range(4)]
+    await asyncio.sleep(0)
+
+    assert results.count(False) >= 2
+    assert q.stats()["dropped"] == results.count(False)
+    gate.set()
+    await q.stop()
+
+
+def test_webhook_acks_before_processing(monkeypatch):
+    calls = []
+
+    async def slow_process(events):
+        await asyncio.sleep(0.05)
+        calls.append(events)
+
+    monkeypatch.setattr(main.settings, "webhook_mode", "queue")
+    monkeypatch.setattr(main.settings, "allow_insecure_dev", True)
+    monkeypatch.setattr(main, "process_events", slow_process)
+
+    with TestClient(main.app) as client:
+        r = client.post("/webhook", json={"events": [{"type": "message"}]})
+        assert r.status_code == 200
+        assert calls == []
+        assert client.get("/metrics").json()["work_queue"]["enqueued"] == 1
+
+    # 关闭时会把队列里剩下的批次处理完
+    assert calls == [[MessageEvent(type="message")]]
+
+
+@pytest.mark.asyncio
+async def test_same_key_batches_never_overlap_across_workers():
+    log = []
+
+    async def handler(events):
+        name = events[0]["n"]
+        log.append(("start", name))
+        await asyncio.sleep(0.02)
+        log.append(("end", name))
+
+    q = WorkQueue(handler, maxsize=10, workers=4, key=lambda ev: ev["k"])
+    await q.start()
+    q.submit([{"k": "user:U1", "n": "a"}])
+    q.submit([{"k": "user:U2", "n": "b"}])
+    q.submit([{"k": "user:U1", "n": "c"}, {"k": "user:U3", "n": "c"}])
+    q.submit([{"k": "user:U3", "n": "d"}])
+    await q.stop()
+
+    # 不同对话并发；同一个对话按提交顺序一个接一个
+    assert log[:2] == [("start", "a"), ("start", "b")]
+    assert log.index(("end", "a")) < log.index(("start", "c"))
+    assert log.index(("end", "c")) < log.index(("start", "d"))
+    assert q.stats()["processed"] == 4 and q._tails == {}
+
+
+@pytest.mark.asyncio
+async def test_batches_submitted_after_a_spill_wait_behind_it(tmp_path):
+    gate = asyncio.Event()
+    seen = []
+
+    async def handler(events):
+        await gate.wait()
+        seen.append(events[0]["n"])
+
+    q = WorkQueue(handler, maxsize=2, workers=1, spill_dir=str(tmp_path))
+    await q.start()
+    for n in range(4):
+        assert q.submit([{"n": n}])
+    # worker 取走 0 之后内存队列有空位，但 2、3 还在磁盘上：4 不能插到它们前面
+    await asyncio.sleep(0)
+    assert q.stats()["depth"] == 1
+    assert q.submit([{"n": 4}])
+    gate.set()
+    for _ in range(100):
+        if len(seen) == 5:
+            break
+        await asyncio.sleep(0.01)
+    await q.stop()
+
+    assert seen == list(range(5))
+    assert q.stats()["spill_pending"] == 0
+
+
+@pytest.mark.asyncio
+async def test_unreadable_spill_files_are_quarantined(tmp_path):
+    seen = []
+
+    async def handler(events):
+        seen.append(events[0]["n"])
+
+    (tmp_path / "00000000000000000001-1-000001.json").write_text('{"events": [{"n": 0}]}')
+    (tmp_path / "00000000000000000002-1-000002.json").write_text("not json")
+    (tmp_path / "00000000000000000003-1-000003.json").write_text('{"t": 1, "events": [{"n": 1}]}')
+
+    q = WorkQueue(handler, maxsize=10, workers=1, spill_dir=str(tmp_path))
+    await q.start()
+    await q.stop()
+
+    assert seen == [1]
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        "00000000000000000001-1-000001.bad",
+        "00000000000000000002-1-000002.bad",
+    ]
+    assert q.submit([{"n": 2}])
+    assert q.stats()["spill_pending"] == 0
+
+
+def spill_file(dir, seq, n):
+    path = dir / f"{seq:020d}-1-{seq:06d}.json"
+    path.write_text(json.dumps({"t": 1, "events": [{"n": n}]}))
+    return path
+
+
+@pytest.mark.asyncio
+async def test_spill_files_claimed_by_another_process_are_skipped(tmp_path, monkeypatch):
+    seen = []
+
+    async def handler(events):
+        seen.append(events[0]["n"])
+
+    taken = spill_file(tmp_path, 1, 0)
+    spill_file(tmp_path, 2, 1)
+    real_replace = os.replace
+
+    def racing_replace(src, dst):
+        # 另一个进程在 glob 和认领之间抢先认领了第一个文件
+        if Path(src) == taken and taken.exists():
+            real_replace(taken, taken.with_name(taken.name + ".claimed-999999"))
+        return real_replace(src, dst)
+
+    monkeypatch.setattr(work_queue.os, "replace", racing_replace)
+    q = WorkQueue(handler, maxsize=10, workers=1, spill_dir=str(tmp_path))
+    await q.start()
+    await q.stop()
+
+    assert seen == [1]
+    assert [p.name for p in tmp_path.iterdir()] == [taken.name + ".claimed-999999"]
+
+
+@pytest.mark.asyncio
+async def test_queues_sharing_a_spill_dir_process_each_batch_once(tmp_path):
+    seen = []
+
+    async def handler(events):
+        seen.append(events[0]["n"])
+
+    for n in range(6):
+        spill_file(tmp_path, n + 1, n)
+    queues = [WorkQueue(handler, maxsize=3, workers=1, spill_dir=str(tmp_path)) for _ in range(2)]
+    for q in queues:
+        await q.start()
+    for _ in range(100):
+        if len(seen) == 6:
+            break
+        await asyncio.sleep(0.01)
+    for q in queues:
+        await q.stop()
+
+    assert sorted(seen) == list(range(6))
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.mark.asyncio
+async def test_claims_left_by_a_dead_process_are_requeued(tmp_path):
+    seen = []
+
+    async def handler(events):
+        seen.append(events[0]["n"])
+
+    dead = subprocess.Popen([sys.executable, "-c", "pass"])
+    dead.wait()
+    path = spill_file(tmp_path, 1, 7)
+    path.rename(path.with_name(f"{path.name}.claimed-{dead.pid}"))
+
+    q = WorkQueue(handler, maxsize=10, workers=1, spill_dir=str(tmp_path))
+    await q.start()
+    await q.stop()
+
+    assert seen == [7]
+    assert list(tmp_path.iterdir()) == []